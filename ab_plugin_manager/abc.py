@@ -15,9 +15,17 @@
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from contextvars import ContextVar
-from typing import Iterable, Collection, Any, NamedTuple, Union, Optional, Hashable, Callable
+from typing import Iterable, Collection, Any, NamedTuple, Union, Optional, Hashable, Callable, Sequence, \
+    Mapping, Awaitable
 
-__all__ = ["OperationStep", "Plugin", "DependencyCycleException", "UnlistableOperationSetException", "PluginManager"]
+__all__ = [
+    "OperationStep",
+    "Plugin",
+    "DependencyCycleException",
+    "UnlistableOperationSetException",
+    "PluginManager",
+    "OPERATION_STEPS_CACHE_KEY",
+]
 
 
 class OperationStep(NamedTuple):
@@ -112,6 +120,12 @@ class CurrentPluginManagerNotSetException(Exception):
         super().__init__("Активный PluginManager не установлен")
 
 
+OPERATION_STEPS_CACHE_KEY: Hashable = ('ab_plugin_manager', 'operation_steps')
+"""
+Ключ, под которым шаги операции кэшируются при помощи `PluginManager.operation_cache`.
+"""
+
+
 class PluginManager(ABC):
     """
     Менеджер плагинов. Предоставляет доступ ко всем загруженным на данный момент плагинам.
@@ -133,6 +147,46 @@ class PluginManager(ABC):
             DependencyCycleException - если у шагов операции присутствуют циклические зависимости
         """
 
+    def get_operation_sequences(self, op_names: Iterable[str]) -> Mapping[str, Iterable[OperationStep]]:
+        """
+        Возвращает последовательности шагов сразу для нескольких операций.
+
+        Реализация может построить все последовательности за один проход по плагинам, что быстрее, чем вызывать
+        `get_operation_sequence` для каждой операции по-отдельности.
+
+        Args:
+            op_names:
+                имена операций
+
+        Returns:
+            словарь, сопоставляющий каждому имени операции последовательность её шагов
+
+        Raises:
+            DependencyCycleException - если у шагов какой-либо из операций присутствуют циклические зависимости
+        """
+        return {op_name: self.get_operation_sequence(op_name) for op_name in op_names}
+
+    def get_operation_levels(self, op_name: str) -> Sequence[Sequence[OperationStep]]:
+        """
+        Возвращает шаги заданной операции, сгруппированные в уровни.
+
+        Шаги одного уровня не зависят друг от друга, а все их зависимости находятся на предыдущих уровнях, так что шаги
+        каждого уровня можно выполнять параллельно.
+
+        Реализация по-умолчанию помещает каждый шаг на отдельный уровень.
+
+        Args:
+            op_name:
+                имя операции
+
+        Returns:
+            последовательность уровней, каждый из которых - последовательность шагов
+
+        Raises:
+            DependencyCycleException - если у шагов операции присутствуют циклические зависимости
+        """
+        return tuple((step,) for step in self.get_operation_sequence(op_name))
+
     def operation_cache(self, _op_name: str, _key: Hashable, compute: Callable, /, *args, **kwargs) -> Any:
         """
         Вычисляет и (возможно) кэширует значение, связанное с заданной операцией.
@@ -156,6 +210,56 @@ class PluginManager(ABC):
         """
         return compute(*args, **kwargs)
 
+    async def aoperation_cache(
+            self,
+            _op_name: str,
+            _key: Hashable,
+            compute: Callable[..., Awaitable],
+            /,
+            *args,
+            **kwargs,
+    ) -> Any:
+        """
+        Асинхронный вариант `operation_cache`, вычисляющий значение при помощи асинхронной функции.
+
+        Значения, кэшированные этой функцией и `operation_cache`, общие и сбрасываются `drop_operation_cache`.
+
+        Реализация по-умолчанию не кэширует значения.
+
+        :param _op_name: Название операции
+        :param _key: Ключ для кэширования значения
+        :param compute: Асинхронная функция, вычисляющая значение, если оно не доступно в кэше
+        :param args: Аргументы для вызова функции `compute`
+        :param kwargs: Именованные аргументы для вызова функции `compute`
+        :return:
+        """
+        return await compute(*args, **kwargs)
+
+    def record_step_duration(self, op_name: str, step_name: str, seconds: float):
+        """
+        Запоминает время выполнения шага операции.
+
+        Сохранённое время используется для планирования выполнения шагов (см. `get_step_durations`).
+
+        Реализация по-умолчанию ничего не запоминает.
+
+        :param op_name: Название операции
+        :param step_name: Имя шага
+        :param seconds: Время выполнения шага в секундах
+        """
+
+    def get_step_durations(self, op_name: str) -> Mapping[str, float]:
+        """
+        Возвращает ожидаемое время выполнения шагов операции, вычисленное по ранее записанным значениям
+        (см. `record_step_duration`).
+
+        Реализация по-умолчанию возвращает пустой словарь.
+
+        :param op_name: Название операции
+        :return: Время выполнения в секундах по именам шагов. Шаги, время выполнения которых неизвестно, отсутствуют
+        """
+        return {}
+
     def drop_operation_cache(
             self,
             *,
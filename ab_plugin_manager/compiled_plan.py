@@ -0,0 +1,203 @@
+"""
+Скомпилированные планы операций.
+
+Скомпилированный план содержит заранее проверенные функции шагов операции, для каждой из которых уже известно, является
+ли она асинхронной. Это избавляет функции выполнения операций (см. `run_operation`) от повторения этих проверок при
+каждом выполнении операции.
+"""
+
+import asyncio
+from collections.abc import Sequence
+from functools import partial
+from typing import Any, Awaitable, Callable, Iterable, Iterator, NamedTuple, Optional, overload
+
+from ab_plugin_manager.abc import OperationStep
+from ab_plugin_manager.step_metadata import get_step_priority, is_cpu_bound_step
+
+__all__ = ["CompiledStep", "CompiledPlan", "compile_steps"]
+
+
+def _return_prev(prev: Any, *_args, **_kwargs) -> Any:
+    return prev
+
+
+async def _areturn_prev(prev: Any, *_args, **_kwargs) -> Any:
+    return prev
+
+
+class CompiledStep(NamedTuple):
+    """
+    Проверенная функция шага операции.
+    """
+    call: Callable
+    is_async: bool
+    step: OperationStep
+    priority: int = 0
+    cpu_bound: bool = False
+    """
+    Шаг является синхронной функцией, которую следует выполнять в пуле процессов (см. `cpu_bound`).
+    """
+
+
+class CompiledPlan(Sequence[OperationStep]):
+    """
+    Последовательность шагов операции, все шаги которой являются функциями.
+
+    Является последовательностью исходных шагов, так что может использоваться везде, где ожидаются шаги операции.
+    """
+    __slots__ = (
+        'steps', 'calls', 'functions', 'has_async', 'all_async', 'has_cpu_bound', '_dependencies', '_wrapper_chain',
+        '_async_wrapper_chain',
+    )
+
+    steps: tuple[OperationStep, ...]
+    calls: tuple[CompiledStep, ...]
+    functions: tuple[Callable, ...]
+    """
+    Функции шагов в порядке выполнения.
+    """
+    has_async: bool
+    all_async: bool
+    has_cpu_bound: bool
+
+    def __init__(self, steps: Iterable[OperationStep]):
+        """
+        :param steps: Шаги операции в порядке выполнения
+
+        Raises:
+            TypeError - если какой-то из шагов не является функцией
+        """
+        calls: list[CompiledStep] = []
+
+        for step in steps:
+            if not callable(step.step):
+                raise TypeError(f"Шаг {step} не является функцией")
+
+            is_async = asyncio.iscoroutinefunction(step.step)
+
+            calls.append(CompiledStep(
+                step.step,
+                is_async,
+                step,
+                get_step_priority(step),
+                not is_async and is_cpu_bound_step(step),
+            ))
+
+        self.calls = tuple(calls)
+        self.steps = tuple(call.step for call in calls)
+        self.functions = tuple(call.call for call in calls)
+        self.has_async = any(call.is_async for call in calls)
+        self.all_async = all(call.is_async for call in calls)
+        self.has_cpu_bound = any(call.cpu_bound for call in calls)
+        self._dependencies: Optional[dict[str, frozenset[str]]] = None
+        self._wrapper_chain: Optional[Callable] = None
+        self._async_wrapper_chain: Optional[Callable[..., Awaitable]] = None
+
+    @property
+    def dependencies(self) -> dict[str, frozenset[str]]:
+        """
+        Имена шагов плана, от которых непосредственно зависит каждый шаг, с учётом обратных зависимостей.
+
+        Вычисляется при первом обращении.
+        """
+        dependencies = self._dependencies
+
+        if dependencies is None:
+            collected: dict[str, set[str]] = {step.name: set(step.dependencies) for step in self.steps}
+
+            for step in self.steps:
+                for r_dep in step.reverse_dependencies:
+                    if r_dep in collected:
+                        collected[r_dep].add(step.name)
+
+            self._dependencies = dependencies = {
+                name: frozenset(dep for dep in deps if dep in collected) for name, deps in collected.items()
+            }
+
+        return dependencies
+
+    @property
+    def wrapper_chain(self) -> Callable:
+        """
+        Функция, выполняющая шаги плана как цепочку обёрток (см. `call_all_as_wrappers`).
+
+        Принимает начальное значение и аргументы операции.
+        Продолжение каждого шага (``nxt``) - это заранее созданный ``partial`` следующего шага с его продолжением, так
+        что цепочка создаётся один раз (при первом обращении) и переиспользуется всеми выполнениями операции.
+        """
+        chain = self._wrapper_chain
+
+        if chain is None:
+            chain = _return_prev
+
+            for fn in reversed(self.functions):
+                chain = partial(fn, chain)
+
+            self._wrapper_chain = chain
+
+        return chain
+
+    @property
+    def async_wrapper_chain(self) -> Callable[..., Awaitable]:
+        """
+        Асинхронный вариант `wrapper_chain` (см. `call_all_as_wrappers_async`).
+
+        Raises:
+            TypeError - если какой-то из шагов не является асинхронной функцией
+        """
+        chain = self._async_wrapper_chain
+
+        if chain is None:
+            for call in self.calls:
+                if not call.is_async:
+                    raise TypeError(f"Шаг {call.step} не является асинхронной функцией")
+
+            chain = _areturn_prev
+
+            for fn in reversed(self.functions):
+                chain = partial(fn, chain)
+
+            self._async_wrapper_chain = chain
+
+        return chain
+
+    def __iter__(self) -> Iterator[OperationStep]:
+        return iter(self.steps)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    @overload
+    def __getitem__(self, index: int) -> OperationStep: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[OperationStep]: ...
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+    def __repr__(self):
+        return f'<CompiledPlan: {", ".join(map(str, self.steps))}>'
+
+
+def compile_steps(steps: Iterable[OperationStep]) -> CompiledPlan:
+    """
+    Возвращает скомпилированный план для заданных шагов операции.
+
+    Планы операций, возвращаемые `PluginManagerImpl` (`OperationPlan`), компилируются один раз, при первом выполнении, и
+    хранят скомпилированный план в атрибуте ``compiled``. Остальные последовательности шагов компилируются при каждом
+    вызове.
+
+    Raises:
+        TypeError - если какой-то из шагов не является функцией
+    """
+    if isinstance(steps, CompiledPlan):
+        return steps
+
+    # OperationPlan не импортируется напрямую, т.к. сам зависит от этого модуля
+    compiled = getattr(steps, 'compiled', None)
+
+    if isinstance(compiled, CompiledPlan):
+        return compiled
+
+    return CompiledPlan(steps)
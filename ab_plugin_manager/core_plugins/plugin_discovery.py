@@ -70,7 +70,7 @@ class PluginDiscoveryPlugin(MagicPlugin):
         yield from super().get_operation_steps(op_name)
 
     def list_implemented_operations(self) -> Iterable[str]:
-        ops = set()
+        ops = set(super().list_implemented_operations())
 
         for plugin in self._plugins:
             # Может выбросить UnlistableOperationSetException.
@@ -85,10 +85,9 @@ class PluginDiscoveryPlugin(MagicPlugin):
         sys.path.extend(substitute_patterns(self.config['appendPythonPath']))
 
         # TODO: Use operations API
-        plugin_discover_op = list(
-            PluginManager.current().get_operation_sequence('discover_plugins_at_path'))
-        plugin_discovered_op = list(
-            PluginManager.current().get_operation_sequence('plugin_discovered'))
+        sequences = PluginManager.current().get_operation_sequences(('discover_plugins_at_path', 'plugin_discovered'))
+        plugin_discover_op = list(sequences['discover_plugins_at_path'])
+        plugin_discovered_op = list(sequences['plugin_discovered'])
 
         for plugin_path in match_files(self.config['pluginPaths']):
             try:
@@ -8,7 +8,8 @@ from typing import Collection, Optional, Awaitable
 from ab_plugin_manager.abc import Plugin
 from ab_plugin_manager.operations import bootstrap, setup_cli_arguments, receive_cli_arguments
 from ab_plugin_manager.plugin_manager import PluginManagerImpl
-from ab_plugin_manager.run_operation import call_all_parallel_async
+from ab_plugin_manager.process_executor import LazyProcessPoolExecutor, use_process_executor
+from ab_plugin_manager.run_operation import call_all_scheduled_async, SchedulerPolicy, StepFuture, gather_steps
 
 __all__ = ["launch_application"]
 
@@ -107,10 +108,40 @@ async def _run_with_interrupts(future: Awaitable):
         interrupt_task.cancel()
 
 
+async def _start_operation(
+        pm: PluginManagerImpl,
+        op_name: str,
+        scheduler_policy: Optional[SchedulerPolicy],
+) -> Collection[StepFuture]:
+    """
+    Запускает шаги операции приложения (``init``, ``run`` или ``terminate``).
+
+    Если политика не задана, то шаги запускаются без ограничений, при этом цепочки синхронных шагов так же выполняются
+    в executor'е одним заданием (см. `call_all_scheduled_async`).
+    """
+    steps = pm.get_operation_sequence(op_name)
+    policy = (scheduler_policy or SchedulerPolicy()).with_recorded_durations(pm, op_name)
+
+    if op_name == 'terminate':
+        # Ошибка в одном из шагов завершения не должна мешать выполнению остальных
+        policy = policy._replace(fail_fast=None)
+
+    return await call_all_scheduled_async(steps, policy)
+
+
+def _save_plan_cache(pm: PluginManagerImpl):
+    try:
+        pm.save_plan_cache()
+    except OSError as e:
+        _logger.warning("Не удалось сохранить файл кэша планов: %s", e)
+
+
 def launch_application(
         core_plugins: Collection[Plugin],
         *,
-        canonical_launch_command=None
+        canonical_launch_command=None,
+        plan_cache_file=None,
+        scheduler_policy: Optional[SchedulerPolicy] = None,
 ):
     """
     Запускает приложение с заданным набором плагинов ядра.
@@ -129,10 +160,21 @@ def launch_application(
             коллекция плагинов ядра
         canonical_launch_command:
             имя команды, используемой для запуска приложения (используется для вывода справки)
+        plan_cache_file:
+            путь к файлу, в котором сохраняется порядок шагов операций между запусками приложения.
+            Ускоряет запуск приложения с большим количеством плагинов
+        scheduler_policy:
+            ограничения на одновременное выполнение шагов операций ``init``, ``run`` и ``terminate``.
+            По-умолчанию все готовые к выполнению шаги запускаются сразу.
+            Режим ``fail_fast`` политики применяется к операциям ``init`` и ``run``, при этом ошибки шагов выбрасываются
+            в виде ``ExceptionGroup``.
+            Время выполнения шагов этих операций записывается менеджером плагинов (и сохраняется в файле кэша планов,
+            если он задан), и при заданных ограничениях первыми запускаются шаги, лежащие на самом длинном оставшемся
+            пути графа зависимостей
     """
-    pm = PluginManagerImpl(core_plugins)
+    pm = PluginManagerImpl(core_plugins, plan_cache_file=plan_cache_file)
 
-    asyncio_debug, executor_max_workers = False, None
+    asyncio_debug, asyncio_eager_tasks, executor_max_workers, process_max_workers = False, False, None, None
 
     def parse_args(strict: bool):
         ap = ArgumentParser(add_help=strict, prog=canonical_launch_command)
@@ -143,6 +185,12 @@ def launch_application(
             dest='asyncio_debug',
             help="Включить отладку asyncio",
         )
+        ap.add_argument(
+            '--asyncio-eager-tasks',
+            action='store_true',
+            dest='asyncio_eager_tasks',
+            help="Начинать выполнение асинхронных шагов сразу при их готовности (см. asyncio.eager_task_factory)",
+        )
         ap.add_argument(
             '--executor-max-workers', '-w',
             dest='executor_max_workers',
@@ -152,6 +200,15 @@ def launch_application(
             required=False,
             type=int,
         )
+        ap.add_argument(
+            '--process-max-workers',
+            dest='process_max_workers',
+            metavar='<N>',
+            help="Максимальное кол-во процессов в пуле процессов для ресурсоёмких шагов.",
+            default=None,
+            required=False,
+            type=int,
+        )
 
         setup_cli_arguments(ap)
 
@@ -162,32 +219,53 @@ def launch_application(
 
         receive_cli_arguments(args)
 
-        nonlocal asyncio_debug, executor_max_workers
+        nonlocal asyncio_debug, asyncio_eager_tasks, executor_max_workers, process_max_workers
         asyncio_debug = args.asyncio_debug
+        asyncio_eager_tasks = args.asyncio_eager_tasks
         executor_max_workers = args.executor_max_workers
+        process_max_workers = args.process_max_workers
 
-    async def run_async_operations() -> None:
+    def start_operation(op_name: str) -> Awaitable[Collection[StepFuture]]:
+        return _start_operation(pm, op_name, scheduler_policy)
+
+    def wait_operation(futures: Collection[StepFuture]) -> Awaitable:
+        if scheduler_policy is not None and scheduler_policy.fail_fast is not None:
+            return asyncio.ensure_future(gather_steps(futures))
+
+        return asyncio.gather(*futures)
+
+    async def run_async_operations(process_executor: LazyProcessPoolExecutor) -> None:
         executor = ThreadPoolExecutor(
             max_workers=executor_max_workers,
         )
-        asyncio.get_running_loop().set_default_executor(executor)
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(executor)
+
+        if asyncio_eager_tasks:
+            loop.set_task_factory(asyncio.eager_task_factory)
 
-        run_tasks: Optional[Collection[asyncio.Task]] = None
+        run_tasks: Optional[Collection[StepFuture]] = None
 
         try:
-            init_tasks = await call_all_parallel_async(pm.get_operation_sequence('init'))
+            # Планируем все асинхронные операции за один проход по плагинам, далее планы берутся из кэша
+            pm.get_operation_sequences(('init', 'run', 'terminate'))
+
+            init_tasks = await start_operation('init')
 
             try:
-                await _run_with_interrupts(asyncio.gather(*init_tasks))
+                await _run_with_interrupts(wait_operation(init_tasks))
             except InterruptedError:
                 _logger.info("Получен сигнал прерывания в процессе инициализации.")
                 return
 
             _logger.info("Инициализация завершена.")
 
-            run_tasks = await call_all_parallel_async(pm.get_operation_sequence('run'))
+            # Большая часть планов строится во время запуска, сохраняем их не дожидаясь завершения работы
+            _save_plan_cache(pm)
+
+            run_tasks = await start_operation('run')
             try:
-                await _run_with_interrupts(asyncio.gather(*run_tasks))
+                await _run_with_interrupts(wait_operation(run_tasks))
             except InterruptedError:
                 _logger.info("Получен сигнал прерывания.")
                 return
@@ -197,7 +275,7 @@ def launch_application(
         finally:
             _logger.debug("Начинаю выполнение операции terminate...")
 
-            terminate_tasks = await call_all_parallel_async(pm.get_operation_sequence('terminate'))
+            terminate_tasks = await start_operation('terminate')
             try:
                 await _run_with_interrupts(asyncio.gather(*terminate_tasks))
             except InterruptedError:
@@ -220,9 +298,24 @@ def launch_application(
                 else:
                     _logger.debug("Все задачи выполнены, завершаюсь штатно.")
 
+            if process_executor.started:
+                _logger.debug("Завершаю работу пула процессов...")
+                await asyncio.to_thread(process_executor.shutdown)
+
     with pm.as_current():
+        pm.get_operation_sequences(('setup_cli_arguments', 'receive_cli_arguments', 'bootstrap', 'config'))
+
         parse_args(False)
         bootstrap()
         parse_args(True)
 
-        asyncio.run(run_async_operations(), debug=asyncio_debug)
+        # Процессы для ресурсоёмких шагов (см. `cpu_bound`) запускаются только если такие шаги будут выполнены
+        process_executor = LazyProcessPoolExecutor(max_workers=process_max_workers)
+
+        try:
+            with use_process_executor(process_executor):
+                asyncio.run(run_async_operations(process_executor), debug=asyncio_debug)
+        finally:
+            # Если операция terminate была прервана, то пул процессов ещё работает
+            process_executor.shutdown(wait=False, cancel_futures=True)
+            _save_plan_cache(pm)
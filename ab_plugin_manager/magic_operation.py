@@ -1,13 +1,49 @@
 import asyncio
+import copy
 from abc import ABC
-from asyncio import Task, to_thread
+from asyncio import to_thread
 from functools import wraps, partial
-from typing import Callable, Iterable, Union, Awaitable, Collection, Optional, NamedTuple, Self, Type
+from contextlib import aclosing
+from typing import Callable, Iterable, Union, Awaitable, Collection, Optional, NamedTuple, Self, Type, Sequence, Any, \
+    AsyncIterator, AsyncIterable
 
-from ab_plugin_manager.abc import PluginManager, OperationStep
+from ab_plugin_manager.abc import PluginManager, OperationStep, OPERATION_STEPS_CACHE_KEY
+from ab_plugin_manager.compiled_plan import CompiledPlan, compile_steps
 from ab_plugin_manager.magic_plugin import operation as operation_decorator
+from ab_plugin_manager.operation_plan import OperationPlan
 from ab_plugin_manager.run_operation import call_all_as_wrappers, call_all, call_all_parallel_async, \
-    call_all_as_wrappers_async
+    call_all_as_wrappers_async, call_all_scheduled_async, SchedulerPolicy, call_all_async, StepFuture, gather_steps, \
+    call_until_first_result, call_until_first_result_async, call_until_fastest_result_async, call_all_collect, \
+    call_all_as_completed_async, call_all_as_pipeline_async, call_all_as_concurrent_pipeline_async
+
+
+class _OperationBinding:
+    """
+    Привязка операции к менеджеру плагинов, хранящая актуальный план операции.
+    """
+    __slots__ = ('manager', 'operation', '_plan')
+
+    def __init__(self, manager: PluginManager, operation: str):
+        self.manager = manager
+        self.operation = operation
+        self._plan: Optional[OperationPlan] = None
+
+    def get_steps(self) -> Iterable[OperationStep]:
+        plan = self._plan
+
+        if plan is None or plan.stale:
+            steps = self.manager.get_operation_sequence(self.operation)
+
+            if not isinstance(steps, OperationPlan):
+                # Менеджер не сообщает об изменении планов, так что шаги нельзя запомнить
+                return steps
+
+            self._plan = plan = steps
+
+        return plan
+
+    def get_compiled_steps(self) -> CompiledPlan:
+        return compile_steps(self.get_steps())
 
 
 def _is_method(fn) -> bool:
@@ -48,10 +84,11 @@ class MagicOperation[TImpl: Callable]:
     >>> def my_op(...):
     >>>     ...
     """
-    __slots__ = ("operation", "cache_steps")
+    __slots__ = ("operation", "cache_steps", "_binding")
 
     operation: str
     cache_steps: bool
+    _binding: Optional[_OperationBinding]
 
     def __init__(self, operation: str, *, cache_steps: bool = True):
         """
@@ -62,6 +99,45 @@ class MagicOperation[TImpl: Callable]:
         """
         self.operation = operation
         self.cache_steps = cache_steps
+        self._binding = None
+
+    def bind(self, manager: PluginManager) -> Self:
+        """
+        Создаёт копию операции, привязанную к заданному менеджеру плагинов.
+
+        Привязанная операция получает шаги напрямую из заданного менеджера, без обращения к текущему менеджеру и кэшу
+        операций, и запоминает план операции до тех пор, пока менеджер не заменит его (например, при добавлении
+        плагинов).
+        Это позволяет сократить накладные расходы при многократном выполнении операции:
+
+        >>> op: CallAllOperation = ...
+        >>> bound_op = op.bound()
+        >>> for item in items:
+        >>>     bound_op(item)
+
+        План запоминается только если менеджер возвращает планы операций (`OperationPlan`), как это делает
+        `PluginManagerImpl`, иначе шаги запрашиваются у менеджера при каждом выполнении.
+        """
+        bound = copy.copy(self)
+        bound._binding = _OperationBinding(manager, self.operation)
+
+        return bound
+
+    def bound(self) -> Self:
+        """
+        Создаёт копию операции, привязанную к текущему менеджеру плагинов (см. `bind`).
+
+        Raises:
+            CurrentPluginManagerNotSetException - если текущий PluginManager не установлен
+        """
+        return self.bind(PluginManager.current())
+
+    @property
+    def bound_manager(self) -> Optional[PluginManager]:
+        """
+        Менеджер плагинов, к которому привязана операция, или ``None`` если операция не привязана.
+        """
+        return self._binding.manager if self._binding is not None else None
 
     def get_steps_no_cache(self) -> Iterable[OperationStep]:
         """
@@ -72,6 +148,9 @@ class MagicOperation[TImpl: Callable]:
         Raises:
             CurrentPluginManagerNotSetException - если текущий PluginManager не установлен
         """
+        if self._binding is not None:
+            return self._binding.manager.get_operation_sequence(self.operation)
+
         return PluginManager.current().get_operation_sequence(self.operation)
 
     def get_steps(self) -> Iterable[OperationStep]:
@@ -83,20 +162,39 @@ class MagicOperation[TImpl: Callable]:
         Raises:
             CurrentPluginManagerNotSetException - если текущий PluginManager не установлен
         """
+        if self._binding is not None:
+            return self._binding.get_steps()
+
         if not self.cache_steps:
             return self.get_steps_no_cache()
 
         return PluginManager.current().operation_cache(
             self.operation,
-            _OPERATION_STEPS_CACHE_KEY,
-            lambda: list(self.get_steps_no_cache()),
+            OPERATION_STEPS_CACHE_KEY,
+            self._get_steps_for_cache,
         )
 
-    def implementation(self, fn: TImpl):
-        return operation_decorator(self.operation)(fn)
+    def _get_steps_for_cache(self) -> Sequence[OperationStep]:
+        steps = self.get_steps_no_cache()
+
+        # План неизменяем и хранит скомпилированную версию, так что кэшируется как есть
+        return steps if isinstance(steps, OperationPlan) else list(steps)
+
+    def get_compiled_steps(self) -> CompiledPlan:
+        """
+        Получает скомпилированный план операции (см. `compile_steps`).
+
+        Raises:
+            CurrentPluginManagerNotSetException - если текущий PluginManager не установлен
+            TypeError - если какой-то из шагов операции не является функцией
+        """
+        if self._binding is not None:
+            return self._binding.get_compiled_steps()
 
+        return compile_steps(self.get_steps())
 
-_OPERATION_STEPS_CACHE_KEY = id(MagicOperation)
+    def implementation(self, fn: TImpl):
+        return operation_decorator(self.operation)(fn)
 
 
 class MagicOperationResultCheck[TResult](NamedTuple):
@@ -124,6 +222,13 @@ class MagicOperationWithResultProcessing[TResult, TImpl: Callable](MagicOperatio
         super().__init__(operation, **kwargs)
         self._checks = []
 
+    def bind(self, manager: PluginManager) -> Self:
+        bound = super().bind(manager)
+        # Проверки, добавленные к привязанной операции, не должны добавляться к исходной операции
+        bound._checks = list(self._checks)
+
+        return bound
+
     def _process_result(self, res: TResult) -> TResult:
         for check in self._checks:
             if not check.check(res):
@@ -156,10 +261,223 @@ class CallAllOperation[*TARgs](MagicOperation[Callable[[*TARgs], None]]):
     """
 
     def invoke(self, *args: *TARgs, **kwargs) -> None:
-        call_all(self.get_steps(), *args, **kwargs)
+        call_all(self.get_compiled_steps(), *args, **kwargs)
 
     async def ainvoke(self, *args: *TARgs, **kwargs) -> None:
-        await to_thread(self.invoke, *args, **kwargs)
+        """
+        Выполняет шаги операции в executor'е, не блокируя event loop.
+
+        Шаги, требующие значительных вычислительных ресурсов (см. `cpu_bound`), выполняются в пуле процессов.
+        """
+        await call_all_async(self.get_compiled_steps(), *args, **kwargs)
+
+    __call__ = invoke
+
+
+class GatherOperation[*TArgs, TResult](
+    MagicOperation[Union[Callable[[*TArgs], TResult], Callable[[*TArgs], Awaitable[TResult]]]]
+):
+    """
+    Операция, собирающая результаты всех шагов.
+
+    `invoke` выполняет шаги по-очереди и возвращает список их результатов в порядке выполнения шагов.
+    `ainvoke` и `aiter_results` выполняют шаги параллельно (с учётом зависимостей, см. `call_all_parallel_async`), при
+    этом `aiter_results` возвращает результаты по мере завершения шагов, а `ainvoke` - список результатов в порядке их
+    получения.
+
+    Если задана функция свёртки (``reducer``), то `invoke` и `ainvoke` вместо списка возвращают результат свёртки
+    результатов шагов, начиная с начального значения (``initial``), в том же порядке, как это делает
+    ``functools.reduce``.
+    Т.к. `ainvoke` получает результаты в порядке завершения шагов, функция свёртки должна быть коммутативной.
+
+    >>> collect_items = GatherOperation[str, list[Item]]("collect_items", reducer=operator.add, initial=[])
+    >>>
+    >>> async def handle(query: str):
+    >>>     async for items in collect_items.aiter_results(query):
+    >>>         yield items
+    """
+
+    __slots__ = ("reducer", "initial")
+
+    reducer: Optional[Callable[[Any, TResult], Any]]
+    initial: Any
+
+    def __init__(
+            self,
+            operation: str,
+            *,
+            reducer: Optional[Callable[[Any, TResult], Any]] = None,
+            initial: Any = None,
+            **kwargs,
+    ):
+        """
+        :param operation: Имя операции
+        :param reducer: Функция свёртки, принимающая текущее значение и результат шага и возвращающая новое значение
+        :param initial: Начальное значение для функции свёртки
+        """
+        super().__init__(operation, **kwargs)
+        self.reducer = reducer
+        self.initial = initial
+
+    def _reduce(self, results: Iterable[TResult]) -> Any:
+        if self.reducer is None:
+            return list(results)
+
+        value = self.initial
+
+        for result in results:
+            value = self.reducer(value, result)
+
+        return value
+
+    def invoke(self, *args: *TArgs, **kwargs) -> Any:
+        return self._reduce(call_all_collect(self.get_compiled_steps(), *args, **kwargs))
+
+    async def aiter_results(self, *args: *TArgs, **kwargs) -> AsyncIterator[TResult]:
+        """
+        Выполняет шаги параллельно и возвращает их результаты по мере завершения шагов.
+
+        Если какой-то из шагов завершился с ошибкой, то она выбрасывается, когда до неё доходит очередь, а остальные
+        шаги отменяются. Шаги, зависящие от него, не выполняются.
+        Незавершённые шаги так же отменяются, если итерация прекращается досрочно.
+        """
+        async with aclosing(call_all_as_completed_async(self.get_compiled_steps(), *args, **kwargs)) as completed:
+            async for future in completed:
+                if not future.cancelled():
+                    yield future.result()
+
+    async def ainvoke(self, *args: *TArgs, **kwargs) -> Any:
+        results = []
+
+        async with aclosing(self.aiter_results(*args, **kwargs)) as it:
+            async for result in it:
+                results.append(result)
+
+        return self._reduce(results)
+
+    __call__ = invoke
+
+
+class PipelineOperation[*TArgs, TIn, TOut](
+    MagicOperation[Callable[[AsyncIterator[Any], *TArgs], AsyncIterator[Any]]]
+):
+    """
+    Операция, шаги которой образуют конвейер обработки потока элементов (см. `call_all_as_pipeline_async`).
+
+    Каждый шаг - асинхронный генератор, принимающий элементы от предыдущего шага (или от источника) и возвращающий
+    обработанные элементы:
+
+    >>> normalize = PipelineOperation[Record, Record]("normalize")
+    >>>
+    >>> class Plugin1(MagicPlugin):
+    >>>     @normalize.implementation
+    >>>     async def strip_names(self, records):
+    >>>         async for record in records:
+    >>>             yield record._replace(name=record.name.strip())
+    >>>
+    >>> async def ingest(source):
+    >>>     async for record in normalize.ainvoke(source):
+    >>>         await store(record)
+
+    Шаги получаются один раз для всего потока элементов.
+    Если задан размер очереди (``queue_size``), то шаги выполняются одновременно, передавая элементы через очереди
+    ограниченного размера (см. `call_all_as_concurrent_pipeline_async`), иначе - по-очереди, по одному элементу.
+    """
+
+    __slots__ = ("queue_size",)
+
+    queue_size: Optional[int]
+
+    def __init__(self, operation: str, *, queue_size: Optional[int] = None, **kwargs):
+        """
+        :param operation: Имя операции
+        :param queue_size: Максимальное количество элементов в очереди между шагами, выполняющимися одновременно.
+                    По-умолчанию шаги не выполняются одновременно
+        """
+        if queue_size is not None and queue_size < 1:
+            raise ValueError(f"Некорректный размер очереди: {queue_size}")
+
+        super().__init__(operation, **kwargs)
+        self.queue_size = queue_size
+
+    def ainvoke(
+            self,
+            source: Union[Iterable[TIn], AsyncIterable[TIn]],
+            /,
+            *args: *TArgs,
+            **kwargs,
+    ) -> AsyncIterator[TOut]:
+        """
+        Возвращает асинхронный итератор элементов, полученных пропусканием элементов источника через все шаги операции.
+
+        Итератор стоит закрывать явно (например, при помощи ``contextlib.aclosing``), если он не дочитывается до
+        конца.
+        """
+        if self.queue_size is None:
+            return call_all_as_pipeline_async(self.get_compiled_steps(), source, *args, **kwargs)
+
+        return call_all_as_concurrent_pipeline_async(
+            self.get_compiled_steps(), source, self.queue_size, *args, **kwargs,
+        )
+
+    __call__ = ainvoke
+
+    async def arun(self, source: Union[Iterable[TIn], AsyncIterable[TIn]], /, *args: *TArgs, **kwargs) -> None:
+        """
+        Пропускает все элементы источника через шаги операции, игнорируя элементы, полученные от последнего шага.
+        """
+        async with aclosing(self.ainvoke(source, *args, **kwargs)) as items:
+            async for _ in items:
+                pass
+
+
+class FirstResultOperation[*TArgs, TResult](
+    MagicOperationWithResultProcessing[
+        Optional[TResult],
+        Union[Callable[[*TArgs], Optional[TResult]], Callable[[*TArgs], Awaitable[Optional[TResult]]]],
+    ]
+):
+    """
+    Операция, возвращающая результат первого шага, вернувшего не None (см. `call_until_first_result`).
+
+    `invoke` выполняет шаги по-очереди. `ainvoke` запускает все шаги одновременно и возвращает:
+
+    - результат первого в порядке выполнения шага, вернувшего не None (см. `call_until_first_result_async`), т.е. тот
+      же результат, что и `invoke`;
+    - или, если операция создана с ``racing=True``, первый полученный результат (см.
+      `call_until_fastest_result_async`).
+
+    Т.к. `ainvoke` может выполнять шаги, результат которых не будет использован, асинхронно стоит выполнять только
+    операции, шаги которых не имеют побочных эффектов.
+
+    >>> resolve = FirstResultOperation[str, Path]("resolve", racing=True)
+    >>>
+    >>> async def foo(name: str):
+    >>>     return await resolve.ainvoke(name)
+    """
+
+    __slots__ = ("racing",)
+
+    racing: bool
+
+    def __init__(self, operation: str, *, racing: bool = False, **kwargs):
+        """
+        :param operation: Имя операции
+        :param racing: Возвращать из `ainvoke` первый полученный результат, а не результат первого шага
+        """
+        super().__init__(operation, **kwargs)
+        self.racing = racing
+
+    def invoke(self, *args: *TArgs, **kwargs) -> Optional[TResult]:
+        return self._process_result(call_until_first_result(self.get_compiled_steps(), *args, **kwargs))
+
+    async def ainvoke(self, *args: *TArgs, **kwargs) -> Optional[TResult]:
+        if self.racing:
+            res = await call_until_fastest_result_async(self.get_compiled_steps(), *args, **kwargs)
+        else:
+            res = await call_until_first_result_async(self.get_compiled_steps(), *args, **kwargs)
+
+        return self._process_result(res)
 
     __call__ = invoke
 
@@ -209,7 +527,7 @@ class WrapperCallOperation[*TARgs, TResult](
     """
 
     def invoke_with_initial(self, initial: Optional[TResult], /, *args: *TARgs, **kwargs) -> TResult:
-        return self._process_result(call_all_as_wrappers(self.get_steps(), initial, *args, **kwargs))
+        return self._process_result(call_all_as_wrappers(self.get_compiled_steps(), initial, *args, **kwargs))
 
     def invoke(self, *args, **kwargs) -> TResult:
         return self.invoke_with_initial(None, *args, **kwargs)
@@ -277,7 +595,7 @@ class AsyncWrapperCallOperation[*TARgs, TResult](
     """
 
     async def ainvoke_with_initial(self, initial: Optional[TResult], /, *args, **kwargs):
-        res = await call_all_as_wrappers_async(self.get_steps(), initial, *args, **kwargs)
+        res = await call_all_as_wrappers_async(self.get_compiled_steps(), initial, *args, **kwargs)
         return self._process_result(res)
 
     async def ainvoke(self, *args, **kwargs):
@@ -307,23 +625,60 @@ class CallAllAsyncConcurrentOperation[*TArgs, TResult](
     """
     Операция, все шаги которой выполняются асинхронно (но с учётом зависимостей).
 
-    Оператор вызова и метод `ainvoke` возвращают список асинхронных `Task`'ов, не дожидаясь их завершения.
+    Оператор вызова и метод `ainvoke` возвращают список Future'ов шагов (`StepFuture`), не дожидаясь их завершения.
     Это позволяет более гибко обрабатывать ошибки, возникающие при выполнении операции и управлять завершением
     выполнения операции.
     В простых случаях, когда нужно просто выполнить все шаги операции, можно использовать метод `ainvoke_all`
     дожидающийся завершения всех шагов и не возвращающий ничего.
+
+    Если задана политика выполнения (`SchedulerPolicy`), то количество одновременно выполняющихся шагов ограничивается
+    в соответствии с ней, а шаги запускаются в порядке приоритета (см. `call_all_scheduled_async`).
+    Если в политике не задано время выполнения шагов, то используется время, записанное менеджером плагинов, а время
+    выполнения шагов записывается в менеджер плагинов (см. `SchedulerPolicy.with_recorded_durations`).
     """
 
-    async def ainvoke(self, *args: *TArgs, **kwargs) -> Collection[Task[TResult]]:
+    __slots__ = ("policy",)
+
+    policy: Optional[SchedulerPolicy]
+
+    def __init__(self, operation: str, *, policy: Optional[SchedulerPolicy] = None, **kwargs):
+        """
+        :param operation: Имя операции
+        :param policy: Ограничения на выполнение шагов операции
+        """
+        super().__init__(operation, **kwargs)
+        self.policy = policy
+
+    async def ainvoke(self, *args: *TArgs, **kwargs) -> Collection[StepFuture]:
         """
-        Запускает все шаги операции и возвращает созданные для них Task'и.
+        Запускает все шаги операции и возвращает Future'ы шагов.
         """
-        return await call_all_parallel_async(self.get_steps(), *args, **kwargs)
+        policy = self.policy
+
+        if policy is not None:
+            steps = self.get_compiled_steps()
+
+            if policy.step_durations is None and policy.on_step_finished is None:
+                manager = self.bound_manager or PluginManager.current()
+                policy = policy.with_recorded_durations(manager, self.operation)
+
+            return await call_all_scheduled_async(steps, policy, *args, **kwargs)
+
+        return await call_all_parallel_async(self.get_compiled_steps(), *args, **kwargs)
 
     __call__ = ainvoke
 
     async def ainvoke_all(self,  *args: *TArgs, **kwargs) -> None:
         """
         Запускает все шаги операции и дожидается их завершения.
+
+        Если в политике выполнения задан режим ``fail_fast`` (см. `SchedulerPolicy.fail_fast`), то дожидается завершения
+        всех шагов и выбрасывает ``ExceptionGroup`` с ошибками шагов (см. `gather_steps`), иначе - выбрасывает первую
+        ошибку, как ``asyncio.gather``.
         """
-        await asyncio.gather(self.ainvoke(*args, **kwargs))
+        futures = await self.ainvoke(*args, **kwargs)
+
+        if self.policy is not None and self.policy.fail_fast is not None:
+            await gather_steps(futures)
+        else:
+            await asyncio.gather(*futures)
@@ -4,8 +4,23 @@ from types import ModuleType
 from typing import Iterable, Collection, Callable
 
 from ab_plugin_manager.abc import Plugin, OperationStep
-
-__all__ = ["operation", "after", "before", "step_name", "MagicPlugin", "MagicModulePlugin"]
+from ab_plugin_manager.step_metadata import StepPriority, get_step_priority, CpuBound, is_cpu_bound_step, \
+    STEP_PRIORITY_ATTR, STEP_CPU_BOUND_ATTR
+
+__all__ = [
+    "operation",
+    "after",
+    "before",
+    "step_name",
+    "priority",
+    "StepPriority",
+    "get_step_priority",
+    "cpu_bound",
+    "CpuBound",
+    "is_cpu_bound_step",
+    "MagicPlugin",
+    "MagicModulePlugin",
+]
 
 _MAGIC_PLUGIN_OP_NAME = '__mp_op_name'
 _MAGIC_PLUGIN_DEPENDENCIES = '__mp_dependencies'
@@ -86,6 +101,45 @@ def step_name[T](name: str) -> Callable[[T], T]:
     return decorator
 
 
+def priority[T](value: int) -> Callable[[T], T]:
+    """
+    Устанавливает приоритет шага, созданного из аттрибута магического плагина.
+
+    Приоритет учитывается при выполнении операций с ограничением количества одновременно выполняющихся шагов (см.
+    `call_all_scheduled_async`): из готовых к выполнению шагов первыми запускаются шаги с большим приоритетом.
+    По-умолчанию приоритет шага равен 0.
+
+    Args:
+        value:
+            приоритет шага
+    """
+
+    def decorator(f):
+        setattr(f, STEP_PRIORITY_ATTR, value)
+        return f
+
+    return decorator
+
+
+def cpu_bound[T](f: T) -> T:
+    """
+    Помечает аттрибут магического плагина как шаг, требующий значительных вычислительных ресурсов.
+
+    При асинхронном выполнении операции (например, при помощи `call_all_parallel_async`) такие шаги выполняются в пуле
+    процессов (см. `ab_plugin_manager.process_executor`), если он доступен, а не в пуле потоков.
+    Поэтому сам шаг (для метода - вместе с плагином), его аргументы и результат должны поддерживать сериализацию при
+    помощи ``pickle``, а изменения, сделанные шагом в объектах, не будут видны в исходном процессе.
+    Шаг, который не удаётся сериализовать, выполняется в пуле потоков (с предупреждением в логе).
+
+    >>> class MyPlugin(MagicPlugin):
+    >>>     @cpu_bound
+    >>>     def build_index(self, *args, **kwargs):
+    >>>         ...
+    """
+    setattr(f, STEP_CPU_BOUND_ATTR, True)
+    return f
+
+
 _SPECIAL_ATTRS_RE = re.compile(
     f'^(?:{"|".join((*Plugin.__dict__.keys(), *Plugin.__annotations__.keys()))})$|^_'
 )
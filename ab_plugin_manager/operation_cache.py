@@ -0,0 +1,441 @@
+"""
+Кэш значений, связанных с операциями (см. `PluginManager.operation_cache`).
+
+Размер кэша может быть ограничен политикой вытеснения (`OperationCachePolicy`): количеством значений для каждой
+операции, общим размером всех значений и временем жизни значений.
+Вытесняются значения, к которым дольше всего не было обращений.
+"""
+
+import asyncio
+from collections import OrderedDict
+from collections.abc import Hashable
+from concurrent.futures import Future, CancelledError as FutureCancelledError
+from itertools import chain
+from threading import Lock, get_ident
+from time import monotonic
+from typing import NamedTuple, Optional, Callable, Any, Collection, Iterable, Awaitable
+
+from ab_plugin_manager.abc import OPERATION_STEPS_CACHE_KEY
+from ab_plugin_manager.stats import PluginManagerStats
+
+__all__ = ["OperationCachePolicy", "OperationCache"]
+
+
+def _unit_size(_value: Any) -> int:
+    return 1
+
+
+class OperationCachePolicy(NamedTuple):
+    """
+    Политика вытеснения значений из кэша операций.
+
+    По-умолчанию кэш не ограничен.
+    """
+    max_entries_per_operation: Optional[int] = None
+    """
+    Максимальное количество значений для одной операции.
+    """
+
+    max_total_size: Optional[int] = None
+    """
+    Максимальный суммарный размер всех значений кэша, вычисленный при помощи функции `size_of`.
+    """
+
+    size_of: Callable[[Any], int] = _unit_size
+    """
+    Функция, вычисляющая размер значения.
+    По-умолчанию размер каждого значения равен 1, т.е. `max_total_size` ограничивает общее количество значений.
+    """
+
+    ttl: Optional[float] = None
+    """
+    Время жизни значения в секундах.
+    """
+
+    pinned_keys: Collection[Hashable] = (OPERATION_STEPS_CACHE_KEY,)
+    """
+    Ключи значений, которые никогда не вытесняются и не учитываются в ограничениях размера.
+    Такие значения удаляются только при явном сбросе кэша.
+
+    По-умолчанию закреплены шаги операций, кэшируемые `MagicOperation`.
+    """
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires_at: Optional[float]
+
+
+class _Flight:
+    """
+    Выполняющееся вычисление значения кэша.
+    """
+    __slots__ = ('thread', 'task', 'future')
+
+    def __init__(self, thread: int, task: Optional[asyncio.Task]):
+        self.thread = thread
+        self.task = task
+        self.future: Future = Future()
+
+    def is_owned_by(self, thread: int, task: Optional[asyncio.Task]) -> bool:
+        if task is not None and self.task is not None:
+            return self.task is task
+
+        # Синхронное вычисление или синхронный вызов в потоке, выполняющем асинхронное вычисление.
+        # Ожидание в том же потоке привело бы к взаимной блокировке.
+        return self.thread == thread
+
+
+_MISSING = object()
+
+
+class OperationCache:
+    """
+    Кэш значений, связанных с операциями, с ограниченным размером.
+
+    Может использоваться из нескольких потоков и асинхронных задач одновременно.
+    Для каждой пары (операция, ключ) одновременно выполняется не более одного вычисления значения, остальные вызовы
+    дожидаются его результата. Если вычисление завершилось ошибкой, то все ожидавшие его вызовы получают ту же ошибку, а
+    значение не кэшируется.
+    """
+    __slots__ = (
+        '_policy', '_clock', '_stats', '_lock', '_pinned', '_entries', '_by_operation', '_total_size', '_in_flight',
+    )
+
+    def __init__(
+            self,
+            policy: OperationCachePolicy = OperationCachePolicy(),
+            *,
+            clock: Callable[[], float] = monotonic,
+            stats: Optional[PluginManagerStats] = None,
+    ):
+        """
+        :param policy: Политика вытеснения значений
+        :param clock: Источник времени для вычисления времени жизни значений
+        :param stats: Объект для сбора статистики обращений к кэшу, если статистику нужно собирать
+        """
+        self._policy = policy
+        self._clock = clock
+        self._stats = stats
+        self._lock = Lock()
+        self._pinned: dict[tuple[str, Hashable], Any] = {}
+        # Все вытесняемые значения, в порядке от давно использовавшихся к недавно использовавшимся
+        self._entries: OrderedDict[tuple[str, Hashable], _Entry] = OrderedDict()
+        # Ключи вытесняемых значений каждой операции, в том же порядке
+        self._by_operation: dict[str, OrderedDict[Hashable, None]] = {}
+        self._total_size = 0
+        self._in_flight: dict[tuple[str, Hashable], _Flight] = {}
+
+    @property
+    def policy(self) -> OperationCachePolicy:
+        return self._policy
+
+    @property
+    def total_size(self) -> int:
+        """
+        Суммарный размер вытесняемых значений кэша.
+        """
+        return self._total_size
+
+    def __len__(self):
+        return len(self._pinned) + len(self._entries)
+
+    def operations(self) -> set[str]:
+        """
+        Возвращает имена операций, для которых в кэше есть значения или выполняются вычисления.
+        """
+        with self._lock:
+            return {
+                op_name for op_name, _key in chain(self._pinned, self._in_flight)
+            }.union(self._by_operation)
+
+    def get_or_compute(self, op_name: str, key: Hashable, compute: Callable, args: tuple, kwargs: dict) -> Any:
+        """
+        Возвращает значение из кэша или вычисляет и сохраняет его, если его там нет.
+
+        Если то же значение уже вычисляется в другом потоке, то дожидается результата этого вычисления.
+        """
+        full_key = (op_name, key)
+
+        # Чтение из словаря атомарно, так что закреплённые значения можно получать без блокировки
+        value = self._pinned.get(full_key, _MISSING)
+
+        if value is not _MISSING:
+            if self._stats is not None:
+                self._stats.record_cache_hit(op_name)
+
+            return value
+
+        thread = get_ident()
+
+        while True:
+            value, flight, waiting = self._begin(full_key, thread, None)
+
+            if value is not _MISSING:
+                return value
+
+            if not waiting:
+                break
+
+            try:
+                return flight.future.result()
+            except FutureCancelledError:
+                # Вычислявшая значение асинхронная задача была отменена - пробуем снова
+                continue
+
+        try:
+            value = compute(*args, **kwargs)
+        except BaseException as e:
+            self._fail(full_key, flight, e)
+            raise
+
+        return self._complete(full_key, flight, value)
+
+    async def aget_or_compute(
+            self,
+            op_name: str,
+            key: Hashable,
+            compute: Callable[..., Awaitable],
+            args: tuple,
+            kwargs: dict,
+    ) -> Any:
+        """
+        Асинхронный вариант `get_or_compute`, для вычисления значения вызывает асинхронную функцию.
+
+        Значения и вычисления общие с `get_or_compute`: асинхронные вызовы дожидаются как асинхронных вычислений, так и
+        синхронных вычислений в других потоках, не блокируя event loop.
+        """
+        full_key = (op_name, key)
+
+        value = self._pinned.get(full_key, _MISSING)
+
+        if value is not _MISSING:
+            if self._stats is not None:
+                self._stats.record_cache_hit(op_name)
+
+            return value
+
+        thread, task = get_ident(), asyncio.current_task()
+
+        while True:
+            value, flight, waiting = self._begin(full_key, thread, task)
+
+            if value is not _MISSING:
+                return value
+
+            if not waiting:
+                break
+
+            try:
+                # shield не даёт отмене ожидающей задачи отменить само вычисление
+                return await asyncio.shield(asyncio.wrap_future(flight.future))
+            except asyncio.CancelledError:
+                if flight.future.cancelled() and not (task is not None and task.cancelling()):
+                    continue
+                raise
+
+        try:
+            value = await compute(*args, **kwargs)
+        except BaseException as e:
+            self._fail(full_key, flight, e)
+            raise
+
+        return self._complete(full_key, flight, value)
+
+    def _begin(
+            self,
+            full_key: tuple[str, Hashable],
+            thread: int,
+            task: Optional[asyncio.Task],
+    ) -> tuple[Any, Optional[_Flight], bool]:
+        """
+        Ищет значение в кэше и, если его нет, регистрирует новое вычисление или находит уже выполняющееся.
+
+        Returns:
+            значение (или ``_MISSING``), вычисление и признак того, что нужно дождаться вычисления из другого
+            потока/задачи.
+            Если значения нет, ждать не нужно и вычисление не задано, то значение нужно вычислить без регистрации
+            вычисления - это повторный вызов изнутри вычисления того же значения.
+        """
+        with self._lock:
+            value = self._lookup(*full_key)
+
+            if self._stats is not None:
+                if value is _MISSING:
+                    self._stats.record_cache_miss(full_key[0])
+                else:
+                    self._stats.record_cache_hit(full_key[0])
+
+            if value is not _MISSING:
+                return value, None, False
+
+            flight = self._in_flight.get(full_key)
+
+            if flight is None:
+                flight = self._in_flight[full_key] = _Flight(thread, task)
+                return _MISSING, flight, False
+
+            if flight.is_owned_by(thread, task):
+                return _MISSING, None, False
+
+            return _MISSING, flight, True
+
+    def _lookup(self, op_name: str, key: Hashable) -> Any:
+        full_key = (op_name, key)
+
+        try:
+            return self._pinned[full_key]
+        except KeyError:
+            pass
+
+        entry = self._entries.get(full_key)
+
+        if entry is not None:
+            if entry.expires_at is None or entry.expires_at > self._clock():
+                self._touch(op_name, key)
+                return entry.value
+
+            self._evict_entry(op_name, key)
+
+        return _MISSING
+
+    def _fail(self, full_key: tuple[str, Hashable], flight: Optional[_Flight], error: BaseException):
+        if flight is None:
+            return
+
+        with self._lock:
+            if self._in_flight.get(full_key) is flight:
+                del self._in_flight[full_key]
+
+        if isinstance(error, asyncio.CancelledError):
+            # Ожидающие вызовы не должны получать чужую отмену - они попробуют вычислить значение сами
+            flight.future.cancel()
+        else:
+            flight.future.set_exception(error)
+
+    def _complete(self, full_key: tuple[str, Hashable], flight: Optional[_Flight], value: Any) -> Any:
+        with self._lock:
+            if flight is None:
+                self._store(*full_key, value)
+            elif self._in_flight.get(full_key) is flight:
+                del self._in_flight[full_key]
+                self._store(*full_key, value)
+            # Иначе кэш был сброшен во время вычисления, значение может быть устаревшим, так что не сохраняем его
+
+        if flight is not None:
+            flight.future.set_result(value)
+
+        return value
+
+    def _touch(self, op_name: str, key: Hashable):
+        self._entries.move_to_end((op_name, key))
+        self._by_operation[op_name].move_to_end(key)
+
+    def _remove(self, op_name: str, key: Hashable):
+        entry = self._entries.pop((op_name, key))
+        self._total_size -= entry.size
+
+        operation_keys = self._by_operation[op_name]
+        del operation_keys[key]
+
+        if not operation_keys:
+            del self._by_operation[op_name]
+
+    def _store(self, op_name: str, key: Hashable, value: Any):
+        policy = self._policy
+
+        if key in policy.pinned_keys:
+            self._pinned[(op_name, key)] = value
+            return
+
+        if (op_name, key) in self._entries:
+            self._remove(op_name, key)
+
+        size = policy.size_of(value)
+        self._entries[(op_name, key)] = _Entry(
+            value,
+            size,
+            None if policy.ttl is None else self._clock() + policy.ttl,
+        )
+        self._by_operation.setdefault(op_name, OrderedDict())[key] = None
+        self._total_size += size
+
+        self._evict(op_name)
+
+    def _evict(self, op_name: str):
+        policy = self._policy
+
+        if policy.ttl is not None:
+            # Значения устаревают в порядке добавления, а не использования, так что порядок очереди им не
+            # соответствует. Проверяем все значения, но только когда устарело самое давно использовавшееся - это
+            # происходит не чаще, чем раз в ttl секунд, и не даёт устаревшим значениям копиться.
+            now = self._clock()
+            first = next(iter(self._entries.values()))
+
+            if first.expires_at <= now:
+                for expired_op, expired_key in [
+                    full_key for full_key, entry in self._entries.items() if entry.expires_at <= now
+                ]:
+                    self._evict_entry(expired_op, expired_key)
+
+        if policy.max_entries_per_operation is not None:
+            operation_keys = self._by_operation.get(op_name)
+
+            while operation_keys and len(operation_keys) > policy.max_entries_per_operation:
+                self._evict_entry(op_name, next(iter(operation_keys)))
+
+        if policy.max_total_size is not None:
+            while self._entries and self._total_size > policy.max_total_size:
+                self._evict_entry(*next(iter(self._entries)))
+
+    def _evict_entry(self, op_name: str, key: Hashable):
+        self._remove(op_name, key)
+
+        if self._stats is not None:
+            self._stats.record_cache_eviction(op_name)
+
+    def drop(self, operations: Iterable[str], keys: Optional[Iterable[Hashable]] = None):
+        """
+        Удаляет значения заданных операций.
+
+        Args:
+            operations:
+                имена операций
+            keys:
+                ключи удаляемых значений. Если не заданы - удаляются все значения операций
+        """
+        if keys is not None:
+            keys = tuple(keys)
+
+        with self._lock:
+            for op_name in operations:
+                for full_key in [
+                    full_key for full_key in self._in_flight
+                    if full_key[0] == op_name and (keys is None or full_key[1] in keys)
+                ]:
+                    del self._in_flight[full_key]
+
+                if keys is None:
+                    for key in tuple(self._by_operation.get(op_name, ())):
+                        self._remove(op_name, key)
+
+                    for full_key in [full_key for full_key in self._pinned if full_key[0] == op_name]:
+                        del self._pinned[full_key]
+                else:
+                    for key in keys:
+                        self._pinned.pop((op_name, key), None)
+
+                        if (op_name, key) in self._entries:
+                            self._remove(op_name, key)
+
+    def clear(self):
+        """
+        Удаляет все значения.
+        """
+        with self._lock:
+            self._in_flight.clear()
+            self._pinned.clear()
+            self._entries.clear()
+            self._by_operation.clear()
+            self._total_size = 0
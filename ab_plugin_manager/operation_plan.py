@@ -0,0 +1,497 @@
+"""
+Планы выполнения операций.
+
+План операции - неизменяемая, заранее упорядоченная последовательность шагов операции.
+Менеджер плагинов строит план один раз и переиспользует его до тех пор, пока набор плагинов не изменится.
+
+Помимо самих шагов, план хранит граф зависимостей между ними.
+Это позволяет при добавлении плагина встроить его шаги в уже упорядоченный план, переупорядочив только затронутый
+участок, вместо того, чтобы сортировать все шаги заново.
+"""
+
+from collections import defaultdict
+from collections.abc import Sequence
+from graphlib import TopologicalSorter, CycleError
+from itertools import chain
+from logging import Logger
+from typing import Iterable, Iterator, Optional, Collection, overload
+
+from ab_plugin_manager.abc import OperationStep, Plugin, DependencyCycleException
+from ab_plugin_manager.compiled_plan import CompiledPlan
+
+__all__ = ["OperationPlan"]
+
+
+def _collect_predecessors(steps: Iterable[OperationStep]) -> dict[str, set[str]]:
+    predecessors: defaultdict[str, set[str]] = defaultdict(set)
+
+    for step in steps:
+        predecessors[step.name].update(step.dependencies)
+
+        for dep in step.dependencies:
+            predecessors[dep]
+
+        for reverse_dep in step.reverse_dependencies:
+            predecessors[reverse_dep].add(step.name)
+
+    return predecessors
+
+
+def _invert(predecessors: dict[str, Collection[str]]) -> dict[str, frozenset[str]]:
+    successors: defaultdict[str, set[str]] = defaultdict(set)
+
+    for node, preds in predecessors.items():
+        for pred in preds:
+            successors[pred].add(node)
+
+    return {node: frozenset(succs) for node, succs in successors.items()}
+
+
+def _is_valid_order(order: Sequence[str], predecessors: dict[str, set[str]]) -> bool:
+    """
+    Проверяет, что порядок содержит ровно все узлы графа шагов и не нарушает ни одной зависимости.
+    """
+    positions = {name: position for position, name in enumerate(order)}
+
+    if len(positions) != len(order) or positions.keys() != predecessors.keys():
+        return False
+
+    for node, preds in predecessors.items():
+        position = positions[node]
+
+        for pred in preds:
+            if positions[pred] >= position:
+                return False
+
+    return True
+
+
+class OperationPlan(Sequence[OperationStep]):
+    """
+    Упорядоченная в соответствии с зависимостями последовательность шагов операции.
+
+    Является неизменяемой последовательностью шагов, поэтому может безопасно использоваться из разных потоков и
+    переиспользоваться при последующих выполнениях операции.
+
+    Новые планы с добавленными или удалёнными шагами создаются методами `with_added_steps` и `without_plugins`.
+    """
+    __slots__ = (
+        'op_name', 'steps', 'stale',
+        '_levels', '_compiled', '_order', '_steps_by_name', '_predecessors', '_successors', '_contributors',
+        '_shadowed',
+    )
+
+    op_name: str
+    steps: tuple[OperationStep, ...]
+    stale: bool
+    """
+    Признак того, что менеджер плагинов заменил этот план другим (или сбросил его).
+
+    Сам план при этом остаётся корректным для снимка набора плагинов, для которого он был построен.
+    """
+
+    def __init__(
+            self,
+            op_name: str,
+            order: Iterable[str],
+            steps_by_name: dict[str, OperationStep],
+            predecessors: dict[str, frozenset[str]],
+            successors: dict[str, frozenset[str]],
+            contributors: dict[str, Optional[Plugin]],
+            shadowed: frozenset[str] = frozenset(),
+    ):
+        """
+        :param op_name: Имя операции
+        :param order: Имена всех узлов графа (включая упомянутые в зависимостях, но отсутствующие шаги) в порядке
+                    выполнения
+        :param steps_by_name: Шаги операции
+        :param predecessors: Непосредственные зависимости каждого узла
+        :param successors: Узлы, непосредственно зависящие от каждого узла
+        :param contributors: Плагин менеджера, добавивший каждый шаг или ``None`` если он не известен
+        :param shadowed: Имена шагов, для которых были проигнорированы шаги с совпадающими именами
+        """
+        self.op_name = op_name
+        self.stale = False
+        self._order = tuple(order)
+        self._steps_by_name = steps_by_name
+        self._predecessors = predecessors
+        self._successors = successors
+        self._contributors = contributors
+        self._shadowed = shadowed
+        self.steps = tuple(steps_by_name[name] for name in self._order if name in steps_by_name)
+        self._levels: Optional[tuple[tuple[OperationStep, ...], ...]] = None
+        self._compiled: Optional[CompiledPlan] = None
+
+    @classmethod
+    def build(cls, op_name: str, plugins: Iterable[Plugin], logger: Logger) -> 'OperationPlan':
+        """
+        Собирает шаги операции из заданных плагинов и упорядочивает их в соответствии с зависимостями.
+
+        Args:
+            op_name:
+                имя операции
+            plugins:
+                плагины, шаги которых нужно включить в план
+            logger:
+                логгер для предупреждений о конфликтующих шагах
+
+        Raises:
+            DependencyCycleException - если у шагов операции присутствуют циклические зависимости
+        """
+        return cls.build_from_steps(
+            op_name,
+            ((plugin, plugin.get_operation_steps(op_name)) for plugin in plugins),
+            logger,
+        )
+
+    @classmethod
+    def build_from_steps(
+            cls,
+            op_name: str,
+            contributions: Iterable[tuple[Plugin, Iterable[OperationStep]]],
+            logger: Logger,
+            known_order: Optional[Sequence[str]] = None,
+    ) -> 'OperationPlan':
+        """
+        Упорядочивает заранее собранные шаги операции в соответствии с зависимостями.
+
+        Args:
+            op_name:
+                имя операции
+            contributions:
+                пары из плагина и добавленных им шагов, в порядке регистрации плагинов
+            logger:
+                логгер для предупреждений о конфликтующих шагах
+            known_order:
+                ранее вычисленный порядок узлов графа (см. `order`) для тех же шагов.
+                Используется вместо сортировки, если соответствует зависимостям шагов
+
+        Raises:
+            DependencyCycleException - если у шагов операции присутствуют циклические зависимости
+        """
+        ts: TopologicalSorter[str] = TopologicalSorter()
+        steps: dict[str, OperationStep] = {}
+        contributors: dict[str, Optional[Plugin]] = {}
+        shadowed: set[str] = set()
+
+        for plugin, plugin_steps in contributions:
+            for step in plugin_steps:
+                if step.name in steps:
+                    logger.warning(
+                        'Шаг с именем "%s" для операции "%s" добавлен одновременно плагинами %s и %s. '
+                        'Шаг, добавленные плагином %s будет проигнорирован.',
+                        step.name, op_name, steps[step.name].plugin, plugin, plugin
+                    )
+                    shadowed.add(step.name)
+                    continue
+
+                steps[step.name] = step
+                contributors[step.name] = plugin
+
+                if known_order is None:
+                    ts.add(step.name, *step.dependencies)
+
+                    for reverse_dep in step.reverse_dependencies:
+                        ts.add(reverse_dep, step.name)
+
+        # Граф зависимостей нужен плану в любом случае, так что ранее вычисленный порядок проверяется по нему
+        predecessors = _collect_predecessors(steps.values())
+        order: Sequence[str]
+
+        if known_order is not None and _is_valid_order(known_order, predecessors):
+            order = known_order
+        else:
+            if known_order is not None:
+                # Ранее вычисленный порядок не подходит, сортируем шаги заново
+                for step in steps.values():
+                    ts.add(step.name, *step.dependencies)
+
+                    for reverse_dep in step.reverse_dependencies:
+                        ts.add(reverse_dep, step.name)
+
+            try:
+                ts.prepare()
+            except CycleError as e:
+                raise DependencyCycleException(
+                    op_name,
+                    [steps.get(name, name) for name in e.args[1][1:]]
+                )
+
+            order = []
+
+            while ts.is_active():
+                node_group = ts.get_ready()
+                order.extend(node_group)
+                ts.done(*node_group)
+
+        return cls(
+            op_name,
+            order,
+            steps,
+            {node: frozenset(preds) for node, preds in predecessors.items()},
+            _invert(predecessors),
+            contributors,
+            frozenset(shadowed),
+        )
+
+    def with_added_steps(
+            self,
+            steps: Iterable[OperationStep],
+            contributor: Optional[Plugin],
+            logger: Logger,
+    ) -> 'OperationPlan':
+        """
+        Создаёт план, в который добавлены заданные шаги.
+
+        Новые шаги встраиваются в существующий порядок (по алгоритму Пирса-Келли): переупорядочиваются только шаги,
+        расположенные между концами каждой добавленной зависимости, нарушающей текущий порядок.
+        Шаги, имена которых совпадают с уже присутствующими в плане, игнорируются - так же, как и при построении плана
+        с нуля, когда добавляющий их плагин идёт последним.
+
+        Args:
+            steps:
+                добавляемые шаги
+            contributor:
+                плагин менеджера, добавивший шаги (``None``, если он не известен)
+            logger:
+                логгер для предупреждений о конфликтующих шагах
+
+        Raises:
+            DependencyCycleException - если новые шаги образуют цикл зависимостей
+        """
+        order = list(self._order)
+        positions = {name: position for position, name in enumerate(order)}
+        steps_by_name = dict(self._steps_by_name)
+        contributors = dict(self._contributors)
+        shadowed = set(self._shadowed)
+        predecessors = dict(self._predecessors)
+        successors = dict(self._successors)
+
+        def ensure_node(name: str):
+            if name not in positions:
+                positions[name] = len(order)
+                order.append(name)
+
+        def reorder(first: str, second: str):
+            # Нужно поставить first перед second, сейчас second находится левее.
+            lower, upper = positions[second], positions[first]
+
+            forward: list[str] = []
+            parents: dict[str, str] = {}
+            stack = [second]
+            seen = {second}
+
+            while stack:
+                node = stack.pop()
+                forward.append(node)
+
+                for successor in successors.get(node, ()):
+                    if successor == first:
+                        cycle = [node]
+                        while cycle[-1] != second:
+                            cycle.append(parents[cycle[-1]])
+                        raise DependencyCycleException(
+                            self.op_name,
+                            [steps_by_name.get(name, name) for name in (first, *reversed(cycle))],
+                        )
+
+                    if successor not in seen and positions[successor] < upper:
+                        seen.add(successor)
+                        parents[successor] = node
+                        stack.append(successor)
+
+            backward: list[str] = []
+            stack = [first]
+            seen = {first}
+
+            while stack:
+                node = stack.pop()
+                backward.append(node)
+
+                for predecessor in predecessors.get(node, ()):
+                    if predecessor not in seen and positions[predecessor] > lower:
+                        seen.add(predecessor)
+                        stack.append(predecessor)
+
+            backward.sort(key=positions.__getitem__)
+            forward.sort(key=positions.__getitem__)
+            slots = sorted(positions[node] for node in chain(backward, forward))
+
+            for slot, node in zip(slots, chain(backward, forward)):
+                order[slot] = node
+                positions[node] = slot
+
+        def add_edge(first: str, second: str):
+            if first in predecessors.get(second, ()):
+                return
+
+            predecessors[second] = predecessors.get(second, frozenset()) | {first}
+            successors[first] = successors.get(first, frozenset()) | {second}
+
+            if positions[first] > positions[second]:
+                reorder(first, second)
+
+        for step in steps:
+            if step.name in steps_by_name:
+                logger.warning(
+                    'Шаг с именем "%s" для операции "%s" добавлен одновременно плагинами %s и %s. '
+                    'Шаг, добавленные плагином %s будет проигнорирован.',
+                    step.name, self.op_name, steps_by_name[step.name].plugin, step.plugin, step.plugin
+                )
+                shadowed.add(step.name)
+                continue
+
+            steps_by_name[step.name] = step
+            contributors[step.name] = contributor
+
+            for dep in step.dependencies:
+                ensure_node(dep)
+            ensure_node(step.name)
+            for reverse_dep in step.reverse_dependencies:
+                ensure_node(reverse_dep)
+
+            for dep in step.dependencies:
+                add_edge(dep, step.name)
+            for reverse_dep in step.reverse_dependencies:
+                add_edge(step.name, reverse_dep)
+
+        return OperationPlan(
+            self.op_name,
+            order,
+            steps_by_name,
+            predecessors,
+            successors,
+            contributors,
+            frozenset(shadowed),
+        )
+
+    def without_plugins(self, plugins: Collection[Plugin]) -> Optional['OperationPlan']:
+        """
+        Создаёт план, из которого удалены шаги, добавленные заданными плагинами менеджера.
+
+        Удаление шагов не может нарушить существующий порядок, так что повторная сортировка не требуется.
+
+        Returns:
+            новый план, этот же план, если заданные плагины не добавляли в него шагов, или ``None``, если новый план
+            нужно построить заново (например, если удаляемый шаг скрывал шаг с тем же именем от другого плагина)
+        """
+        removed_ids = {id(plugin) for plugin in plugins}
+        removed: set[str] = set()
+
+        for name, contributor in self._contributors.items():
+            if contributor is None:
+                return None
+
+            if id(contributor) in removed_ids:
+                if name in self._shadowed:
+                    return None
+
+                removed.add(name)
+
+        if not removed:
+            return self
+
+        steps_by_name = {name: step for name, step in self._steps_by_name.items() if name not in removed}
+        predecessors = _collect_predecessors(steps_by_name.values())
+
+        return OperationPlan(
+            self.op_name,
+            (name for name in self._order if name in predecessors),
+            steps_by_name,
+            {node: frozenset(preds) for node, preds in predecessors.items()},
+            _invert(predecessors),
+            {name: contributor for name, contributor in self._contributors.items() if name not in removed},
+            self._shadowed,
+        )
+
+    @property
+    def order(self) -> tuple[str, ...]:
+        """
+        Имена всех узлов графа шагов плана (включая упомянутые в зависимостях, но отсутствующие шаги) в порядке
+        выполнения.
+
+        Может быть передан в `build_from_steps` для построения плана для тех же шагов без повторной сортировки.
+        """
+        return self._order
+
+    @property
+    def levels(self) -> tuple[tuple[OperationStep, ...], ...]:
+        """
+        Шаги плана, сгруппированные в уровни.
+
+        Шаги одного уровня не зависят друг от друга, а все их зависимости находятся на предыдущих уровнях.
+        Так что уровни можно выполнять по-очереди, а шаги каждого уровня - параллельно.
+
+        Вычисляется при первом обращении.
+        """
+        levels = self._levels
+
+        if levels is None:
+            # Уровень узла - длина самого длинного пути до него. Это те же группы, что возвращает
+            # TopologicalSorter.get_ready(), но вычисленные по уже упорядоченному графу.
+            node_levels: dict[str, int] = {}
+            groups: defaultdict[int, list[OperationStep]] = defaultdict(list)
+
+            for name in self._order:
+                level = max((node_levels[pred] + 1 for pred in self._predecessors.get(name, ())), default=0)
+                node_levels[name] = level
+
+                if name in self._steps_by_name:
+                    groups[level].append(self._steps_by_name[name])
+
+            self._levels = levels = tuple(tuple(groups[level]) for level in sorted(groups))
+
+        return levels
+
+    @property
+    def compiled(self) -> CompiledPlan:
+        """
+        Скомпилированный план для шагов этого плана.
+
+        Компилируется при первом обращении.
+
+        Raises:
+            TypeError - если какой-то из шагов не является функцией
+        """
+        compiled = self._compiled
+
+        if compiled is None:
+            self._compiled = compiled = CompiledPlan(self.steps)
+
+        return compiled
+
+    def involves(self, plugin: Plugin) -> bool:
+        """
+        Проверяет, участвовал ли плагин в построении плана.
+
+        Плагин участвовал, если он добавил в план шаги как плагин менеджера, или если какой-либо из шагов плана
+        принадлежит ему (например, плагин вложен в другой плагин менеджера).
+        """
+        return (
+                any(contributor is plugin for contributor in self._contributors.values()) or
+                any(step.plugin is plugin for step in self.steps)
+        )
+
+    def has_step(self, name: str) -> bool:
+        """
+        Проверяет, содержит ли план шаг с заданным именем.
+        """
+        return name in self._steps_by_name
+
+    def __iter__(self) -> Iterator[OperationStep]:
+        return iter(self.steps)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    @overload
+    def __getitem__(self, index: int) -> OperationStep: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[OperationStep]: ...
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+    def __repr__(self):
+        return f'<OperationPlan {self.op_name}: {", ".join(map(str, self.steps))}>'
@@ -0,0 +1,187 @@
+"""
+Сохраняемый между запусками приложения кэш порядка шагов операций.
+
+При каждом запуске менеджер плагинов заново упорядочивает шаги каждой операции, хотя набор плагинов, их версии и
+зависимости между шагами обычно не меняются между запусками.
+`PlanCacheFile` сохраняет в файл порядок шагов каждой операции вместе с отпечатком (fingerprint) набора её шагов, так
+что при следующем запуске с тем же набором шагов сортировка не требуется.
+
+Кроме того, в том же файле сохраняется ожидаемое время выполнения шагов (см. `PluginManager.get_step_durations`).
+"""
+
+import json
+import os
+from hashlib import sha256
+from logging import Logger, getLogger
+from pathlib import Path
+from threading import Lock
+from typing import Iterable, Mapping, Optional, Sequence, Union
+
+from ab_plugin_manager.abc import OperationStep
+
+__all__ = ["PlanCacheFile"]
+
+_FORMAT_VERSION = 1
+
+
+def _step_fingerprint_data(step: OperationStep) -> bytes:
+    return '\0'.join((
+        str(step.plugin),
+        step.name,
+        *sorted(step.dependencies),
+        '\1',
+        *sorted(step.reverse_dependencies),
+        '\2',
+    )).encode('utf-8')
+
+
+class PlanCacheFile:
+    """
+    Файл с порядком шагов операций, сохраняемый между запусками приложения.
+
+    Порядок шагов операции используется только если отпечаток шагов совпадает с сохранённым.
+    Отпечаток вычисляется из имён и версий плагинов, имён шагов и зависимостей между ними одним проходом sha256, так
+    что он обходится дешевле сортировки шагов, которую позволяет пропустить.
+    Кроме того, перед использованием порядок проверяется на соответствие зависимостям шагов, так что устаревший или
+    повреждённый файл не может привести к неверному порядку.
+    """
+    __slots__ = ('_path', '_lock', '_logger', '_orders', '_durations', '_dirty')
+
+    def __init__(self, path: Union[str, os.PathLike], *, logger: Logger = getLogger('PlanCacheFile')):
+        """
+        :param path: Путь к файлу. Если файл существует, то он будет прочитан
+        :param logger: Логгер
+        """
+        self._path = Path(path)
+        self._lock = Lock()
+        self._logger = logger
+        self._orders: dict[str, tuple[str, tuple[str, ...]]] = {}
+        self._durations: dict[str, dict[str, float]] = {}
+        self._dirty = False
+
+        self._load()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @staticmethod
+    def fingerprint(op_name: str, steps: Iterable[OperationStep]) -> str:
+        """
+        Вычисляет отпечаток набора шагов операции.
+
+        Args:
+            op_name:
+                имя операции
+            steps:
+                шаги операции в порядке их добавления плагинами
+        """
+        h = sha256(op_name.encode('utf-8'))
+
+        for step in steps:
+            h.update(_step_fingerprint_data(step))
+
+        return h.hexdigest()
+
+    def get(self, op_name: str, fingerprint: str) -> Optional[Sequence[str]]:
+        """
+        Возвращает сохранённый порядок узлов графа шагов операции, если он сохранён для шагов с тем же отпечатком.
+        """
+        stored = self._orders.get(op_name)
+
+        if stored is None or stored[0] != fingerprint:
+            return None
+
+        return stored[1]
+
+    def put(self, op_name: str, fingerprint: str, order: Sequence[str]):
+        """
+        Запоминает порядок узлов графа шагов операции для шагов с заданным отпечатком.
+        """
+        order = tuple(order)
+
+        with self._lock:
+            if self._orders.get(op_name) == (fingerprint, order):
+                return
+
+            self._orders[op_name] = (fingerprint, order)
+            self._dirty = True
+
+    def get_step_durations(self) -> dict[str, dict[str, float]]:
+        """
+        Возвращает сохранённое время выполнения шагов по именам операций и шагов.
+        """
+        with self._lock:
+            return {op_name: dict(durations) for op_name, durations in self._durations.items()}
+
+    def put_step_durations(self, durations: Mapping[str, Mapping[str, float]]):
+        """
+        Запоминает время выполнения шагов, заменяя ранее сохранённое время для тех же операций.
+        """
+        with self._lock:
+            for op_name, op_durations in durations.items():
+                op_durations = dict(op_durations)
+
+                if self._durations.get(op_name) != op_durations:
+                    self._durations[op_name] = op_durations
+                    self._dirty = True
+
+    def _load(self):
+        try:
+            with self._path.open('r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self._logger.warning("Не удалось прочитать файл кэша планов %s: %s", self._path, e)
+            return
+
+        if not isinstance(data, dict) or data.get('version') != _FORMAT_VERSION:
+            self._logger.info("Файл кэша планов %s имеет неподдерживаемый формат и будет перезаписан", self._path)
+            return
+
+        try:
+            for op_name, stored in data['operations'].items():
+                self._orders[op_name] = (str(stored['fingerprint']), tuple(map(str, stored['order'])))
+
+            for op_name, durations in data.get('durations', {}).items():
+                self._durations[op_name] = {str(name): float(seconds) for name, seconds in durations.items()}
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self._logger.warning("Файл кэша планов %s повреждён: %s", self._path, e)
+            self._orders.clear()
+            self._durations.clear()
+
+    def save(self):
+        """
+        Сохраняет файл, если с момента загрузки или последнего сохранения в него были добавлены новые данные.
+
+        Файл заменяется атомарно, так что одновременно запущенные процессы не прочитают частично записанный файл.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+
+            data = {
+                'version': _FORMAT_VERSION,
+                'operations': {
+                    op_name: {'fingerprint': fingerprint, 'order': list(order)}
+                    for op_name, (fingerprint, order) in self._orders.items()
+                },
+                'durations': {op_name: dict(durations) for op_name, durations in self._durations.items()},
+            }
+            self._dirty = False
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f'{self._path.name}.{os.getpid()}.tmp')
+
+        try:
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(data, f)
+
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            with self._lock:
+                self._dirty = True
+
+            tmp_path.unlink(missing_ok=True)
+            raise
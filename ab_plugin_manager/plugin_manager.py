@@ -1,78 +1,695 @@
 from collections import defaultdict
 from collections.abc import Hashable
-from graphlib import TopologicalSorter, CycleError
-from logging import getLogger
-from typing import Iterable, Collection, Any, Callable, Optional
+from heapq import merge
+from itertools import chain
+from logging import getLogger, Logger
+from os import PathLike
+from threading import Lock
+from time import perf_counter
+from typing import Iterable, Collection, Any, Callable, Optional, Sequence, Mapping, Awaitable, Union
 
-from ab_plugin_manager.abc import PluginManager, OperationStep, Plugin, DependencyCycleException, \
-    UnlistableOperationSetException
+from ab_plugin_manager.abc import PluginManager, OperationStep, Plugin, UnlistableOperationSetException, \
+    DependencyCycleException
+from ab_plugin_manager.operation_cache import OperationCache, OperationCachePolicy
+from ab_plugin_manager.operation_plan import OperationPlan
+from ab_plugin_manager.plan_cache import PlanCacheFile
+from ab_plugin_manager.stats import PluginManagerStats, OperationStats
+from ab_plugin_manager.step_durations import StepDurations
 
-__all__ = ["PluginManagerImpl"]
+__all__ = ["PluginManagerImpl", "PluginSetSnapshot"]
 
 
-class PluginManagerImpl(PluginManager):
-    __slots__ = ('_plugins', '_logger', '_op_cache')
+def _build_operation_index(plugins: tuple[Plugin, ...]) -> tuple[dict[str, tuple[int, ...]], tuple[int, ...]]:
+    """
+    Строит индекс, сопоставляющий каждой операции позиции плагинов, которые добавляют в неё шаги.
 
-    def __init__(self, plugins: Collection[Plugin], *, logger=getLogger('PluginManager')):
-        self._plugins = plugins
-        self._logger = logger
-        self._op_cache: defaultdict[str, dict[Hashable, Any]] = defaultdict(dict)
+    Returns:
+        индекс операций и позиции плагинов, не способных перечислить свои операции
+    """
+    index: defaultdict[str, list[int]] = defaultdict(list)
+    unlistable: list[int] = []
 
-    def get_operation_sequence(self, op_name: str) -> Iterable[OperationStep]:
-        ts: TopologicalSorter[str] = TopologicalSorter()
-        steps: dict[str, OperationStep] = {}
-
-        for plugin in self._plugins:
-            for step in plugin.get_operation_steps(op_name):
-                if step.name in steps:
-                    self._logger.warning(
-                        'Шаг с именем "%s" для операции "%s" добавлен одновременно плагинами %s и %s. '
-                        'Шаг, добавленные плагином %s будет проигнорирован.',
-                        step.name, op_name, steps[step.name].plugin, plugin, plugin
-                    )
-                    continue
+    for position, plugin in enumerate(plugins):
+        try:
+            operations = set(plugin.list_implemented_operations())
+        except UnlistableOperationSetException:
+            unlistable.append(position)
+            continue
 
-                steps[step.name] = step
+        for op_name in operations:
+            index[op_name].append(position)
 
-                ts.add(step.name, *step.dependencies)
+    return {op_name: tuple(positions) for op_name, positions in index.items()}, tuple(unlistable)
 
-                for reverse_dep in step.reverse_dependencies:
-                    ts.add(reverse_dep, step.name)
 
-        try:
-            ts.prepare()
-        except CycleError as e:
-            raise DependencyCycleException(
-                op_name,
-                [steps.get(name, name) for name in e.args[1][1:]]
-            )
+def _build_plan(
+        op_name: str,
+        contributions: Iterable[tuple[Plugin, Iterable[OperationStep]]],
+        logger: Logger,
+        plan_cache: Optional[PlanCacheFile],
+) -> OperationPlan:
+    """
+    Строит план операции, используя сохранённый порядок шагов, если он есть в кэше планов.
+    """
+    if plan_cache is None:
+        return OperationPlan.build_from_steps(op_name, contributions, logger)
 
-        # Генератор вынесен в отдельную функцию чтобы исключение DependencyCycleException выкидывалось непосредственно
-        # при вызове get_operation_sequence
-        def iterate():
-            while ts.is_active():
-                node_group = ts.get_ready()
+    contributions = [(plugin, tuple(steps)) for plugin, steps in contributions]
+    fingerprint = plan_cache.fingerprint(op_name, chain.from_iterable(steps for _, steps in contributions))
 
-                for name in node_group:
-                    if name in steps:
-                        yield steps[name]
+    plan = OperationPlan.build_from_steps(op_name, contributions, logger, plan_cache.get(op_name, fingerprint))
+    plan_cache.put(op_name, fingerprint, plan.order)
 
-                ts.done(*node_group)
+    return plan
 
-        return iterate()
 
-    def operation_cache(self, op_name: str, key: Hashable, compute: Callable, /, *args, **kwargs) -> Any:
-        operation_scope = self._op_cache[op_name]
+class PluginSetSnapshot:
+    """
+    Неизменяемый снимок набора плагинов менеджера.
+
+    Каждое изменение набора плагинов публикует новый снимок со следующим номером версии, не затрагивая старые.
+    Поэтому операция, начавшая выполнение со старым снимком, видит согласованный набор плагинов до своего завершения.
+
+    Помимо самих плагинов, снимок хранит индекс реализуемых ими операций и планы операций, построенные для этого набора
+    плагинов.
+    """
+    __slots__ = ('version', 'plugins', '_index', '_unlistable', '_plans')
+
+    version: int
+    plugins: tuple[Plugin, ...]
 
+    def __init__(
+            self,
+            version: int,
+            plugins: tuple[Plugin, ...],
+            index: dict[str, tuple[int, ...]],
+            unlistable: tuple[int, ...],
+            plans: dict[str, OperationPlan],
+    ):
+        self.version = version
+        self.plugins = plugins
+        self._index = index
+        self._unlistable = unlistable
+        self._plans = plans
+
+    @classmethod
+    def create(cls, version: int, plugins: Iterable[Plugin]) -> 'PluginSetSnapshot':
+        plugins = tuple(plugins)
+        index, unlistable = _build_operation_index(plugins)
+        return cls(version, plugins, index, unlistable, {})
+
+    @property
+    def planned_operations(self) -> Collection[str]:
+        """
+        Имена операций, планы которых уже построены для этого снимка.
+        """
+        return self._plans.keys()
+
+    def get_contributing_plugins(self, op_name: str) -> Iterable[Plugin]:
+        """
+        Возвращает плагины, которые могут добавлять шаги в заданную операцию, в порядке их регистрации.
+        """
+        positions: Iterable[int] = self._index.get(op_name, ())
+
+        if self._unlistable:
+            # Порядок плагинов важен - при совпадении имён шагов используется шаг плагина, идущего раньше
+            positions = merge(positions, self._unlistable)
+
+        plugins = self.plugins
+
+        return (plugins[position] for position in positions)
+
+    def get_plan(
+            self,
+            op_name: str,
+            logger: Logger,
+            stats: Optional[PluginManagerStats] = None,
+            plan_cache: Optional[PlanCacheFile] = None,
+    ) -> OperationPlan:
+        """
+        Возвращает план операции для этого набора плагинов, строя его при первом обращении.
+        """
         try:
-            return operation_scope[key]
+            return self._plans[op_name]
         except KeyError:
             pass
 
-        res = compute(*args, **kwargs)
-        operation_scope[key] = res
+        start = perf_counter() if stats is not None else 0.0
+
+        plan = _build_plan(
+            op_name,
+            ((plugin, plugin.get_operation_steps(op_name)) for plugin in self.get_contributing_plugins(op_name)),
+            logger,
+            plan_cache,
+        )
+
+        if stats is not None:
+            stats.record_plan_build(op_name, perf_counter() - start)
+
+        # План сохраняется в том снимке, из которого был построен, так что он не может оказаться устаревшим.
+        # Если план уже построен в другом потоке, то возвращается сохранённый план, что бы все вызывающие получили
+        # один и тот же план
+        return self._plans.setdefault(op_name, plan)
+
+    def get_plans(
+            self,
+            op_names: Iterable[str],
+            logger: Logger,
+            stats: Optional[PluginManagerStats] = None,
+            plan_cache: Optional[PlanCacheFile] = None,
+    ) -> dict[str, OperationPlan]:
+        """
+        Возвращает планы нескольких операций, строя отсутствующие планы за один проход по плагинам.
+        """
+        result: dict[str, OperationPlan] = {}
+        missing: dict[str, list[tuple[Plugin, Iterable[OperationStep]]]] = {}
+
+        for op_name in op_names:
+            try:
+                result[op_name] = self._plans[op_name]
+            except KeyError:
+                missing[op_name] = []
+
+        if not missing:
+            return result
+
+        start = perf_counter() if stats is not None else 0.0
+        unlistable = frozenset(self._unlistable)
+        op_positions = {op_name: frozenset(self._index.get(op_name, ())) for op_name in missing}
+
+        for position in sorted(unlistable.union(*op_positions.values())):
+            plugin = self.plugins[position]
+
+            for op_name, contributions in missing.items():
+                if position in unlistable or position in op_positions[op_name]:
+                    contributions.append((plugin, tuple(plugin.get_operation_steps(op_name))))
+
+        # Время общего прохода по плагинам делится между операциями поровну
+        collect_time = (perf_counter() - start) / len(missing) if stats is not None else 0.0
+
+        for op_name, contributions in missing.items():
+            start = perf_counter() if stats is not None else 0.0
+            plan = _build_plan(op_name, contributions, logger, plan_cache)
+
+            if stats is not None:
+                stats.record_plan_build(op_name, collect_time + perf_counter() - start)
+
+            result[op_name] = self._plans.setdefault(op_name, plan)
+
+        return result
+
+    def rebuilt(self) -> 'PluginSetSnapshot':
+        """
+        Создаёт следующий снимок с тем же набором плагинов, полностью перестроив индекс операций.
+        """
+        return PluginSetSnapshot.create(self.version + 1, self.plugins)
+
+    def reindexed(
+            self,
+            operations: Collection[str],
+            logger: Logger,
+            plugin: Optional[Plugin] = None,
+    ) -> 'PluginSetSnapshot':
+        """
+        Создаёт следующий снимок с тем же набором плагинов, обновив индекс и планы для заданных операций.
+
+        Используется когда шаги операций изменились внутри уже зарегистрированных плагинов.
+        Если известен плагин, шаги которого появились внутри другого плагина (как это происходит при загрузке плагинов
+        в ``PluginDiscoveryPlugin``), то его шаги встраиваются в существующие планы, иначе планы сбрасываются.
+        """
+        index = dict(self._index)
+        unlistable = set(self._unlistable)
+
+        if plugin is None:
+            for op_name in operations:
+                index[op_name] = tuple(
+                    position for position, top_plugin in enumerate(self.plugins)
+                    if position not in unlistable and any(True for _ in top_plugin.get_operation_steps(op_name))
+                )
+        else:
+            # Индекс обновляется только для содержащего плагин плагина, что бы загрузка каждого плагина не опрашивала
+            # все зарегистрированные плагины по всем операциям. Позиции, уже имеющиеся в индексе, не удаляются: лишняя
+            # позиция лишь приводит к лишнему запросу шагов при построении плана
+            position = self._find_container(plugin, operations, index, unlistable)
+
+            if position is not None:
+                for op_name in operations:
+                    positions = index.get(op_name, ())
+
+                    if position not in positions:
+                        index[op_name] = tuple(sorted((*positions, position)))
+
+        snapshot = PluginSetSnapshot(self.version + 1, self.plugins, index, self._unlistable, {})
+        snapshot._plans = self._updated_plans(snapshot, operations, plugin, logger)
+
+        return snapshot
+
+    def _find_container(
+            self,
+            plugin: Plugin,
+            operations: Iterable[str],
+            index: Mapping[str, tuple[int, ...]],
+            unlistable: Collection[int],
+    ) -> Optional[int]:
+        """
+        Возвращает позицию зарегистрированного плагина, способного перечислить свои операции, который содержит заданный
+        плагин или является им, если эта позиция отсутствует в индексе хотя бы одной из операций.
+
+        Шаги запрашиваются только у плагинов, ещё не добавляющих шаги в операцию по индексу.
+        """
+        for position, top_plugin in enumerate(self.plugins):
+            if top_plugin is plugin:
+                return None if position in unlistable else position
+
+        for op_name in operations:
+            indexed = index.get(op_name, ())
+
+            if not any(True for _ in plugin.get_operation_steps(op_name)):
+                continue
+
+            for position, top_plugin in enumerate(self.plugins):
+                if position in unlistable or position in indexed:
+                    continue
+
+                if any(step.plugin is plugin for step in top_plugin.get_operation_steps(op_name)):
+                    return position
+
+        return None
+
+    def reindexed_for_plugin(
+            self,
+            plugin: Plugin,
+            cached_operations: Iterable[str],
+            logger: Logger,
+    ) -> tuple['PluginSetSnapshot', set[str]]:
+        """
+        Создаёт следующий снимок с тем же набором плагинов после изменения плагина, не способного перечислить
+        реализуемые операции.
+
+        Индекс операций перестраивается полностью, т.к. изменение могло сделать такими же и содержащие плагин плагины.
+        Из планов же сбрасываются или обновляются только планы операций, в которых плагин участвовал или мог бы
+        участвовать.
+
+        Args:
+            plugin:
+                изменившийся плагин
+            cached_operations:
+                операции, для которых есть закэшированные значения помимо планов
+            logger:
+                логгер
+
+        Returns:
+            новый снимок и множество затронутых операций
+        """
+        affected = {
+            op_name for op_name in chain(self._plans, cached_operations)
+            if (op_name in self._plans and self._plans[op_name].involves(plugin)) or
+            any(True for _ in plugin.get_operation_steps(op_name))
+        }
+
+        index, unlistable = _build_operation_index(self.plugins)
+        snapshot = PluginSetSnapshot(self.version + 1, self.plugins, index, unlistable, {})
+        snapshot._plans = self._updated_plans(snapshot, affected, plugin, logger)
+
+        return snapshot, affected
+
+    def _updated_plans(
+            self,
+            snapshot: 'PluginSetSnapshot',
+            operations: Iterable[str],
+            plugin: Optional[Plugin],
+            logger: Logger,
+    ) -> dict[str, OperationPlan]:
+        """
+        Возвращает планы этого снимка, перенесённые в следующий снимок после изменения шагов заданных операций.
+
+        Шаги плагина, появившегося внутри плагина менеджера, встраиваются в существующие планы, остальные планы
+        заданных операций сбрасываются.
+        """
+        plans = dict(self._plans)
+
+        for op_name in operations:
+            plan = plans.pop(op_name, None)
+
+            if plan is None or plugin is None:
+                continue
+
+            if plan.involves(plugin):
+                # Шаги плагина уже присутствуют в плане, значит плагин был удалён или изменён
+                continue
+
+            container = next(
+                (
+                    top_plugin for top_plugin in snapshot.get_contributing_plugins(op_name)
+                    if any(step.plugin is plugin for step in top_plugin.get_operation_steps(op_name))
+                ),
+                None,
+            )
+
+            if container is None:
+                # Плагин не доступен через зарегистрированные плагины, план не изменился
+                plans[op_name] = plan
+                continue
+
+            new_steps = tuple(plugin.get_operation_steps(op_name))
+
+            if any(plan.has_step(step.name) for step in new_steps):
+                # При полном построении плана вложенный плагин мог бы вытеснить существующий шаг
+                continue
+
+            try:
+                plans[op_name] = plan.with_added_steps(new_steps, None, logger)
+            except DependencyCycleException:
+                # Исключение будет выброшено при построении плана с нуля
+                pass
+
+        return plans
+
+    def with_plugins_added(
+            self,
+            plugins: Iterable[Plugin],
+            logger: Logger,
+            cached_operations: Iterable[str] = (),
+    ) -> tuple['PluginSetSnapshot', set[str]]:
+        """
+        Создаёт следующий снимок с добавленными в конец плагинами.
+
+        Шаги новых плагинов встраиваются в уже построенные планы операций.
+
+        Args:
+            plugins:
+                добавляемые плагины
+            logger:
+                логгер
+            cached_operations:
+                операции, для которых есть закэшированные значения помимо планов. Нужны для определения операций,
+                затронутых плагинами, не способными перечислить реализуемые операции
+
+        Returns:
+            новый снимок и множество затронутых операций
+        """
+        all_plugins = list(self.plugins)
+        index = {op_name: list(positions) for op_name, positions in self._index.items()}
+        unlistable = list(self._unlistable)
+        affected: set[str] = set()
+        plans = dict(self._plans)
+        cached_operations = set(cached_operations)
+
+        for plugin in plugins:
+            position = len(all_plugins)
+            all_plugins.append(plugin)
+
+            operations: Optional[set[str]]
+
+            try:
+                operations = set(plugin.list_implemented_operations())
+            except UnlistableOperationSetException:
+                operations = None
+                unlistable.append(position)
+                affected.update(
+                    op_name for op_name in cached_operations.difference(plans)
+                    if any(True for _ in plugin.get_operation_steps(op_name))
+                )
+            else:
+                for op_name in operations:
+                    index.setdefault(op_name, []).append(position)
+
+                affected.update(operations)
+
+            for op_name, plan in tuple(plans.items()):
+                if operations is not None and op_name not in operations:
+                    continue
+
+                new_steps = tuple(plugin.get_operation_steps(op_name))
+
+                if not new_steps:
+                    continue
+
+                affected.add(op_name)
+
+                try:
+                    plans[op_name] = plan.with_added_steps(new_steps, plugin, logger)
+                except DependencyCycleException:
+                    # Исключение будет выброшено при построении плана с нуля
+                    del plans[op_name]
+
+        return PluginSetSnapshot(
+            self.version + 1,
+            tuple(all_plugins),
+            {op_name: tuple(positions) for op_name, positions in index.items()},
+            tuple(unlistable),
+            plans,
+        ), affected
+
+    def with_plugins_removed(
+            self,
+            plugins: Iterable[Plugin],
+            cached_operations: Iterable[str] = (),
+    ) -> tuple['PluginSetSnapshot', set[str]]:
+        """
+        Создаёт следующий снимок без заданных плагинов.
+
+        Шаги удалённых плагинов удаляются из уже построенных планов операций.
+
+        Args:
+            plugins:
+                удаляемые плагины
+            cached_operations:
+                операции, для которых есть закэшированные значения помимо планов. Нужны для определения операций,
+                затронутых плагинами, не способными перечислить реализуемые операции
+
+        Returns:
+            новый снимок и множество затронутых операций
+        """
+        removed = {id(plugin): plugin for plugin in plugins}
+        new_positions: dict[int, int] = {}
+        remaining: list[Plugin] = []
+
+        for position, plugin in enumerate(self.plugins):
+            if id(plugin) not in removed:
+                new_positions[position] = len(remaining)
+                remaining.append(plugin)
+
+        affected: set[str] = set()
+
+        removed_unlistable = [self.plugins[position] for position in self._unlistable if position not in new_positions]
+
+        if removed_unlistable:
+            affected.update(
+                op_name for op_name in set(cached_operations).difference(self._plans)
+                if any(True for plugin in removed_unlistable for _ in plugin.get_operation_steps(op_name))
+            )
+
+        index: dict[str, tuple[int, ...]] = {}
+
+        for op_name, positions in self._index.items():
+            new_op_positions = tuple(new_positions[p] for p in positions if p in new_positions)
+
+            if len(new_op_positions) != len(positions):
+                affected.add(op_name)
+
+            if new_op_positions:
+                index[op_name] = new_op_positions
+
+        plans: dict[str, OperationPlan] = {}
+
+        for op_name, plan in self._plans.items():
+            new_plan = plan.without_plugins(removed.values())
+
+            if new_plan is not plan:
+                affected.add(op_name)
+
+            if new_plan is not None:
+                plans[op_name] = new_plan
+
+        return PluginSetSnapshot(
+            self.version + 1,
+            tuple(remaining),
+            index,
+            tuple(new_positions[p] for p in self._unlistable if p in new_positions),
+            plans,
+        ), affected
+
+
+class PluginManagerImpl(PluginManager):
+    """
+    Реализация менеджера плагинов.
+
+    Набор плагинов может изменяться во время работы приложения при помощи методов `add_plugins` и `remove_plugins`.
+    Каждое изменение публикует новый неизменяемый снимок набора плагинов (`PluginSetSnapshot`), так что чтение из
+    разных потоков и асинхронных задач не требует блокировок.
+    """
+    __slots__ = ('_snapshot', '_lock', '_logger', '_op_cache', '_stats', '_plan_cache', '_durations')
+
+    def __init__(
+            self,
+            plugins: Collection[Plugin],
+            *,
+            logger=getLogger('PluginManager'),
+            cache_policy: OperationCachePolicy = OperationCachePolicy(),
+            collect_stats: bool = False,
+            plan_cache_file: Optional[Union[str, PathLike]] = None,
+    ):
+        """
+        :param plugins: Изначальный набор плагинов
+        :param logger: Логгер
+        :param cache_policy: Политика вытеснения значений из кэша `operation_cache`
+        :param collect_stats: Собирать ли статистику построения планов и обращений к кэшу (см. `get_stats`)
+        :param plan_cache_file: Путь к файлу, в котором сохраняются порядок и время выполнения шагов операций между
+                    запусками приложения (см. `PlanCacheFile` и `save_plan_cache`)
+        """
+        self._snapshot = PluginSetSnapshot.create(0, plugins)
+        # Блокировка нужна только для изменения набора плагинов, чтение выполняется без неё
+        self._lock = Lock()
+        self._logger = logger
+        self._stats = PluginManagerStats() if collect_stats else None
+        self._op_cache = OperationCache(cache_policy, stats=self._stats)
+        self._plan_cache = PlanCacheFile(plan_cache_file, logger=logger) if plan_cache_file is not None else None
+        self._durations = StepDurations()
+
+        if self._plan_cache is not None:
+            self._durations.update(self._plan_cache.get_step_durations())
+
+    @property
+    def snapshot(self) -> PluginSetSnapshot:
+        """
+        Текущий снимок набора плагинов.
+        """
+        return self._snapshot
+
+    @property
+    def plugins(self) -> tuple[Plugin, ...]:
+        """
+        Плагины, загруженные на данный момент.
+        """
+        return self._snapshot.plugins
+
+    def add_plugins(self, plugins: Iterable[Plugin]) -> PluginSetSnapshot:
+        """
+        Добавляет плагины в конец набора плагинов.
+
+        Операции, уже выполняющиеся с предыдущим снимком, продолжат выполняться с ним.
+
+        Returns:
+            опубликованный снимок набора плагинов
+        """
+        with self._lock:
+            snapshot, affected = self._snapshot.with_plugins_added(plugins, self._logger, self._op_cache.operations())
+            self._publish(snapshot, affected, PluginManagerStats.INVALIDATION_PLUGINS_ADDED)
+
+        return snapshot
 
-        return res
+    def remove_plugins(self, plugins: Iterable[Plugin]) -> PluginSetSnapshot:
+        """
+        Удаляет плагины из набора плагинов.
+
+        Плагины сравниваются по идентичности, плагины, отсутствующие в наборе, игнорируются.
+
+        Returns:
+            опубликованный снимок набора плагинов
+        """
+        with self._lock:
+            snapshot, affected = self._snapshot.with_plugins_removed(plugins, self._op_cache.operations())
+            self._publish(snapshot, affected, PluginManagerStats.INVALIDATION_PLUGINS_REMOVED)
+
+        return snapshot
+
+    def _publish(self, snapshot: PluginSetSnapshot, affected: Collection[str], cause: str):
+        self._replace_snapshot(snapshot)
+        self._invalidate(affected, None, cause)
+
+    def _replace_snapshot(self, snapshot: PluginSetSnapshot):
+        """
+        Публикует новый снимок, помечая планы, не перешедшие в новый снимок, как устаревшие.
+
+        Вызывается с захваченной блокировкой.
+        """
+        new_plans = snapshot._plans
+
+        for op_name, plan in tuple(self._snapshot._plans.items()):
+            if new_plans.get(op_name) is not plan:
+                plan.stale = True
+
+        self._snapshot = snapshot
+
+    def _invalidate(self, operations: Collection[str], keys: Optional[tuple[Hashable, ...]], cause: str):
+        self._op_cache.drop(operations, keys)
+
+        if self._stats is not None:
+            self._stats.record_invalidation(operations, cause)
+
+    def get_stats(self) -> Optional[dict[str, OperationStats]]:
+        """
+        Возвращает статистику, собранную для каждой операции.
+
+        Returns:
+            копию статистики по именам операций или ``None``, если сбор статистики выключен
+        """
+        if self._stats is None:
+            return None
+
+        return self._stats.get()
+
+    def save_plan_cache(self):
+        """
+        Сохраняет порядок шагов построенных планов и время выполнения шагов в файл кэша планов, если он задан.
+        """
+        if self._plan_cache is not None:
+            self._plan_cache.put_step_durations(self._durations.export())
+            self._plan_cache.save()
+
+    def record_step_duration(self, op_name: str, step_name: str, seconds: float):
+        self._durations.record(op_name, step_name, seconds)
+
+    def get_step_durations(self, op_name: str) -> Mapping[str, float]:
+        return self._durations.get(op_name)
+
+    def _check_replaced_snapshot(self, snapshot: PluginSetSnapshot, plans: Mapping[str, OperationPlan]):
+        if snapshot is self._snapshot:
+            return
+
+        # Снимок был заменён во время построения планов - план мог не попасть в новый снимок, и тогда он уже не будет
+        # помечен как устаревший при следующей замене
+        with self._lock:
+            current_plans = self._snapshot._plans
+
+            for op_name, plan in plans.items():
+                if current_plans.get(op_name) is not plan:
+                    plan.stale = True
+
+    def _get_plan(self, op_name: str) -> OperationPlan:
+        snapshot = self._snapshot
+        plan = snapshot.get_plan(op_name, self._logger, self._stats, self._plan_cache)
+        self._check_replaced_snapshot(snapshot, {op_name: plan})
+
+        return plan
+
+    def get_operation_sequence(self, op_name: str) -> Iterable[OperationStep]:
+        return self._get_plan(op_name)
+
+    def get_operation_sequences(self, op_names: Iterable[str]) -> Mapping[str, Iterable[OperationStep]]:
+        snapshot = self._snapshot
+        plans = snapshot.get_plans(op_names, self._logger, self._stats, self._plan_cache)
+        self._check_replaced_snapshot(snapshot, plans)
+
+        return plans
+
+    def get_operation_levels(self, op_name: str) -> Sequence[Sequence[OperationStep]]:
+        return self._get_plan(op_name).levels
+
+    def operation_cache(self, op_name: str, key: Hashable, compute: Callable, /, *args, **kwargs) -> Any:
+        return self._op_cache.get_or_compute(op_name, key, compute, args, kwargs)
+
+    async def aoperation_cache(
+            self,
+            op_name: str,
+            key: Hashable,
+            compute: Callable[..., Awaitable],
+            /,
+            *args,
+            **kwargs,
+    ) -> Any:
+        return await self._op_cache.aget_or_compute(op_name, key, compute, args, kwargs)
 
     def drop_operation_cache(
             self,
@@ -82,34 +699,54 @@ class PluginManagerImpl(PluginManager):
             plugin: Optional[Plugin] = None,
             **_kwargs
     ):
-        op_cache = self._op_cache
-
-        def drop_operation(operation: str):
-            if keys is not None:
-                operation_scope = op_cache.get(operation)
-                if operation_scope is None:
-                    return
-                for key in keys:
-                    del operation_scope[key]
-            else:
-                try:
-                    del op_cache[operation]
-                except KeyError:
-                    pass
+        if keys is not None:
+            keys = tuple(keys)
 
         if operations is not None:
-            for op in operations:
-                drop_operation(op)
+            operations = tuple(operations)
+
+            if keys is None:
+                with self._lock:
+                    self._replace_snapshot(self._snapshot.reindexed(operations, self._logger))
+
+            self._invalidate(operations, keys, PluginManagerStats.INVALIDATION_OPERATION_DROPPED)
             return
 
         if plugin is not None:
             try:
-                operations = plugin.list_implemented_operations()
+                operations = tuple(plugin.list_implemented_operations())
             except UnlistableOperationSetException:
-                pass
+                # Сбрасываем только планы и значения операций, в которых плагин участвовал или может участвовать
+                with self._lock:
+                    snapshot, affected = self._snapshot.reindexed_for_plugin(
+                        plugin, self._op_cache.operations(), self._logger
+                    )
+                    self._replace_snapshot(snapshot)
+
+                self._invalidate(affected, keys, PluginManagerStats.INVALIDATION_PLUGIN_CHANGED)
+                return
             else:
-                for op in operations:
-                    drop_operation(op)
+                # Плагин мог быть добавлен внутрь другого плагина (как это делает PluginDiscoveryPlugin), так что
+                # перестраиваем индекс и планы для всех его операций
+                with self._lock:
+                    self._replace_snapshot(self._snapshot.reindexed(operations, self._logger, plugin))
+
+                self._invalidate(operations, keys, PluginManagerStats.INVALIDATION_PLUGIN_CHANGED)
                 return
 
-        self._op_cache = defaultdict(dict)
+        if keys is not None:
+            # Как и при сбросе ключей заданных операций, сбрасываются только значения `operation_cache` - планы
+            # операций от ключей не зависят и остаются актуальными
+            self._invalidate(tuple(self._op_cache.operations()), keys, PluginManagerStats.INVALIDATION_FULL_DROP)
+            return
+
+        if self._stats is not None:
+            self._stats.record_invalidation(
+                set(self._op_cache.operations()).union(self._snapshot.planned_operations),
+                PluginManagerStats.INVALIDATION_FULL_DROP,
+            )
+
+        self._op_cache.clear()
+
+        with self._lock:
+            self._replace_snapshot(self._snapshot.rebuilt())
@@ -0,0 +1,113 @@
+"""
+Пул процессов для выполнения шагов, требующих значительных вычислительных ресурсов (см. `magic_plugin.cpu_bound`).
+
+Такие шаги, выполняясь в пуле потоков, выполнялись бы по-очереди из-за GIL.
+Пул процессов создаётся приложением (`launch_application` делает это автоматически) и устанавливается как текущий при
+помощи `use_process_executor`. Если текущий пул процессов не установлен, то такие шаги выполняются в пуле потоков, как
+и остальные синхронные шаги.
+
+Процессы пула по-умолчанию запускаются методом forkserver (или spawn, если он недоступен), а не fork: к моменту первого
+использования пула в процессе приложения уже работают потоки executor'а и fork скопировал бы их блокировки в дочерние
+процессы в произвольном состоянии. Поэтому модуль, запускающий приложение, должен быть импортируемым без побочных
+эффектов (запуск приложения под ``if __name__ == '__main__'``).
+"""
+
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from multiprocessing.context import BaseContext
+from typing import Callable, Optional
+
+__all__ = ["LazyProcessPoolExecutor", "get_process_executor", "use_process_executor"]
+
+_current_executor: ContextVar[Optional[Executor]] = ContextVar('_current_process_executor', default=None)
+
+
+def get_process_executor() -> Optional[Executor]:
+    """
+    Возвращает текущий пул процессов или ``None``, если он не установлен.
+    """
+    return _current_executor.get()
+
+
+@contextmanager
+def use_process_executor(executor: Executor):
+    """
+    Устанавливает пул процессов как текущий в рамках контекста.
+
+    Не завершает работу пула процессов при выходе из контекста.
+    """
+    token = _current_executor.set(executor)
+
+    try:
+        yield executor
+    finally:
+        _current_executor.reset(token)
+
+
+def _get_default_mp_context() -> BaseContext:
+    """
+    Возвращает контекст multiprocessing, не использующий fork.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+
+    return multiprocessing.get_context('spawn')
+
+
+class LazyProcessPoolExecutor(Executor):
+    """
+    Пул процессов, создающий процессы только при первом использовании.
+
+    Позволяет не запускать лишние процессы в приложениях, не содержащих шагов, требующих пула процессов.
+    """
+    __slots__ = ('_max_workers', '_mp_context', '_lock', '_executor', '_shut_down')
+
+    def __init__(self, max_workers: Optional[int] = None, mp_context: Optional[BaseContext] = None):
+        """
+        :param max_workers: Максимальное количество процессов. По-умолчанию - количество процессоров
+        :param mp_context: Контекст multiprocessing, используемый для запуска процессов. По-умолчанию - контекст
+            forkserver или spawn, если forkserver недоступен
+        """
+        self._max_workers = max_workers
+        self._mp_context = mp_context if mp_context is not None else _get_default_mp_context()
+        self._lock = Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._shut_down = False
+
+    @property
+    def started(self) -> bool:
+        """
+        Были ли запущены процессы пула.
+        """
+        return self._executor is not None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        executor = self._executor
+
+        if executor is None:
+            with self._lock:
+                if self._shut_down:
+                    raise RuntimeError("Пул процессов уже завершил работу")
+
+                executor = self._executor
+
+                if executor is None:
+                    executor = self._executor = ProcessPoolExecutor(
+                        max_workers=self._max_workers, mp_context=self._mp_context,
+                    )
+
+        return executor
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shut_down = True
+            executor = self._executor
+
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -1,21 +1,51 @@
 """
 Содержит вспомогательные функции для выполнения операций
+
+Все функции принимают шаги операции в виде любой последовательности шагов, но быстрее всего работают с планами операций,
+возвращаемыми `PluginManagerImpl`, и скомпилированными планами (см. `compile_steps`): функции шагов таких планов
+проверяются один раз, а не при каждом выполнении операции.
 """
 
 import asyncio
+import contextvars
+import heapq
+import pickle
+import threading
 from functools import partial
-from typing import Any, Collection, Iterable
+from itertools import count
+from logging import getLogger
+from time import perf_counter
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Collection, Coroutine, Iterable, Mapping, NamedTuple, \
+    Optional, Sequence, Union
 
-from ab_plugin_manager.abc import OperationStep
+from ab_plugin_manager.abc import OperationStep, PluginManager
+from ab_plugin_manager.compiled_plan import compile_steps, CompiledPlan, CompiledStep
+from ab_plugin_manager.process_executor import get_process_executor
 
 __all__ = [
     "call_all",
+    "call_all_async",
+    "call_all_collect",
+    "call_all_as_completed_async",
+    "call_all_as_pipeline_async",
+    "call_all_as_concurrent_pipeline_async",
     "call_all_as_wrappers",
     "call_all_as_wrappers_async",
     "call_all_parallel_async",
+    "call_all_scheduled_async",
+    "SchedulerPolicy",
+    "StepFuture",
+    "gather_steps",
     "call_until_first_result",
+    "call_until_first_result_async",
+    "call_until_fastest_result_async",
 ]
 
+_logger = getLogger('run_operation')
+
+# Имена ресурсоёмких шагов, которые не удалось передать в пул процессов, что бы предупреждение выводилось один раз
+_unpicklable_steps: set[str] = set()
+
 
 def call_all(steps: Iterable[OperationStep], *args, **kwargs):
     """
@@ -29,13 +59,90 @@ def call_all(steps: Iterable[OperationStep], *args, **kwargs):
         **kwargs:
             именованные аргументы для вызова шагов
     Raises:
-        TypeError - если один из шагов не является функцией
+        TypeError - если один из шагов не является функцией. В этом случае ни один из шагов не выполняется
+    """
+    for fn in compile_steps(steps).functions:
+        fn(*args, **kwargs)
+
+
+def call_all_collect(steps: Iterable[OperationStep], *args, **kwargs) -> list:
+    """
+    Выполняет все шаги операции последовательно и возвращает их результаты.
+
+    Args:
+        steps:
+            шаги операции
+        *args:
+            позиционные аргументы для вызова шагов
+        **kwargs:
+            именованные аргументы для вызова шагов
+
+    Returns:
+        результаты шагов в порядке выполнения
+    Raises:
+        TypeError - если один из шагов не является функцией. В этом случае ни один из шагов не выполняется
+    """
+    return [fn(*args, **kwargs) for fn in compile_steps(steps).functions]
+
+
+async def call_all_async(steps: Iterable[OperationStep], *args, **kwargs):
+    """
+    Выполняет все синхронные шаги операции последовательно, не блокируя event loop.
+
+    Шаги выполняются в executor'е текущего event loop'а, а шаги, требующие значительных вычислительных ресурсов (см.
+    `ab_plugin_manager.magic_plugin.cpu_bound`) - в текущем пуле процессов, если он установлен.
+
+    Args:
+        steps:
+            шаги операции
+        *args:
+            позиционные аргументы для вызова шагов
+        **kwargs:
+            именованные аргументы для вызова шагов
+    Raises:
+        TypeError - если один из шагов не является функцией. В этом случае ни один из шагов не выполняется
     """
-    for step in steps:
-        if not callable(step.step):
-            raise TypeError(f"Шаг {step} не является функцией")
+    compiled = compile_steps(steps)
 
-        step.step(*args, **kwargs)
+    if not compiled.has_cpu_bound or get_process_executor() is None:
+        # Все шаги выполняются одной задачей в потоке
+        await asyncio.to_thread(call_all, compiled, *args, **kwargs)
+        return
+
+    for call in compiled.calls:
+        await _run_sync_step(call, args, kwargs)
+
+
+async def _run_sync_step(call: CompiledStep, args: tuple, kwargs: dict) -> Any:
+    """
+    Выполняет синхронный шаг в пуле процессов (если шаг этого требует и пул доступен) или в пуле потоков.
+
+    Перед передачей в пул процессов проверяется, что функция шага и аргументы могут быть сериализованы. Если это
+    невозможно (например, шаг является методом плагина, объявленного внутри функции), то шаг выполняется в пуле потоков,
+    а в лог выводится предупреждение. Иначе ошибка сериализации возникла бы уже в пуле процессов, и её нельзя было бы
+    отличить от ошибки самого шага. Проверка выполняется в пуле потоков, что бы сериализация больших аргументов не
+    блокировала цикл событий.
+    """
+    fn = partial(call.call, *args, **kwargs)
+
+    if call.cpu_bound:
+        executor = get_process_executor()
+
+        if executor is not None:
+            try:
+                await asyncio.to_thread(pickle.dumps, fn)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                name = call.step.name
+
+                if name not in _unpicklable_steps:
+                    _unpicklable_steps.add(name)
+                    _logger.warning(
+                        "Шаг %s не может быть выполнен в пуле процессов и будет выполнен в пуле потоков: %s", name, e,
+                    )
+            else:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn)
+
+    return await asyncio.to_thread(fn)
 
 
 def call_until_first_result(steps: Iterable[OperationStep], *args, **kwargs):
@@ -53,18 +160,119 @@ def call_until_first_result(steps: Iterable[OperationStep], *args, **kwargs):
     Returns:
         результат, возвращённый одним из шагов операции или None если ни один из шагов не вернул значение
     Raises:
-        TypeError - если какой-то из шагов не является функцией
+        TypeError - если какой-то из шагов не является функцией. В этом случае ни один из шагов не выполняется
     """
-    for step in steps:
-        if not callable(step.step):
-            raise TypeError(f"Шаг {step} не является функцией")
-
-        result = step.step(*args, **kwargs)
+    for fn in compile_steps(steps).functions:
+        result = fn(*args, **kwargs)
 
         if result is not None:
             return result
 
 
+async def _cancel_candidates(futures: Collection['StepFuture']):
+    """
+    Отменяет шаги, результат которых больше не нужен, и дожидается завершения их отмены.
+
+    Синхронные шаги, уже начавшие выполняться в executor'е, не прерываются, но их результат игнорируется.
+    """
+    for future in futures:
+        future.cancel()
+
+    # Результаты и ошибки отменённых шагов не нужны, но их нужно получить, что бы они не попадали в лог
+    await asyncio.gather(*futures, return_exceptions=True)
+
+
+async def call_until_first_result_async(steps: Iterable[OperationStep], *args, **kwargs) -> Any:
+    """
+    Асинхронный вариант `call_until_first_result`, выполняющий шаги спекулятивно.
+
+    Шаги запускаются параллельно, как в `call_all_parallel_async` (каждый шаг - после завершения его зависимостей), но
+    результат выбирается так же, как в `call_until_first_result`: возвращается результат первого (в порядке выполнения)
+    шага, вернувшего не None. Как только он становится известен, остальные шаги отменяются. Если какой-то из шагов,
+    предшествующих такому шагу, завершился с ошибкой, то выбрасывается эта ошибка.
+
+    Синхронные шаги выполняются в executor'е. Т.к. все шаги могут выполняться, даже если их результат не будет
+    использован, функция подходит только для шагов без побочных эффектов.
+
+    Args:
+        steps:
+            шаги операции
+        *args:
+            позиционные аргументы для вызова шагов
+        **kwargs:
+            именованные аргументы для вызова шагов
+
+    Returns:
+        результат, возвращённый одним из шагов операции или None если ни один из шагов не вернул значение
+    Raises:
+        TypeError - если какой-то из шагов не является функцией. В этом случае ни один из шагов не выполняется
+    """
+    futures = await call_all_parallel_async(steps, *args, **kwargs)
+
+    try:
+        for future in futures:
+            result = await future
+
+            if result is not None:
+                return result
+    finally:
+        await _cancel_candidates(futures)
+
+
+async def call_until_fastest_result_async(steps: Iterable[OperationStep], *args, **kwargs) -> Any:
+    """
+    Вариант `call_until_first_result_async`, возвращающий первый полученный результат.
+
+    Шаги запускаются так же, как в `call_until_first_result_async`, возвращается первый полученный результат, отличный
+    от None, независимо от положения вернувшего его шага в плане операции. Остальные шаги отменяются. Если несколько
+    шагов завершились одновременно, то предпочтение отдаётся шагу, идущему раньше в порядке выполнения.
+    Ошибка одного из шагов не прерывает ожидание остальных: результат может вернуть другой, более медленный шаг.
+    Если ни один из шагов не вернул результат, то выбрасывается первая из возникших ошибок.
+
+    Args:
+        steps:
+            шаги операции
+        *args:
+            позиционные аргументы для вызова шагов
+        **kwargs:
+            именованные аргументы для вызова шагов
+
+    Returns:
+        результат, возвращённый одним из шагов операции или None если ни один из шагов не вернул значение
+    Raises:
+        TypeError - если какой-то из шагов не является функцией. В этом случае ни один из шагов не выполняется
+        Exception - первая ошибка, возникшая при выполнении шагов, если ни один из шагов не вернул результат
+    """
+    futures = await call_all_parallel_async(steps, *args, **kwargs)
+    order = {future: i for i, future in enumerate(futures)}
+    pending = set(futures)
+    error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for future in sorted(done, key=order.__getitem__):
+                if future.cancelled():
+                    continue
+
+                if (exception := future.exception()) is not None:
+                    # Ошибка зависимости передаётся и зависимым шагам, сохраняется только первая
+                    if error is None:
+                        error = exception
+                    continue
+
+                if (result := future.result()) is not None:
+                    return result
+    finally:
+        await _cancel_candidates(futures)
+
+    if error is not None:
+        raise error
+
+    return None
+
+
 def call_all_as_wrappers(steps: Iterable[OperationStep], initial: Any, *args, **kwargs) -> Any:
     """
     Вызывает все шаги, предоставляя возможность каждому шагу получать доступ как к промежуточным результатам выполнения
@@ -112,84 +320,898 @@ def call_all_as_wrappers(steps: Iterable[OperationStep], initial: Any, *args, **
     Returns:
         результат работы операции
     """
+    return compile_steps(steps).wrapper_chain(initial, *args, **kwargs)
 
-    def _call_wrapper(s: Collection[OperationStep], prev, *a, **kw):
-        if len(s) == 0:
-            return prev
 
-        step, *rest = s
+async def call_all_as_wrappers_async(steps: Iterable[OperationStep], initial: Any, *args, **kwargs) -> Any:
+    """
+    Асинхронный вариант `call_all_as_wrappers`.
 
-        return step.step(partial(_call_wrapper, rest), prev, *a, **kw)
+    Все шаги должны быть асинхронными функциями, функция ``nxt``, передаваемая шагу, так же асинхронная:
 
-    return _call_wrapper(tuple(steps), initial, *args, **kwargs)
+    >>> async def create_something(nxt, prev, *args, **kwargs):
+    >>>     return wrap_result(await nxt(crete_my_object(prev), *args, **kwargs))
 
+    Args:
+        steps:
+            шаги операции
+        initial:
+            начальное значение
+        *args:
+            дополнительные позиционные аргументы
+        **kwargs:
+            дополнительные именованные аргументы
 
-async def call_all_as_wrappers_async(steps: Iterable[OperationStep], initial: Any, *args, **kwargs) -> Any:
-    # TODO: Add docstring
-    async def _call_wrapper(s: Collection[OperationStep], prev, *a, **kw):
-        if len(s) == 0:
-            return prev
+    Returns:
+        результат работы операции
+    Raises:
+        TypeError - если какой-то из шагов не является асинхронной функцией. В этом случае ни один из шагов не
+        выполняется
+    """
+    return await compile_steps(steps).async_wrapper_chain(initial, *args, **kwargs)
+
+
+def _call_chain(
+        functions: Sequence[Callable],
+        cancelled: Sequence[threading.Event],
+        args: tuple,
+        kwargs: dict,
+        durations: Optional[list[float]] = None,
+) -> tuple[list, Optional[Exception]]:
+    """
+    Вызывает функции по-очереди до первой ошибки или до первой отменённой функции.
+
+    Каждая функция вызывается в своей копии текущего контекста (см. `contextvars`), как если бы она выполнялась в
+    executor'е отдельно, так что изменения контекстных переменных, сделанные одной функцией, не видны следующим.
+
+    Args:
+        cancelled:
+            признаки отмены для каждой функции. Функция, признак отмены которой установлен, и все следующие функции не
+            вызываются
+        durations:
+            если задан, то в этот список добавляется время выполнения каждой успешно выполненной функции в секундах
+
+    Returns:
+        результаты успешно выполненных функций и ошибку, с которой завершилась следующая функция
+    """
+    results = []
+
+    for fn, fn_cancelled in zip(functions, cancelled):
+        if fn_cancelled.is_set():
+            break
+
+        started = perf_counter()
 
-        step, *rest = s
-        callback = partial(_call_wrapper, rest)
+        try:
+            results.append(contextvars.copy_context().run(fn, *args, **kwargs))
+        except Exception as e:
+            return results, e
+
+        if durations is not None:
+            durations.append(perf_counter() - started)
+
+    return results, None
 
-        assert asyncio.iscoroutinefunction(step.step), f"Шаг {step} не является асинхронной функцией"
-        return await step.step(callback, prev, *a, **kw)
 
-    return await _call_wrapper(tuple(steps), initial, *args, **kwargs)
+class StepFuture(asyncio.Future):
+    """
+    Future шага операции, запущенной при помощи `call_all_parallel_async` или `call_all_scheduled_async`.
 
+    Создаётся для каждого шага сразу, а Task для выполнения шага - только когда все зависимости шага выполнены.
+    Завершается вместе с Task'ом шага, результат - значение, возвращённое шагом.
+    Если какая-то из зависимостей шага завершилась с ошибкой, то шаг не выполняется, а его Future завершается с той же
+    ошибкой. Если какая-то из зависимостей шага отменена, то шаг так же отменяется.
 
-async def call_all_parallel_async(steps: Iterable[OperationStep], *args, **kwargs) -> Collection[asyncio.Task]:
+    Как и Task, имеет имя (имя шага) и может быть отменён, при этом, если шаг уже выполняется, то отменяется его Task, а
+    Future завершается отменённым только после завершения Task'а, даже если шаг подавил отмену.
+    Если шаг выполняется в составе цепочки синхронных шагов (см. `call_all_parallel_async`), то Future отменяется сразу,
+    а сам шаг и следующие шаги цепочки не вызываются. Функция шага, которая уже выполняется, не прерывается, но её
+    результат игнорируется. Результаты предыдущих шагов цепочки сохраняются.
     """
-    Подготавливает Task'и для параллельного асинхронного запуска шагов в текущем Event Loop'е (и его executor'е).
+    __slots__ = ('_name', '_graph', '_task', '_chain_cancelled')
+
+    def __init__(self, name: str, graph: '_StepGraph', *, loop: asyncio.AbstractEventLoop):
+        super().__init__(loop=loop)
+        self._name = name
+        self._graph = graph
+        self._task: Optional[asyncio.Task] = None
+        # Признак отмены, проверяемый перед вызовом шага, если шаг выполняется в составе цепочки синхронных шагов
+        self._chain_cancelled: Optional[threading.Event] = None
+
+    def get_name(self) -> str:
+        return self._name
+
+    def cancel(self, msg: Any = None) -> bool:
+        task = self._task
+
+        if task is not None and self._chain_cancelled is None:
+            return not self.done() and task.cancel(msg)
+
+        if not self._cancel_pending(msg):
+            return False
+
+        self._graph.step_finished(self._name, True, None)
+
+        return True
+
+    def _cancel_pending(self, msg: Any = None) -> bool:
+        """
+        Отменяет Future шага, который ещё не запущен или выполняется в составе цепочки синхронных шагов, не затрагивая
+        зависимые шаги.
+        """
+        if not super().cancel(msg):
+            return False
+
+        if self._chain_cancelled is not None:
+            self._chain_cancelled.set()
+
+        return True
+
+    def __repr__(self):
+        return f'<StepFuture {self._name} {self._state}>'
+
+
+class _StepGraph:
+    """
+    Запускает шаги операции по мере выполнения их зависимостей.
+
+    Для каждого шага хранится количество ещё не выполненных зависимостей. Task шага создаётся, когда оно становится
+    равным нулю, так что шаги, ожидающие выполнения зависимостей, не занимают ресурсов event loop'а.
+
+    Если задана функция выполнения цепочек синхронных шагов (``run_chain``), то цепочки зависящих друг от друга
+    синхронных шагов, ни от одного из которых (кроме последнего) не зависят другие шаги, выполняются одним Task'ом.
+    Функция выполнения цепочки возвращает результаты успешно выполненных шагов и ошибку, с которой завершился следующий
+    шаг (если такой есть).
+
+    Поведение при ошибках шагов определяется параметром ``fail_fast`` (см. `SchedulerPolicy.fail_fast`).
+    """
+    __slots__ = (
+        '_loop', '_run_step', '_run_chain', '_fail_fast', '_calls', '_chains', '_futures', '_remaining',
+        '_successors',
+    )
+
+    def __init__(
+            self,
+            compiled: CompiledPlan,
+            run_step: Callable[[CompiledStep], Coroutine],
+            run_chain: Optional[Callable[[Sequence[CompiledStep], Sequence[threading.Event]], Coroutine]] = None,
+            fail_fast: Optional[str] = None,
+    ):
+        self._loop = loop = asyncio.get_running_loop()
+        self._run_step = run_step
+        self._run_chain = run_chain
+        self._fail_fast = fail_fast
+        self._calls = calls = {call.step.name: call for call in compiled.calls}
+
+        if len(calls) != len(compiled.calls):
+            # Шаги и зависимости идентифицируются именами, так что шаг с повторяющимся именем был бы потерян
+            duplicates = sorted({
+                call.step.name for call in compiled.calls if calls[call.step.name] is not call
+            })
+            raise ValueError(f"Повторяющиеся имена шагов: {', '.join(duplicates)}")
+
+        self._futures = {name: StepFuture(name, self, loop=loop) for name in calls}
+
+        dependencies = compiled.dependencies
+        self._remaining = {name: len(dependencies[name]) for name in calls}
+        self._successors: dict[str, list[str]] = {name: [] for name in calls}
+
+        for name, deps in dependencies.items():
+            for dep in deps:
+                self._successors[dep].append(name)
+
+        self._chains = self._find_sync_chains(dependencies) if run_chain is not None else {}
+
+    def _find_sync_chains(self, dependencies: Mapping[str, Collection[str]]) -> dict[str, list[CompiledStep]]:
+        """
+        Находит цепочки из нескольких синхронных шагов, которые можно выполнить одним Task'ом.
+
+        Returns:
+            шаги цепочек по именам первых шагов цепочек
+        """
+        chains: dict[str, list[CompiledStep]] = {}
+        # Имена первых шагов цепочек по именам последних шагов
+        heads: dict[str, str] = {}
+
+        # Шаги перебираются в порядке выполнения, так что зависимость шага всегда просмотрена раньше самого шага
+        for name, call in self._calls.items():
+            if call.is_async or call.cpu_bound:
+                continue
+
+            deps = dependencies[name]
+
+            if len(deps) == 1:
+                (dep,) = deps
+                head = heads.pop(dep, None)
+
+                if head is not None and len(self._successors[dep]) == 1:
+                    chains[head].append(call)
+                    heads[name] = head
+                    continue
+
+            chains[name] = [call]
+            heads[name] = name
+
+        return {head: chain for head, chain in chains.items() if len(chain) > 1}
+
+    def start(self, order: Iterable[str]) -> Collection[StepFuture]:
+        """
+        Запускает шаги, не имеющие зависимостей.
+
+        Args:
+            order:
+                имена шагов в порядке, в котором их следует запускать
+
+        Returns:
+            Future'ы всех шагов в порядке выполнения
+        """
+        for name in order:
+            if self._remaining[name] == 0:
+                self._launch(name)
+
+        return list(self._futures.values())
+
+    def _launch(self, name: str):
+        future = self._futures[name]
+
+        if future.done():
+            return
+
+        chain = self._chains.get(name)
+
+        if chain is not None:
+            futures = [self._futures[call.step.name] for call in chain]
+
+            # Шаги цепочки могли быть отменены до её запуска, вместе с ними отменены и все последующие шаги цепочки
+            for i, chain_future in enumerate(futures):
+                if chain_future.done():
+                    del chain[i:], futures[i:]
+                    break
+
+            cancelled = [threading.Event() for _ in chain]
+            task = self._loop.create_task(self._run_chain(chain, cancelled), name=name)
+
+            for chain_future, chain_cancelled in zip(futures, cancelled):
+                chain_future._task = task
+                chain_future._chain_cancelled = chain_cancelled
+
+            task.add_done_callback(partial(self._chain_done, futures))
+            return
+
+        # Если у event loop'а установлена фабрика eager task'ов (`asyncio.eager_task_factory`), то шаг начинает
+        # выполняться сразу, а шаги, не приостанавливающиеся во время выполнения, завершаются без лишних итераций цикла
+        task = self._loop.create_task(self._run_step(self._calls[name]), name=name)
+        future._task = task
+        task.add_done_callback(partial(self._task_done, future))
+
+    def _chain_done(self, futures: list[StepFuture], task: asyncio.Task):
+        # Шаг цепочки, отменённый во время её выполнения, уже завершён вместе со всеми последующими шагами цепочки, так
+        # что незавершёнными остаются только шаги в начале цепочки
+        pending = [future for future in futures if not future.done()]
+
+        if not pending:
+            return
+
+        if task.cancelled() or task.exception() is not None or self._cancel_requested(task):
+            # Ошибка или отмена распространяется по остальным шагам цепочки так же, как и по остальным зависимым шагам
+            self._task_done(pending[0], task)
+            return
+
+        results, error = task.result()
+        completed = len(results)
+
+        for future, result in zip(pending, results):
+            future.set_result(result)
+
+        if completed < len(pending):
+            pending[completed].set_exception(error)
+            self.step_finished(pending[completed].get_name(), False, error)
+        else:
+            # От остальных шагов цепочки зависят только следующие шаги цепочки, которые уже завершены
+            self.step_finished(pending[-1].get_name(), False, None)
+
+    @staticmethod
+    def _cancel_requested(task: asyncio.Task) -> bool:
+        # Шаг может подавить отмену и завершиться успешно, но его Future всё равно должен быть отменён, т.к. отмена
+        # уже подтверждена методом `StepFuture.cancel`
+        return task.cancelling() > 0
+
+    def _task_done(self, future: StepFuture, task: asyncio.Task):
+        if task.cancelled() or self._cancel_requested(task):
+            future._cancel_pending()
+            self.step_finished(future.get_name(), True, None)
+        elif (error := task.exception()) is not None:
+            future.set_exception(error)
+            self.step_finished(future.get_name(), False, error)
+        else:
+            future.set_result(task.result())
+            self.step_finished(future.get_name(), False, None)
+
+    def step_finished(self, name: str, cancelled: bool, error: Optional[BaseException]):
+        """
+        Обновляет состояние зависимых шагов после завершения шага.
+        """
+        if error is not None and self._fail_fast is not None:
+            if self._fail_fast == SchedulerPolicy.FAIL_FAST_ALL:
+                self._abort()
+                return
+
+            # Зависимые шаги отменяются, так что ошибка сообщается только для шага, в котором она возникла
+            cancelled, error = True, None
+
+        # Отмена и ошибки распространяются по графу без рекурсии, т.к. графы бывают очень глубокими
+        finished = [name]
+
+        while finished:
+            for succ in self._successors[finished.pop()]:
+                succ_future = self._futures[succ]
+
+                if succ_future.done():
+                    continue
 
-    NOTE: Полученные Task'и нужно заawait'ить. Как правило, для этого можно использовать ``asyncio.gather``:
+                if cancelled:
+                    succ_future._cancel_pending()
+                    finished.append(succ)
+                elif error is not None:
+                    succ_future.set_exception(error)
+                    finished.append(succ)
+                else:
+                    remaining = self._remaining[succ] = self._remaining[succ] - 1
+
+                    if remaining == 0:
+                        self._launch(succ)
+
+    def _abort(self):
+        """
+        Отменяет все незавершённые шаги.
+        """
+        running: list[asyncio.Task] = []
+
+        # Сначала отменяются шаги, которые ещё не запущены, что бы отмена выполняющихся шагов не запустила зависимые
+        # шаги. Шаги цепочек синхронных шагов отменяются так же, как и не запущенные шаги: задание цепочки проверяет
+        # признак отмены перед вызовом каждого шага, так что ещё не вызванные шаги цепочки не выполняются
+        for future in self._futures.values():
+            if not future.done():
+                if future._task is None or future._chain_cancelled is not None:
+                    future._cancel_pending()
+                else:
+                    running.append(future._task)
+
+        for task in running:
+            task.cancel()
+
+
+async def call_all_parallel_async(steps: Iterable[OperationStep], *args, **kwargs) -> Collection[StepFuture]:
+    """
+    Запускает шаги параллельно и асинхронно в текущем Event Loop'е (и его executor'е).
+
+    NOTE: Полученные Future'ы (см. `StepFuture`) нужно заawait'ить. Как правило, для этого можно использовать
+    ``asyncio.gather``:
 
     >>> await asyncio.gather(*await call_all_parallel_async(...))
 
     Если шаг является асинхронной функцией, то он запускается в текущем event loop'е, если не асинхронной - то он
     запускается в executor'е, связанном с текущим event loop'ом.
 
-    Независимые шаги запускаются параллельно.
+    Независимые шаги запускаются параллельно, остальные - по мере выполнения их зависимостей.
+    Цепочки зависящих друг от друга синхронных шагов, ни от одного из которых (кроме последнего) не зависят другие шаги,
+    выполняются в executor'е одним заданием, а не по одному шагу.
 
     Args:
         steps:
             последовательность шагов.
         *args, **kwargs:
             аргументы, с которыми будут вызваны шаги
+    Raises:
+        TypeError - если какой-то из шагов не является функцией. В этом случае ни один из шагов не выполняется
+        ValueError - если имена шагов повторяются. В этом случае ни один из шагов не выполняется
     """
-    loop = asyncio.get_running_loop()
+    compiled = compile_steps(steps)
 
-    steps_list: list[OperationStep] = list(steps)
+    async def _run_step(call: CompiledStep):
+        if call.is_async:
+            return await call.call(*args, **kwargs)
+        else:
+            return await _run_sync_step(call, args, kwargs)
 
-    dependencies: dict[str, set[str]] = {step.name: set(step.dependencies) for step in steps_list}
+    async def _run_chain(
+            calls: Sequence[CompiledStep],
+            cancelled: Sequence[threading.Event],
+    ) -> tuple[list, Optional[Exception]]:
+        return await asyncio.to_thread(_call_chain, [call.call for call in calls], cancelled, args, kwargs)
 
-    for step in steps_list:
-        if not callable(step.step):
-            raise TypeError(
-                f"Неподдерживаемый тип шага {step}: {type(step.step)}"
-            )
+    return _StepGraph(compiled, _run_step, _run_chain).start(step.name for step in compiled.steps)
 
-        for r_dep in step.reverse_dependencies:
-            if r_dep in dependencies:
-                dependencies[r_dep].add(step.name)
 
-    tasks: dict[str, asyncio.Task] = {}
+async def call_all_as_completed_async(steps: Iterable[OperationStep], *args, **kwargs) -> AsyncIterator[StepFuture]:
+    """
+    Запускает шаги так же, как `call_all_parallel_async`, и возвращает Future'ы шагов по мере их завершения.
 
-    async def _run_step(step: OperationStep):
-        await asyncio.gather(*[tasks[dep] for dep in dependencies[step.name] if dep in tasks])
+    Результат Future'а - значение, возвращённое шагом. Future'ы шагов, завершившихся с ошибкой, так же возвращаются.
 
-        try:
-            if asyncio.iscoroutinefunction(step.step):
-                await step.step(*args, **kwargs)
+    Если итерация прерывается до получения всех Future'ов, то незавершённые шаги отменяются. Что бы это происходило
+    сразу, а не при сборке мусора, итератор стоит закрывать явно:
+
+    >>> async with contextlib.aclosing(call_all_as_completed_async(steps)) as completed:
+    >>>     async for future in completed:
+    >>>         ...
+
+    Args:
+        steps:
+            последовательность шагов.
+        *args, **kwargs:
+            аргументы, с которыми будут вызваны шаги
+    """
+    futures = await call_all_parallel_async(steps, *args, **kwargs)
+    completed: asyncio.Queue[StepFuture] = asyncio.Queue()
+
+    for future in futures:
+        future.add_done_callback(completed.put_nowait)
+
+    try:
+        for _ in range(len(futures)):
+            yield await completed.get()
+    finally:
+        for future in futures:
+            future.cancel()
+
+        # Ошибки шагов, Future'ы которых не были получены, не нужны, но их нужно получить, что бы они не попадали в лог
+        await asyncio.gather(*futures, return_exceptions=True)
+
+
+class SchedulerPolicy(NamedTuple):
+    """
+    Ограничения на выполнение шагов операции в `call_all_scheduled_async`.
+
+    По-умолчанию ограничений нет.
+    """
+    max_concurrency: Optional[int] = None
+    """
+    Максимальное количество одновременно выполняющихся шагов.
+    """
+
+    max_threads: Optional[int] = None
+    """
+    Максимальное количество одновременно выполняющихся синхронных шагов (выполняющихся в потоках executor'а).
+    """
+
+    max_async: Optional[int] = None
+    """
+    Максимальное количество одновременно выполняющихся асинхронных шагов.
+    """
+
+    step_durations: Optional[Mapping[str, float]] = None
+    """
+    Ожидаемое время выполнения шагов в секундах по именам шагов.
+
+    Если задано, то из ожидающих шагов с одинаковым приоритетом первыми запускаются шаги, лежащие на самом длинном (по
+    ожидаемому времени) оставшемся пути графа зависимостей.
+    Для шагов, время которых неизвестно, используется среднее время известных шагов.
+    """
+
+    on_step_finished: Optional[Callable[[str, float], None]] = None
+    """
+    Функция, вызываемая с именем шага и временем его выполнения в секундах после успешного завершения каждого шага.
+    """
+
+    fail_fast: Optional[str] = None
+    """
+    Поведение при ошибке в одном из шагов.
+
+    По-умолчанию шаги, зависящие от шага, завершившегося с ошибкой, не выполняются, а их Future'ы завершаются с той же
+    ошибкой; остальные шаги продолжают выполняться.
+
+    - `FAIL_FAST_DEPENDENTS` - шаги, зависящие от шага, завершившегося с ошибкой, отменяются;
+    - `FAIL_FAST_ALL` - отменяются все незавершённые шаги операции, в том числе уже выполняющиеся.
+
+    В обоих случаях ошибка сообщается только Future'ом шага, в котором она возникла, так что `gather_steps` выбрасывает
+    ``ExceptionGroup`` только с исходными ошибками.
+    """
+
+    FAIL_FAST_DEPENDENTS = 'dependents'
+    FAIL_FAST_ALL = 'all'
+
+    def with_recorded_durations(self, manager: PluginManager, op_name: str) -> 'SchedulerPolicy':
+        """
+        Возвращает копию политики, использующую время выполнения шагов, записанное менеджером плагинов, и записывающую
+        время выполнения шагов в менеджер плагинов (см. `PluginManager.record_step_duration`).
+        """
+        return self._replace(
+            step_durations=manager.get_step_durations(op_name),
+            on_step_finished=partial(manager.record_step_duration, op_name),
+        )
+
+
+def _critical_path_ranks(compiled: CompiledPlan, durations: Mapping[str, float]) -> dict[str, float]:
+    """
+    Вычисляет для каждого шага ожидаемое время выполнения самого длинного пути от начала шага до завершения операции.
+    """
+    dependencies = compiled.dependencies
+    successors: dict[str, list[str]] = {name: [] for name in dependencies}
+
+    for name, deps in dependencies.items():
+        for dep in deps:
+            successors[dep].append(name)
+
+    known = [duration for name, duration in durations.items() if name in dependencies]
+    default_duration = sum(known) / len(known) if known else 0.0
+
+    ranks: dict[str, float] = {}
+
+    # Шаги, переданные напрямую, не обязаны быть упорядочены по зависимостям, поэтому ранги вычисляются обходом в
+    # глубину с запоминанием.
+    # Шаги, находящиеся на текущем пути обхода, считаются имеющими нулевой ранг, что защищает от зацикливания.
+    for root in dependencies:
+        if root in ranks:
+            continue
+
+        ranks[root] = 0.0
+        stack = [(root, iter(successors[root]))]
+
+        while stack:
+            name, succ_iter = stack[-1]
+
+            for succ in succ_iter:
+                if succ not in ranks:
+                    ranks[succ] = 0.0
+                    stack.append((succ, iter(successors[succ])))
+                    break
             else:
-                await asyncio.to_thread(
-                    partial(step.step, *args, **kwargs),
+                stack.pop()
+                ranks[name] = durations.get(name, default_duration) + max(
+                    (ranks[succ] for succ in successors[name]), default=0.0,
                 )
+
+    return ranks
+
+
+class _Limiter:
+    """
+    Выдаёт разрешения на запуск шагов с учётом ограничений политики, в порядке приоритета шагов.
+    """
+    __slots__ = ('_policy', '_running', '_running_by_kind', '_waiting', '_seq')
+
+    # Элементы очередей: (-приоритет, -ранг, порядковый номер, future, признак асинхронности)
+
+    def __init__(self, policy: SchedulerPolicy):
+        self._policy = policy
+        self._running = 0
+        # Индекс - признак асинхронности шага
+        self._running_by_kind = [0, 0]
+        self._waiting: tuple[list, list] = ([], [])
+        self._seq = count()
+
+    def _kind_has_capacity(self, is_async: bool) -> bool:
+        limit = self._policy.max_async if is_async else self._policy.max_threads
+
+        return limit is None or self._running_by_kind[is_async] < limit
+
+    def _dispatch(self):
+        max_concurrency = self._policy.max_concurrency
+
+        while max_concurrency is None or self._running < max_concurrency:
+            best: Optional[list] = None
+
+            for is_async in (False, True):
+                heap = self._waiting[is_async]
+
+                while heap and heap[0][3].done():
+                    # Ожидавший шаг был отменён
+                    heapq.heappop(heap)
+
+                if heap and self._kind_has_capacity(is_async) and (best is None or heap[0] < best[0]):
+                    best = heap
+
+            if best is None:
+                return
+
+            *_, future, is_async = heapq.heappop(best)
+            self._running += 1
+            self._running_by_kind[is_async] += 1
+            future.set_result(None)
+
+    async def acquire(self, is_async: bool, priority: int, rank: float = 0.0):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting[is_async], (-priority, -rank, next(self._seq), future, is_async))
+        self._dispatch()
+
+        try:
+            await future
         except asyncio.CancelledError:
-            pass
+            if future.done() and not future.cancelled():
+                self.release(is_async)
+
+            raise
+
+    def release(self, is_async: bool):
+        self._running -= 1
+        self._running_by_kind[is_async] -= 1
+        self._dispatch()
+
+
+async def call_all_scheduled_async(
+        steps: Iterable[OperationStep],
+        policy: SchedulerPolicy,
+        /,
+        *args,
+        **kwargs,
+) -> Collection[StepFuture]:
+    """
+    Вариант `call_all_parallel_async`, ограничивающий количество одновременно выполняющихся шагов.
+
+    Шаги, все зависимости которых выполнены, ожидают возможности запуска в соответствии с ограничениями политики.
+    Из ожидающих шагов первыми запускаются шаги с большим приоритетом (см. `ab_plugin_manager.magic_plugin.priority`),
+    шаги с одинаковым приоритетом - в порядке убывания длины оставшегося критического пути, если задано ожидаемое время
+    выполнения шагов (`SchedulerPolicy.step_durations`), и в порядке готовности.
+
+    Как и в `call_all_parallel_async`, цепочки синхронных шагов выполняются в executor'е одним заданием. Такое задание
+    запрашивает запуск один раз, с приоритетом и рангом первого шага цепочки, и занимает один поток.
+    Если политика не ограничивает количество одновременно выполняющихся шагов, то шаги запускаются сразу, без очереди.
+
+    NOTE: Полученные Future'ы нужно заawait'ить.
+
+    Args:
+        steps:
+            последовательность шагов.
+        policy:
+            ограничения на выполнение шагов
+        *args, **kwargs:
+            аргументы, с которыми будут вызваны шаги
+    Raises:
+        TypeError - если какой-то из шагов не является функцией. В этом случае ни один из шагов не выполняется
+        ValueError - если имена шагов повторяются. В этом случае ни один из шагов не выполняется
+    """
+    compiled = compile_steps(steps)
+    on_step_finished = policy.on_step_finished
+    limiter: Optional[_Limiter] = None
+    ranks: dict[str, float] = {}
+
+    # Без ограничений шаги не ждут разрешения на запуск, так что ни очередь, ни ранги шагов не нужны
+    if policy.max_concurrency is not None or policy.max_threads is not None or policy.max_async is not None:
+        limiter = _Limiter(policy)
+
+        if policy.step_durations:
+            ranks = _critical_path_ranks(compiled, policy.step_durations)
+
+    async def _run_step(call: CompiledStep):
+        name = call.step.name
+
+        if limiter is not None:
+            await limiter.acquire(call.is_async, call.priority, ranks.get(name, 0.0))
+
+        try:
+            started = perf_counter()
+
+            if call.is_async:
+                result = await call.call(*args, **kwargs)
+            else:
+                result = await _run_sync_step(call, args, kwargs)
+
+            if on_step_finished is not None:
+                on_step_finished(name, perf_counter() - started)
+
+            return result
+        finally:
+            if limiter is not None:
+                limiter.release(call.is_async)
+
+    async def _run_chain(
+            calls: Sequence[CompiledStep],
+            cancelled: Sequence[threading.Event],
+    ) -> tuple[list, Optional[Exception]]:
+        head = calls[0]
+
+        if limiter is not None:
+            await limiter.acquire(False, head.priority, ranks.get(head.step.name, 0.0))
+
+        try:
+            durations: list[float] = []
+            results, error = await asyncio.to_thread(
+                _call_chain, [call.call for call in calls], cancelled, args, kwargs, durations,
+            )
+
+            if on_step_finished is not None:
+                for call, duration in zip(calls, durations):
+                    on_step_finished(call.step.name, duration)
+
+            return results, error
+        finally:
+            if limiter is not None:
+                limiter.release(False)
+
+    # Задачи начинают выполняться в порядке создания, так что шаги без зависимостей запрашивают запуск в порядке
+    # приоритета и ранга
+    return _StepGraph(compiled, _run_step, _run_chain, fail_fast=policy.fail_fast).start(
+        call.step.name for call in sorted(compiled.calls, key=lambda c: (-c.priority, -ranks.get(c.step.name, 0.0)))
+    )
+
+
+async def gather_steps(futures: Iterable[asyncio.Future]) -> None:
+    """
+    Дожидается завершения всех шагов, запущенных `call_all_parallel_async` или `call_all_scheduled_async`.
+
+    В отличие от ``asyncio.gather``, не прерывает ожидание при первой ошибке.
+
+    Raises:
+        ExceptionGroup - если какие-то из шагов завершились с ошибкой. Содержит каждую ошибку один раз, даже если ей
+        завершились и Future'ы зависимых шагов
+    """
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    errors = {
+        id(result): result
+        for result in results
+        if isinstance(result, BaseException) and not isinstance(result, asyncio.CancelledError)
+    }
+
+    if errors:
+        raise BaseExceptionGroup("Ошибки при выполнении шагов операции", list(errors.values()))
+
+
+async def _aiter_source(source: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if isinstance(source, AsyncIterable):
+        async for item in source:
+            yield item
+    else:
+        for item in source:
+            yield item
+
+
+def _start_stage(fn: Callable, items: AsyncIterator, args: tuple, kwargs: dict) -> AsyncIterator:
+    stage = fn(items, *args, **kwargs)
+
+    if not isinstance(stage, AsyncIterable):
+        raise TypeError(f"Шаг {fn} вернул {stage!r} вместо асинхронного итератора")
+
+    return aiter(stage)
+
+
+async def _close_stages(stages: list[AsyncIterator]):
+    # Стадии закрываются начиная с последней, т.к. каждая стадия может использовать предыдущую при закрытии
+    for stage in reversed(stages):
+        aclose = getattr(stage, 'aclose', None)
+
+        if aclose is not None:
+            await aclose()
+
+
+async def call_all_as_pipeline_async(
+        steps: Iterable[OperationStep],
+        source: Union[Iterable, AsyncIterable],
+        /,
+        *args,
+        **kwargs,
+) -> AsyncIterator:
+    """
+    Выполняет шаги как конвейер асинхронных генераторов.
+
+    Каждый шаг принимает асинхронный итератор элементов (для первого шага - элементы ``source``, для последующих -
+    элементы, полученные от предыдущего шага) и дополнительные аргументы, и возвращает асинхронный итератор обработанных
+    элементов, как правило, являясь асинхронным генератором:
+
+    >>> async def stage(items, *args, **kwargs):
+    >>>     async for item in items:
+    >>>         if ...:
+    >>>             yield transform(item)
+
+    Шаги вызываются один раз для всего потока элементов, в порядке выполнения.
+    Элементы запрашиваются у шагов по мере их получения из возвращённого итератора, так что шаги выполняются
+    по-очереди, а в каждый момент времени в обработке находится не больше одного элемента.
+
+    При закрытии возвращённого итератора закрываются итераторы всех шагов.
+
+    Args:
+        steps:
+            шаги операции
+        source:
+            синхронный или асинхронный источник элементов
+        *args, **kwargs:
+            дополнительные аргументы, с которыми будут вызваны шаги
+
+    Returns:
+        асинхронный итератор элементов, полученных от последнего шага
+    Raises:
+        TypeError - если какой-то из шагов не является функцией или вернул не асинхронный итератор
+    """
+    stream = _aiter_source(source)
+    stages: list[AsyncIterator] = [stream]
+
+    try:
+        for fn in compile_steps(steps).functions:
+            stream = _start_stage(fn, stream, args, kwargs)
+            stages.append(stream)
+
+        async for item in stream:
+            yield item
+    finally:
+        await _close_stages(stages)
+
+
+_PIPELINE_END = object()
+
+
+class _PipelineError(NamedTuple):
+    error: Exception
+
+
+async def _feed_queue(stage: AsyncIterator, queue: asyncio.Queue):
+    try:
+        async for item in stage:
+            await queue.put(item)
+    except Exception as e:
+        await queue.put(_PipelineError(e))
+    else:
+        await queue.put(_PIPELINE_END)
+
+
+async def _drain_queue(queue: asyncio.Queue) -> AsyncIterator:
+    while True:
+        item = await queue.get()
+
+        if item is _PIPELINE_END:
+            return
+
+        if isinstance(item, _PipelineError):
+            raise item.error
+
+        yield item
+
+
+async def call_all_as_concurrent_pipeline_async(
+        steps: Iterable[OperationStep],
+        source: Union[Iterable, AsyncIterable],
+        queue_size: int,
+        /,
+        *args,
+        **kwargs,
+) -> AsyncIterator:
+    """
+    Вариант `call_all_as_pipeline_async`, в котором шаги выполняются одновременно.
+
+    Каждый шаг выполняется отдельным Task'ом и помещает полученные элементы в очередь ограниченного размера, из которой
+    их получает следующий шаг. Таким образом, шаги обрабатывают разные элементы одновременно, а шаг, опережающий
+    следующие шаги больше чем на размер очереди, приостанавливается до освобождения места в очереди.
+
+    Ошибка, возникшая в одном из шагов, передаётся следующим шагам по конвейеру, так что, если шаги её не обрабатывают,
+    она выбрасывается из возвращённого итератора. При закрытии возвращённого итератора Task'и всех шагов отменяются.
+
+    Args:
+        steps:
+            шаги операции
+        source:
+            синхронный или асинхронный источник элементов
+        queue_size:
+            максимальное количество элементов в очереди между шагами, не меньше 1
+        *args, **kwargs:
+            дополнительные аргументы, с которыми будут вызваны шаги
+
+    Returns:
+        асинхронный итератор элементов, полученных от последнего шага
+    Raises:
+        TypeError - если какой-то из шагов не является функцией или вернул не асинхронный итератор
+        ValueError - если размер очереди меньше 1
+    """
+    if queue_size < 1:
+        raise ValueError(f"Некорректный размер очереди: {queue_size}")
+
+    loop = asyncio.get_running_loop()
+    stream = _aiter_source(source)
+    stages: list[AsyncIterator] = [stream]
+    tasks: list[asyncio.Task] = []
+
+    try:
+        for fn in compile_steps(steps).functions:
+            stage = _start_stage(fn, stream, args, kwargs)
+            stages.append(stage)
+
+            queue = asyncio.Queue(queue_size)
+            tasks.append(loop.create_task(_feed_queue(stage, queue)))
+            stream = _drain_queue(queue)
 
-    for s in steps_list:
-        tasks[s.name] = loop.create_task(_run_step(s), name=s.name)
+        async for item in stream:
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
 
-    return list(tasks.values())
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await _close_stages(stages)
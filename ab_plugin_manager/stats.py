@@ -0,0 +1,163 @@
+"""
+Статистика работы менеджера плагинов (см. `PluginManagerImpl.get_stats`).
+"""
+
+from threading import Lock
+from typing import Iterable
+
+__all__ = ["OperationStats", "PluginManagerStats"]
+
+
+class OperationStats:
+    """
+    Счётчики, собранные для одной операции.
+    """
+    __slots__ = ('plan_builds', 'plan_build_time', 'cache_hits', 'cache_misses', 'cache_evictions', 'invalidations')
+
+    plan_builds: int
+    """
+    Количество построений плана операции с нуля.
+    """
+
+    plan_build_time: float
+    """
+    Суммарное время построения планов операции в секундах.
+    """
+
+    cache_hits: int
+    """
+    Количество обращений к кэшу операции (`PluginManager.operation_cache`), вернувших сохранённое значение.
+    """
+
+    cache_misses: int
+    """
+    Количество обращений к кэшу операции, не нашедших сохранённого значения.
+    """
+
+    cache_evictions: int
+    """
+    Количество значений операции, вытесненных из кэша политикой вытеснения.
+    """
+
+    invalidations: dict[str, int]
+    """
+    Количество сбросов плана и значений кэша операции по причинам сброса.
+    """
+
+    def __init__(self):
+        self.plan_builds = 0
+        self.plan_build_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.invalidations = {}
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        """
+        Доля обращений к кэшу операции, вернувших сохранённое значение.
+        """
+        total = self.cache_hits + self.cache_misses
+
+        return self.cache_hits / total if total else 0.0
+
+    def copy(self) -> 'OperationStats':
+        result = OperationStats()
+        result.plan_builds = self.plan_builds
+        result.plan_build_time = self.plan_build_time
+        result.cache_hits = self.cache_hits
+        result.cache_misses = self.cache_misses
+        result.cache_evictions = self.cache_evictions
+        result.invalidations = dict(self.invalidations)
+
+        return result
+
+    def __repr__(self):
+        return (
+            f'<OperationStats plan_builds={self.plan_builds} plan_build_time={self.plan_build_time:.6f} '
+            f'cache_hits={self.cache_hits} cache_misses={self.cache_misses} cache_evictions={self.cache_evictions} '
+            f'invalidations={self.invalidations}>'
+        )
+
+
+class PluginManagerStats:
+    """
+    Накапливает статистику по операциям.
+
+    Может использоваться из нескольких потоков одновременно.
+    """
+    __slots__ = ('_lock', '_operations')
+
+    INVALIDATION_PLUGINS_ADDED = 'plugins_added'
+    """
+    Добавлены плагины, реализующие операцию.
+    """
+
+    INVALIDATION_PLUGINS_REMOVED = 'plugins_removed'
+    """
+    Удалены плагины, реализующие операцию.
+    """
+
+    INVALIDATION_PLUGIN_CHANGED = 'plugin_changed'
+    """
+    Изменился плагин, реализующий операцию (``drop_operation_cache(plugin=...)``).
+    """
+
+    INVALIDATION_OPERATION_DROPPED = 'operation_dropped'
+    """
+    Кэш операции сброшен явно (``drop_operation_cache(operations=...)``).
+    """
+
+    INVALIDATION_FULL_DROP = 'full_drop'
+    """
+    Сброшен кэш всех операций.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._operations: dict[str, OperationStats] = {}
+
+    def _get(self, op_name: str) -> OperationStats:
+        try:
+            return self._operations[op_name]
+        except KeyError:
+            stats = self._operations[op_name] = OperationStats()
+            return stats
+
+    def record_plan_build(self, op_name: str, duration: float):
+        with self._lock:
+            stats = self._get(op_name)
+            stats.plan_builds += 1
+            stats.plan_build_time += duration
+
+    def record_cache_hit(self, op_name: str):
+        with self._lock:
+            self._get(op_name).cache_hits += 1
+
+    def record_cache_miss(self, op_name: str):
+        with self._lock:
+            self._get(op_name).cache_misses += 1
+
+    def record_cache_eviction(self, op_name: str):
+        with self._lock:
+            self._get(op_name).cache_evictions += 1
+
+    def record_invalidation(self, op_names: Iterable[str], cause: str):
+        with self._lock:
+            for op_name in op_names:
+                invalidations = self._get(op_name).invalidations
+                invalidations[cause] = invalidations.get(cause, 0) + 1
+
+    def get(self) -> dict[str, OperationStats]:
+        """
+        Возвращает копию собранной на данный момент статистики по каждой операции.
+        """
+        with self._lock:
+            return {op_name: stats.copy() for op_name, stats in self._operations.items()}
+
+    def reset(self):
+        """
+        Сбрасывает собранную статистику.
+        """
+        with self._lock:
+            self._operations.clear()
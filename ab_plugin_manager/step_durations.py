@@ -0,0 +1,60 @@
+"""
+Учёт времени выполнения шагов операций (см. `PluginManager.record_step_duration`).
+"""
+
+from threading import Lock
+from typing import Mapping
+
+__all__ = ["StepDurations"]
+
+
+class StepDurations:
+    """
+    Ожидаемое время выполнения шагов операций.
+
+    Ожидаемое время - экспоненциальное скользящее среднее измеренных значений, так что оно следует за изменениями
+    времени выполнения шагов, не слишком сильно реагируя на единичные выбросы.
+
+    Может использоваться из нескольких потоков одновременно.
+    """
+    __slots__ = ('_lock', '_smoothing', '_durations')
+
+    def __init__(self, *, smoothing: float = 0.3):
+        """
+        :param smoothing: Вес нового измерения при вычислении среднего, от 0 до 1
+        """
+        self._lock = Lock()
+        self._smoothing = smoothing
+        self._durations: dict[str, dict[str, float]] = {}
+
+    def record(self, op_name: str, step_name: str, seconds: float):
+        with self._lock:
+            durations = self._durations.setdefault(op_name, {})
+            previous = durations.get(step_name)
+
+            if previous is None:
+                durations[step_name] = seconds
+            else:
+                durations[step_name] = previous + (seconds - previous) * self._smoothing
+
+    def get(self, op_name: str) -> dict[str, float]:
+        """
+        Возвращает копию ожидаемого времени выполнения шагов операции.
+        """
+        with self._lock:
+            return dict(self._durations.get(op_name, ()))
+
+    def export(self) -> dict[str, dict[str, float]]:
+        """
+        Возвращает копию ожидаемого времени выполнения шагов всех операций.
+        """
+        with self._lock:
+            return {op_name: dict(durations) for op_name, durations in self._durations.items()}
+
+    def update(self, durations: Mapping[str, Mapping[str, float]]):
+        """
+        Добавляет ранее сохранённые значения (см. `export`), заменяя текущие значения для тех же шагов.
+        """
+        with self._lock:
+            for op_name, op_durations in durations.items():
+                self._durations.setdefault(op_name, {}).update(op_durations)
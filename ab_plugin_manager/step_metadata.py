@@ -0,0 +1,87 @@
+"""
+Метаданные шагов операций, влияющие на их выполнение: приоритет и признак шага, требующего значительных вычислительных
+ресурсов.
+
+Метаданные задаются аннотациями (`StepPriority`, `CpuBound`) или аттрибутами функций шагов, которые устанавливают
+декораторы `magic_plugin.priority` и `magic_plugin.cpu_bound`, и читаются при компиляции планов (см. `compiled_plan`).
+"""
+
+from typing import NamedTuple
+
+from ab_plugin_manager.abc import OperationStep
+
+__all__ = [
+    "StepPriority",
+    "get_step_priority",
+    "CpuBound",
+    "is_cpu_bound_step",
+]
+
+STEP_PRIORITY_ATTR = '__mp_priority'
+"""
+Аттрибут функции шага, содержащий приоритет шага.
+"""
+
+STEP_CPU_BOUND_ATTR = '__mp_cpu_bound'
+"""
+Аттрибут функции шага, помечающий шаг как требующий значительных вычислительных ресурсов.
+"""
+
+
+class StepPriority(NamedTuple):
+    """
+    Приоритет шага операции.
+
+    Может быть задан аннотацией аттрибута магического плагина, в т.ч. в метаданных ``Annotated``:
+
+    >>> class MyPlugin(MagicPlugin):
+    >>>     init: Annotated[Callable, StepPriority(10)] = ...
+    """
+    value: int
+
+
+def get_step_priority(step: OperationStep) -> int:
+    """
+    Возвращает приоритет шага, заданный аннотацией (`StepPriority`) или декоратором `magic_plugin.priority`.
+    """
+    annotation = step.annotation
+
+    if isinstance(annotation, StepPriority):
+        return annotation.value
+
+    for metadata in getattr(annotation, '__metadata__', ()):
+        if isinstance(metadata, StepPriority):
+            return metadata.value
+
+    value = getattr(step.step, STEP_PRIORITY_ATTR, 0)
+
+    return value if isinstance(value, int) else 0
+
+
+class CpuBound:
+    """
+    Аннотация, помечающая шаг как требующий значительных вычислительных ресурсов (см. `magic_plugin.cpu_bound`).
+
+    >>> class MyPlugin(MagicPlugin):
+    >>>     init: Annotated[Callable, CpuBound()] = ...
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'CpuBound()'
+
+
+def is_cpu_bound_step(step: OperationStep) -> bool:
+    """
+    Проверяет, помечен ли шаг аннотацией `CpuBound` или декоратором `magic_plugin.cpu_bound`.
+    """
+    annotation = step.annotation
+
+    if isinstance(annotation, CpuBound):
+        return True
+
+    for metadata in getattr(annotation, '__metadata__', ()):
+        if isinstance(metadata, CpuBound):
+            return True
+
+    return getattr(step.step, STEP_CPU_BOUND_ATTR, False) is True
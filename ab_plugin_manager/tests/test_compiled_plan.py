@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import unittest
+from unittest.mock import Mock
+
+from ab_plugin_manager.abc import OperationStep
+from ab_plugin_manager.compiled_plan import CompiledPlan, compile_steps
+from ab_plugin_manager.plugin_manager import PluginManagerImpl
+from ab_plugin_manager.run_operation import call_all, call_all_as_wrappers, call_all_as_wrappers_async
+from ab_plugin_manager.tests.test_plugin_manager import _TestPlugin1, _TestPlugin2
+
+
+class CompiledPlanTest(unittest.TestCase):
+    def test_compile(self):
+        async def async_step():
+            ...
+
+        def sync_step():
+            ...
+
+        compiled = CompiledPlan([
+            OperationStep(sync_step, 'sync', Mock()),
+            OperationStep(async_step, 'async', Mock(), reverse_dependencies=('sync',)),
+        ])
+
+        self.assertEqual([call.is_async for call in compiled.calls], [False, True])
+        self.assertEqual(compiled.functions, (sync_step, async_step))
+        self.assertTrue(compiled.has_async)
+        self.assertFalse(compiled.all_async)
+        self.assertEqual(compiled.dependencies, {'sync': frozenset({'async'}), 'async': frozenset()})
+        self.assertEqual([step.name for step in compiled], ['sync', 'async'])
+
+    def test_not_callable(self):
+        called = Mock()
+
+        with self.assertRaises(TypeError):
+            call_all([OperationStep(called, 'a', Mock()), OperationStep(42, 'b', Mock())])
+
+        called.assert_not_called()
+
+    def test_plan_compiled_once(self):
+        pm = PluginManagerImpl([_TestPlugin1(), _TestPlugin2()])
+        plan = pm.get_operation_sequence('init')
+
+        compiled = compile_steps(plan)
+
+        self.assertIs(compile_steps(plan), compiled)
+        self.assertIs(compile_steps(compiled), compiled)
+        self.assertEqual(list(compiled), list(plan))
+
+    def test_wrapper_chain(self):
+        def wrapper(index):
+            def step(nxt, prev, *args, **kwargs):
+                return nxt(prev + [index], *args, **kwargs) + [-index]
+
+            return OperationStep(step, f'step{index}', Mock())
+
+        compiled = CompiledPlan([wrapper(1), wrapper(2)])
+
+        self.assertIs(compiled.wrapper_chain, compiled.wrapper_chain)
+        self.assertEqual(call_all_as_wrappers(compiled, [0]), [0, 1, 2, -2, -1])
+        self.assertEqual(call_all_as_wrappers(compiled, []), [1, 2, -2, -1])
+
+    def test_async_wrapper_chain(self):
+        def wrapper(index):
+            async def step(nxt, prev, *args, **kwargs):
+                return await nxt(prev + [index], *args, **kwargs) + [-index]
+
+            return OperationStep(step, f'step{index}', Mock())
+
+        compiled = CompiledPlan([wrapper(1), wrapper(2)])
+
+        self.assertIs(compiled.async_wrapper_chain, compiled.async_wrapper_chain)
+        self.assertEqual(asyncio.run(call_all_as_wrappers_async(compiled, [0])), [0, 1, 2, -2, -1])
+
+        called = Mock()
+
+        async def first(nxt, prev):
+            called()
+            return await nxt(prev)
+
+        with self.assertRaises(TypeError):
+            asyncio.run(call_all_as_wrappers_async(
+                [OperationStep(first, 'first', Mock()), OperationStep(lambda nxt, prev: prev, 'sync', Mock())],
+                None,
+            ))
+
+        called.assert_not_called()
+
+    def test_deep_wrapper_chain(self):
+        def step(nxt, prev):
+            return nxt(prev + 1)
+
+        depth = sys.getrecursionlimit() * 3 // 4
+        plugin = Mock()
+
+        self.assertEqual(
+            call_all_as_wrappers([OperationStep(step, f'step{i}', plugin) for i in range(depth)], 0),
+            depth,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
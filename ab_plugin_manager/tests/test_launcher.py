@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from ab_plugin_manager.launcher import _start_operation
+from ab_plugin_manager.magic_plugin import MagicPlugin, after
+from ab_plugin_manager.plugin_manager import PluginManagerImpl
+from ab_plugin_manager.run_operation import SchedulerPolicy
+
+
+class _ChainPlugin(MagicPlugin):
+    def __init__(self):
+        super().__init__()
+        self.calls: list[str] = []
+
+    def init(self):
+        self.calls.append('first')
+
+
+class _ChainDependentPlugin(MagicPlugin):
+    def __init__(self, chain: _ChainPlugin):
+        super().__init__()
+        self.chain = chain
+
+    @after('_ChainPlugin.init')
+    def init(self):
+        self.chain.calls.append('second')
+
+
+class StartOperationTest(unittest.IsolatedAsyncioTestCase):
+    async def _run_init(self, scheduler_policy):
+        chain = _ChainPlugin()
+        pm = PluginManagerImpl([chain, _ChainDependentPlugin(chain)])
+
+        with patch('asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            await asyncio.gather(*await _start_operation(pm, 'init', scheduler_policy))
+
+        self.assertEqual(chain.calls, ['first', 'second'])
+        # Шаги цепочки выполняются в executor'е одним заданием
+        self.assertEqual(to_thread.call_count, 1)
+        # Время выполнения записывается для каждого шага цепочки
+        self.assertEqual(set(pm.get_step_durations('init')), {'_ChainPlugin.init', '_ChainDependentPlugin.init'})
+
+    async def test_sync_chain_without_policy(self):
+        # Без ограничений шаги запускаются без очереди
+        with patch('ab_plugin_manager.run_operation._Limiter') as limiter:
+            await self._run_init(None)
+
+        limiter.assert_not_called()
+
+    async def test_sync_chain_with_policy(self):
+        await self._run_init(SchedulerPolicy(max_threads=1))
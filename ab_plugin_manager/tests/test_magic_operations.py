@@ -1,8 +1,10 @@
+import asyncio
+import operator
 import unittest
 from typing import Any
 
 from ab_plugin_manager.magic_operation import AsyncWrapperCallOperation, WrapperCallOperation, \
-    MagicOperationResultCheckError
+    MagicOperationResultCheckError, CallAllOperation, GatherOperation
 from ab_plugin_manager.magic_plugin import step_name, after
 from ab_plugin_manager.magic_plugin import MagicPlugin
 from ab_plugin_manager.plugin_manager import PluginManagerImpl
@@ -85,6 +87,146 @@ class MagicOperationsTest(unittest.IsolatedAsyncioTestCase):
 
             self.assertIs(e.exception.operation, op)
 
+    def test_bound_operation_checks(self) -> None:
+        op: WrapperCallOperation[Any, Any, str] = WrapperCallOperation[Any, Any, str]("op").returning_instance_of(str)
+
+        class Plugin1(MagicPlugin):
+            @op.factory_implementation
+            def f1(self, a, **_kwargs):
+                return a
+
+        pm = PluginManagerImpl([Plugin1()])
+        bound = op.bind(pm).returning_not_none()
+
+        with self.assertRaises(MagicOperationResultCheckError):
+            bound(1)
+
+        with self.assertRaises(MagicOperationResultCheckError):
+            bound(None)
+
+        # Проверка, добавленная к привязанной операции, не добавляется к исходной
+        self.assertEqual(len(op._checks), 1)
+        self.assertEqual(len(bound._checks), 2)
+
+    def test_bound_operation(self) -> None:
+        op = CallAllOperation[list]("op")
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            def first(self, out: list):
+                out.append(1)
+
+        class Plugin2(MagicPlugin):
+            @op.implementation
+            def second(self, out: list):
+                out.append(2)
+
+        pm = PluginManagerImpl([Plugin1()])
+        bound = op.bind(pm)
+
+        self.assertIs(bound.bound_manager, pm)
+        self.assertIsNone(op.bound_manager)
+
+        # Привязанная операция не требует текущего менеджера
+        out: list = []
+        bound(out)
+        compiled = bound.get_compiled_steps()
+        self.assertIs(bound.get_compiled_steps(), compiled)
+        self.assertEqual(out, [1])
+
+        # План заменяется при изменении набора плагинов
+        plugin2 = Plugin2()
+        pm.add_plugins([plugin2])
+        self.assertIsNot(bound.get_compiled_steps(), compiled)
+        out = []
+        bound(out)
+        self.assertEqual(out, [1, 2])
+
+        pm.remove_plugins([plugin2])
+        out = []
+        bound(out)
+        self.assertEqual(out, [1])
+
+        pm.drop_operation_cache()
+        out = []
+        bound(out)
+        self.assertEqual(out, [1])
+
+        with pm.as_current():
+            self.assertIs(op.bound().bound_manager, pm)
+
+    async def test_gather(self):
+        op = GatherOperation[int, int]("op")
+        sum_op = GatherOperation[int, int]("op", reducer=operator.add, initial=0)
+        release_slow = asyncio.Event()
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def slow(self, x):
+                await release_slow.wait()
+                return x
+
+            @op.implementation
+            def fast(self, x):
+                return x * 10
+
+            @after("Plugin1.fast")
+            @op.implementation
+            async def after_fast(self, x):
+                return x * 100
+
+        with PluginManagerImpl([Plugin1()]).as_current():
+            results = []
+
+            async for result in op.aiter_results(1):
+                results.append(result)
+
+                if len(results) == 2:
+                    release_slow.set()
+
+            self.assertEqual(results, [10, 100, 1])
+            self.assertEqual(sorted(await op.ainvoke(2)), [2, 20, 200])
+            self.assertEqual(await sum_op.ainvoke(1), 111)
+
+    async def test_gather_error(self):
+        op = GatherOperation[int]("op")
+        cancelled = asyncio.Event()
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def slow(self):
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            @op.implementation
+            async def fail(self):
+                raise ValueError()
+
+        with PluginManagerImpl([Plugin1()]).as_current():
+            with self.assertRaises(ValueError):
+                await op.ainvoke()
+
+        self.assertTrue(cancelled.is_set())
+
+    def test_gather_sync(self) -> None:
+        op = GatherOperation[int, int]("op", reducer=lambda acc, it: [*acc, it], initial=[])
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            def first(self, x):
+                return x
+
+            @after("Plugin1.first")
+            @op.implementation
+            def second(self, x):
+                return x + 1
+
+        with PluginManagerImpl([Plugin1()]).as_current():
+            self.assertEqual(op(1), [1, 2])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,239 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from ab_plugin_manager.abc import OPERATION_STEPS_CACHE_KEY
+from ab_plugin_manager.operation_cache import OperationCache, OperationCachePolicy
+from ab_plugin_manager.stats import PluginManagerStats
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _get(cache: OperationCache, op_name, key, value=None):
+    return cache.get_or_compute(op_name, key, lambda: value if value is not None else object(), (), {})
+
+
+class OperationCacheTest(unittest.TestCase):
+    def test_max_entries_per_operation(self):
+        cache = OperationCache(OperationCachePolicy(max_entries_per_operation=2))
+
+        v1, v2 = _get(cache, 'op', 1), _get(cache, 'op', 2)
+        other = _get(cache, 'other', 1)
+        # Обращение к первому значению делает второе самым давно использовавшимся
+        self.assertIs(_get(cache, 'op', 1), v1)
+        _get(cache, 'op', 3)
+
+        self.assertIs(_get(cache, 'op', 1), v1)
+        self.assertIsNot(_get(cache, 'op', 2), v2)
+        self.assertIs(_get(cache, 'other', 1), other)
+
+    def test_max_total_size(self):
+        cache = OperationCache(OperationCachePolicy(max_total_size=10, size_of=len))
+
+        _get(cache, 'op1', 1, 'aaaa')
+        _get(cache, 'op2', 1, 'bbbb')
+        _get(cache, 'op3', 1, 'cccc')
+
+        self.assertEqual(cache.total_size, 8)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(_get(cache, 'op1', 1, 'dd'), 'dd')
+
+    def test_ttl(self):
+        clock = _Clock()
+        cache = OperationCache(OperationCachePolicy(ttl=10), clock=clock)
+
+        v1 = _get(cache, 'op', 1)
+        clock.now = 5
+        v2 = _get(cache, 'op', 2)
+        self.assertIs(_get(cache, 'op', 1), v1)
+
+        clock.now = 12
+        self.assertIsNot(_get(cache, 'op', 1), v1)
+        self.assertIs(_get(cache, 'op', 2), v2)
+
+        clock.now = 30
+        _get(cache, 'op', 3)
+        self.assertEqual(len(cache), 1)
+
+    def test_pinned(self):
+        clock = _Clock()
+        cache = OperationCache(OperationCachePolicy(max_total_size=1, ttl=1), clock=clock)
+
+        steps = _get(cache, 'op', OPERATION_STEPS_CACHE_KEY)
+        _get(cache, 'op', 1)
+        _get(cache, 'op', 2)
+        clock.now = 100
+
+        self.assertIs(_get(cache, 'op', OPERATION_STEPS_CACHE_KEY), steps)
+
+        cache.drop(['op'])
+
+        self.assertIsNot(_get(cache, 'op', OPERATION_STEPS_CACHE_KEY), steps)
+
+    def test_stats(self):
+        clock = _Clock()
+        stats = PluginManagerStats()
+        cache = OperationCache(OperationCachePolicy(max_entries_per_operation=1, ttl=10), clock=clock, stats=stats)
+
+        _get(cache, 'op', 1)
+        _get(cache, 'op', 1)
+        _get(cache, 'op', 2)
+        _get(cache, 'op', OPERATION_STEPS_CACHE_KEY)
+        _get(cache, 'op', OPERATION_STEPS_CACHE_KEY)
+        clock.now = 20
+        _get(cache, 'op', 2)
+
+        op_stats = stats.get()['op']
+        self.assertEqual(op_stats.cache_hits, 2)
+        self.assertEqual(op_stats.cache_misses, 4)
+        # Вытеснение по количеству значений и по времени жизни
+        self.assertEqual(op_stats.cache_evictions, 2)
+
+    def test_drop_keys(self):
+        cache = OperationCache()
+
+        v1, v2 = _get(cache, 'op', 1), _get(cache, 'op', 2)
+        cache.drop(['op', 'other'], (key for key in [1, 3]))
+
+        self.assertIsNot(_get(cache, 'op', 1), v1)
+        self.assertIs(_get(cache, 'op', 2), v2)
+
+    def test_single_flight(self):
+        cache = OperationCache()
+        started, release = Event(), Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return object()
+
+        with ThreadPoolExecutor(4) as executor:
+            first = executor.submit(cache.get_or_compute, 'op', 1, compute, (), {})
+            started.wait(5)
+            others = [executor.submit(cache.get_or_compute, 'op', 1, compute, (), {}) for _ in range(3)]
+            release.set()
+
+            value = first.result(5)
+            self.assertEqual([other.result(5) for other in others], [value] * 3)
+
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_computation_not_cached(self):
+        cache = OperationCache()
+        started, release = Event(), Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError()
+
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(cache.get_or_compute, 'op', 1, fail, (), {})
+            started.wait(5)
+            second = executor.submit(cache.get_or_compute, 'op', 1, fail, (), {})
+            release.set()
+
+            with self.assertRaises(ValueError):
+                first.result(5)
+            with self.assertRaises(ValueError):
+                second.result(5)
+
+        self.assertEqual(_get(cache, 'op', 1, 'value'), 'value')
+
+    def test_reentrant_computation(self):
+        cache = OperationCache()
+
+        def compute():
+            return cache.get_or_compute('op', 1, lambda: 'inner', (), {})
+
+        self.assertEqual(cache.get_or_compute('op', 1, compute, (), {}), 'inner')
+
+    def test_drop_during_computation(self):
+        cache = OperationCache()
+
+        def compute():
+            cache.drop(['op'])
+            return 'stale'
+
+        self.assertEqual(cache.get_or_compute('op', 1, compute, (), {}), 'stale')
+        self.assertEqual(_get(cache, 'op', 1, 'fresh'), 'fresh')
+
+
+class OperationCacheAsyncTest(unittest.IsolatedAsyncioTestCase):
+    async def test_single_flight(self):
+        cache = OperationCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await release.wait()
+            return value
+
+        tasks = [
+            asyncio.create_task(cache.aget_or_compute('op', 1, compute, (i,), {}))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), [0, 0, 0])
+        self.assertEqual(calls, [0])
+        # Значения общие с синхронным вызовом
+        self.assertEqual(cache.get_or_compute('op', 1, lambda: 42, (), {}), 0)
+
+    async def test_waits_for_thread(self):
+        cache = OperationCache()
+        started, release = Event(), Event()
+
+        def compute():
+            started.set()
+            release.wait(5)
+            return 'sync'
+
+        thread_call = asyncio.create_task(asyncio.to_thread(cache.get_or_compute, 'op', 1, compute, (), {}))
+        await asyncio.to_thread(started.wait, 5)
+
+        async def fail():
+            raise AssertionError()
+
+        async_call = asyncio.create_task(cache.aget_or_compute('op', 1, fail, (), {}))
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await async_call, 'sync')
+        self.assertEqual(await thread_call, 'sync')
+
+    async def test_cancelled_computation(self):
+        cache = OperationCache()
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        async def compute():
+            return 'value'
+
+        owner = asyncio.create_task(cache.aget_or_compute('op', 1, hang, (), {}))
+        await started.wait()
+        waiter = asyncio.create_task(cache.aget_or_compute('op', 1, compute, (), {}))
+        await asyncio.sleep(0)
+        owner.cancel()
+
+        self.assertEqual(await waiter, 'value')
+        with self.assertRaises(asyncio.CancelledError):
+            await owner
+
+
+if __name__ == '__main__':
+    unittest.main()
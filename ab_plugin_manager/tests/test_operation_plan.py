@@ -0,0 +1,141 @@
+import random
+import unittest
+from unittest.mock import Mock
+
+from ab_plugin_manager.abc import OperationStep, DependencyCycleException, Plugin
+from ab_plugin_manager.operation_plan import OperationPlan
+
+
+class _StepsPlugin(Plugin):
+    def __init__(self, name: str, *steps: tuple[str, tuple[str, ...], tuple[str, ...]]):
+        self.name = name
+        self.steps = [
+            OperationStep(None, step_name, self, deps, reverse_deps) for step_name, deps, reverse_deps in steps
+        ]
+
+    def get_operation_steps(self, op_name: str):
+        return self.steps
+
+
+def _assert_valid_order(test: unittest.TestCase, plan: OperationPlan):
+    positions = {step.name: position for position, step in enumerate(plan)}
+
+    for step in plan:
+        for dep in step.dependencies:
+            if dep in positions:
+                test.assertLess(positions[dep], positions[step.name], f'{dep} -> {step.name}')
+        for reverse_dep in step.reverse_dependencies:
+            if reverse_dep in positions:
+                test.assertLess(positions[step.name], positions[reverse_dep], f'{step.name} -> {reverse_dep}')
+
+
+class OperationPlanTest(unittest.TestCase):
+    def test_add_steps(self):
+        p1 = _StepsPlugin('p1', ('a', (), ()), ('b', ('a',), ()), ('c', ('b',), ()))
+        p2 = _StepsPlugin('p2', ('x', ('b',), ('a',)))
+        plan = OperationPlan.build('op', [p1], Mock())
+
+        with self.assertRaises(DependencyCycleException) as e:
+            plan.with_added_steps(p2.steps, p2, Mock())
+
+        self.assertEqual({getattr(step, 'name', step) for step in e.exception.steps}, {'a', 'b', 'x'})
+
+        p3 = _StepsPlugin('p3', ('y', ('c',), ('z',)), ('w', (), ('a',)), ('z', (), ()))
+        new_plan = plan.with_added_steps(p3.steps, p3, Mock())
+
+        self.assertEqual(len(new_plan), 6)
+        self.assertEqual([step.name for step in plan], ['a', 'b', 'c'])
+        _assert_valid_order(self, new_plan)
+
+    def test_known_order(self):
+        p1 = _StepsPlugin('p1', ('a', (), ()), ('b', (), ()), ('c', ('a', 'b'), ('missing',)))
+
+        plan = OperationPlan.build_from_steps('op', [(p1, p1.steps)], Mock(), ('b', 'a', 'c', 'missing'))
+        self.assertEqual([step.name for step in plan], ['b', 'a', 'c'])
+
+        # Порядок, нарушающий зависимости или не содержащий всех узлов, игнорируется
+        for known_order in (
+                ('c', 'a', 'b', 'missing'),
+                ('a', 'b', 'c'),
+                ('a', 'b', 'c', 'missing', 'extra'),
+                ('a', 'b', 'a', 'c', 'missing'),
+        ):
+            plan = OperationPlan.build_from_steps('op', [(p1, p1.steps)], Mock(), known_order)
+            self.assertEqual(plan.order, ('a', 'b', 'c', 'missing'))
+
+    def test_add_steps_through_missing_step(self):
+        p1 = _StepsPlugin('p1', ('a', ('missing',), ()), ('b', (), ()))
+        p2 = _StepsPlugin('p2', ('c', (), ('missing',)), ('d', ('b',), ('c',)))
+        plan = OperationPlan.build('op', [p1], Mock()).with_added_steps(p2.steps, p2, Mock())
+
+        self.assertEqual([step.name for step in plan], ['b', 'd', 'c', 'a'])
+
+    def test_add_duplicate_step(self):
+        logger = Mock()
+        p1 = _StepsPlugin('p1', ('a', (), ()))
+        p2 = _StepsPlugin('p2', ('a', ('b',), ()))
+        plan = OperationPlan.build('op', [p1], logger).with_added_steps(p2.steps, p2, logger)
+
+        self.assertEqual(list(plan), p1.steps)
+        logger.warning.assert_called_once()
+
+    def test_random_incremental_order(self):
+        rnd = random.Random(42)
+        names = [f's{i}' for i in range(60)]
+
+        for _ in range(20):
+            # Зависимости только от шагов с меньшими номерами - циклов нет
+            plugins = [
+                _StepsPlugin(
+                    f'p{i}',
+                    *(
+                        (
+                            name,
+                            tuple(rnd.sample(names[:names.index(name)], min(2, names.index(name)))),
+                            tuple(rnd.sample(names[names.index(name) + 1:], min(1, 59 - names.index(name)))),
+                        )
+                        for name in names[i::6]
+                    )
+                )
+                for i in range(6)
+            ]
+            rnd.shuffle(plugins)
+
+            plan = OperationPlan.build('op', plugins[:1], Mock())
+
+            for plugin in plugins[1:]:
+                plan = plan.with_added_steps(plugin.steps, plugin, Mock())
+
+            self.assertEqual(len(plan), len(names))
+            _assert_valid_order(self, plan)
+
+    def test_levels(self):
+        p1 = _StepsPlugin('p1', ('a', (), ()), ('b', (), ()), ('c', ('a', 'b'), ()), ('d', ('missing',), ()))
+        p2 = _StepsPlugin('p2', ('e', ('c',), ()), ('f', ('a',), ('e',)))
+        plan = OperationPlan.build('op', [p1, p2], Mock())
+
+        self.assertEqual(
+            [{step.name for step in level} for level in plan.levels],
+            [{'a', 'b'}, {'c', 'd', 'f'}, {'e'}],
+        )
+        self.assertIs(plan.levels, plan.levels)
+
+    def test_without_plugins(self):
+        p1 = _StepsPlugin('p1', ('a', (), ()), ('c', ('b',), ()))
+        p2 = _StepsPlugin('p2', ('b', ('a',), ()))
+        plan = OperationPlan.build('op', [p1, p2], Mock())
+
+        self.assertIs(plan.without_plugins([_StepsPlugin('p3')]), plan)
+        self.assertEqual([step.name for step in plan.without_plugins([p2])], ['a', 'c'])
+        self.assertEqual([step.name for step in plan.without_plugins([p1])], ['b'])
+
+    def test_without_shadowing_plugin(self):
+        p1 = _StepsPlugin('p1', ('a', (), ()))
+        p2 = _StepsPlugin('p2', ('a', (), ()))
+        plan = OperationPlan.build('op', [p1, p2], Mock())
+
+        self.assertIsNone(plan.without_plugins([p1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
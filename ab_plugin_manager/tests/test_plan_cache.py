@@ -0,0 +1,92 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from ab_plugin_manager.magic_plugin import MagicPlugin
+from ab_plugin_manager.plan_cache import PlanCacheFile
+from ab_plugin_manager.plugin_manager import PluginManagerImpl
+from ab_plugin_manager.tests.test_plugin_manager import _TestPlugin1, _TestPlugin2, _TestPlugin3
+
+
+class _PluginA(MagicPlugin):
+    def init(self):
+        ...
+
+
+class _PluginB(MagicPlugin):
+    def init(self):
+        ...
+
+
+class PlanCacheFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = Path(tmp_dir.name) / 'plans.json'
+
+    def _stored_order(self, op_name):
+        return json.loads(self.path.read_text(encoding='utf-8'))['operations'][op_name]['order']
+
+    def test_save_and_reuse(self):
+        pm = PluginManagerImpl([_PluginA(), _PluginB()], plan_cache_file=self.path)
+        pm.get_operation_sequence('init')
+        pm.save_plan_cache()
+
+        self.assertEqual(self._stored_order('init'), ['_PluginA.init', '_PluginB.init'])
+
+        # Подменяем сохранённый порядок другим, допустимым для тех же шагов, что бы убедиться, что он используется
+        data = json.loads(self.path.read_text(encoding='utf-8'))
+        data['operations']['init']['order'] = ['_PluginB.init', '_PluginA.init']
+        self.path.write_text(json.dumps(data), encoding='utf-8')
+
+        pm = PluginManagerImpl([_PluginA(), _PluginB()], plan_cache_file=self.path)
+
+        self.assertEqual([step.name for step in pm.get_operation_sequence('init')], ['_PluginB.init', '_PluginA.init'])
+
+    def test_fingerprint_mismatch(self):
+        pm = PluginManagerImpl([_TestPlugin1(), _TestPlugin2()], plan_cache_file=self.path)
+        pm.get_operation_sequence('init')
+        pm.save_plan_cache()
+
+        pm = PluginManagerImpl([_TestPlugin1(), _TestPlugin2(), _TestPlugin3()], plan_cache_file=self.path)
+
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin3.init', '_TestPlugin1.init', '_TestPlugin2.init'],
+        )
+
+        pm.save_plan_cache()
+
+        self.assertEqual(self._stored_order('init'), ['_TestPlugin3.init', '_TestPlugin1.init', '_TestPlugin2.init'])
+
+    def test_step_durations(self):
+        pm = PluginManagerImpl([_PluginA()], plan_cache_file=self.path)
+        pm.record_step_duration('init', '_PluginA.init', 2.0)
+        pm.save_plan_cache()
+
+        pm = PluginManagerImpl([_PluginA()], plan_cache_file=self.path)
+
+        self.assertEqual(pm.get_step_durations('init'), {'_PluginA.init': 2.0})
+
+        pm.record_step_duration('init', '_PluginA.init', 1.0)
+
+        self.assertLess(pm.get_step_durations('init')['_PluginA.init'], 2.0)
+
+    def test_broken_file(self):
+        self.path.write_text('{not json', encoding='utf-8')
+
+        with self.assertLogs('PlanCacheFile', 'WARNING'):
+            cache = PlanCacheFile(self.path)
+        fingerprint = PlanCacheFile.fingerprint('op', [])
+
+        self.assertIsNone(cache.get('op', fingerprint))
+
+        cache.put('op', fingerprint, ['a'])
+        cache.save()
+
+        self.assertEqual(PlanCacheFile(self.path).get('op', fingerprint), ('a',))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ from unittest.async_case import IsolatedAsyncioTestCase
 from unittest.mock import Mock
 
 from ab_plugin_manager.abc import OperationStep, DependencyCycleException, PluginManager, \
-    CurrentPluginManagerNotSetException
+    CurrentPluginManagerNotSetException, Plugin
 from ab_plugin_manager.magic_plugin import MagicPlugin, after, step_name, before
 from ab_plugin_manager.plugin_manager import PluginManagerImpl
 
@@ -41,6 +41,54 @@ class _EggPlugin(MagicPlugin):
         ...
 
 
+class _ContainerPlugin(MagicPlugin):
+    def __init__(self):
+        super().__init__()
+        self.nested = []
+
+    def get_operation_steps(self, op_name: str):
+        for plugin in self.nested:
+            yield from plugin.get_operation_steps(op_name)
+
+        yield from super().get_operation_steps(op_name)
+
+    def list_implemented_operations(self):
+        ops = set(super().list_implemented_operations())
+
+        for plugin in self.nested:
+            ops.update(plugin.list_implemented_operations())
+
+        return ops
+
+
+class _DynamicPlugin(Plugin):
+    def __init__(self):
+        self.probed = []
+
+    def get_operation_steps(self, op_name: str):
+        self.probed.append(op_name)
+
+        if op_name == 'init':
+            yield OperationStep(lambda: None, 'dynamic.init', self)
+
+
+class _ReentrantPlugin(Plugin):
+    """
+    Плагин, который при первом обращении к нему строит тот же план ещё раз, имитируя построение плана в другом потоке.
+    """
+
+    def __init__(self):
+        self.build_inner = None
+        self.inner = None
+
+    def get_operation_steps(self, op_name: str):
+        if self.build_inner is not None:
+            build_inner, self.build_inner = self.build_inner, None
+            self.inner = build_inner()
+
+        yield OperationStep(lambda: None, 'reentrant.' + op_name, self)
+
+
 class PluginManagerTest(unittest.TestCase):
     def test_get_single_step(self):
         logger = Mock(spec=Logger)
@@ -95,6 +143,280 @@ class PluginManagerTest(unittest.TestCase):
             ]
         )
 
+    def test_levels(self):
+        plugins = [_TestPlugin1(), _TestPlugin2(), _TestPlugin3()]
+        pm = PluginManagerImpl(plugins)
+
+        self.assertEqual(
+            pm.get_operation_levels('init'),
+            ((plugins[2].get_operation_steps('init')[0],),
+             (plugins[0].get_operation_steps('init')[0],),
+             (plugins[1].get_operation_steps('init')[0],)),
+        )
+        self.assertIs(pm.get_operation_levels('init'), pm.get_operation_levels('init'))
+
+    def test_get_operation_sequences(self):
+        dynamic = _DynamicPlugin()
+        plugins = [_TestPlugin1(), dynamic, _ChickenPlugin()]
+        pm = PluginManagerImpl(plugins)
+        init_plan = pm.get_operation_sequence('init')
+
+        sequences = pm.get_operation_sequences(['init', 'create', 'terminate'])
+
+        self.assertIs(sequences['init'], init_plan)
+        self.assertEqual([step.name for step in sequences['create']], ['chicken'])
+        self.assertEqual(list(sequences['terminate']), [])
+        self.assertIs(pm.get_operation_sequence('create'), sequences['create'])
+        self.assertEqual(dynamic.probed, ['init', 'create', 'terminate'])
+
+    def test_concurrent_plan_build(self):
+        plugin = _ReentrantPlugin()
+        pm = PluginManagerImpl([plugin])
+        snapshot = pm.snapshot
+
+        plugin.build_inner = lambda: snapshot.get_plan('init', Mock())
+        plan = snapshot.get_plan('init', Mock())
+
+        self.assertIs(plan, plugin.inner)
+        self.assertIs(pm.get_operation_sequence('init'), plan)
+
+        plugin.build_inner = lambda: snapshot.get_plans(['create'], Mock())['create']
+        plans = snapshot.get_plans(['create'], Mock())
+
+        self.assertIs(plans['create'], plugin.inner)
+
+    def test_get_operation_sequences_snapshot_replaced(self):
+        plugin = _ReentrantPlugin()
+        pm = PluginManagerImpl([plugin])
+
+        plugin.build_inner = lambda: pm.add_plugins([_TestPlugin1()])
+        sequences = pm.get_operation_sequences(['init'])
+
+        self.assertTrue(sequences['init'].stale)
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['reentrant.init', '_TestPlugin1.init'],
+        )
+
+    def test_plan_reused(self):
+        plugins = [_TestPlugin1(), _TestPlugin2()]
+        pm = PluginManagerImpl(plugins)
+
+        plan = pm.get_operation_sequence('init')
+
+        self.assertIs(pm.get_operation_sequence('init'), plan)
+        self.assertEqual(len(plan), 2)
+
+    def test_plan_rebuilt_on_drop(self):
+        container = _ContainerPlugin()
+        container.nested.append(_TestPlugin1())
+        pm = PluginManagerImpl([container])
+
+        plan = pm.get_operation_sequence('init')
+
+        container.nested.append(_TestPlugin2())
+        pm.drop_operation_cache(plugin=container.nested[1])
+
+        new_plan = pm.get_operation_sequence('init')
+
+        self.assertIsNot(new_plan, plan)
+        self.assertEqual([step.name for step in new_plan], ['_TestPlugin1.init', '_TestPlugin2.init'])
+
+    def test_reindex_probes_only_container(self):
+        other, container = _TestPlugin1(), _ContainerPlugin()
+        other.get_operation_steps = Mock(wraps=other.get_operation_steps)
+        pm = PluginManagerImpl([other, container])
+
+        # Плагин появляется внутри контейнера, ранее не добавлявшего шаги в операцию
+        container.nested.append(_TestPlugin2())
+        pm.drop_operation_cache(plugin=container.nested[0])
+
+        other.get_operation_steps.assert_not_called()
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin1.init', '_TestPlugin2.init'],
+        )
+
+    def test_index_skips_listable_plugins(self):
+        plugin = _TestPlugin1()
+        plugin.get_operation_steps = Mock(wraps=plugin.get_operation_steps)
+        pm = PluginManagerImpl([plugin])
+
+        self.assertEqual(list(pm.get_operation_sequence('terminate')), [])
+        plugin.get_operation_steps.assert_not_called()
+
+        self.assertEqual(len(pm.get_operation_sequence('init')), 1)
+        plugin.get_operation_steps.assert_called_once_with('init')
+
+    def test_index_probes_unlistable_plugins(self):
+        dynamic = _DynamicPlugin()
+        plugins = [_TestPlugin1(), dynamic, _TestPlugin2()]
+        pm = PluginManagerImpl(plugins)
+
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin1.init', 'dynamic.init', '_TestPlugin2.init'],
+        )
+        self.assertEqual(list(pm.get_operation_sequence('terminate')), [])
+        self.assertEqual(dynamic.probed, ['init', 'terminate'])
+
+    def test_add_plugins(self):
+        plugin1, plugin2 = _TestPlugin1(), _TestPlugin2()
+        pm = PluginManagerImpl([plugin1])
+        snapshot = pm.snapshot
+        plan = pm.get_operation_sequence('init')
+
+        new_snapshot = pm.add_plugins([plugin2])
+
+        self.assertIs(pm.snapshot, new_snapshot)
+        self.assertEqual(new_snapshot.version, snapshot.version + 1)
+        self.assertEqual(pm.plugins, (plugin1, plugin2))
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin1.init', '_TestPlugin2.init'],
+        )
+
+        # Старый снимок не изменяется
+        self.assertEqual(snapshot.plugins, (plugin1,))
+        self.assertIs(snapshot.get_plan('init', Mock()), plan)
+
+    def test_remove_plugins(self):
+        plugin1, plugin2, plugin3 = _TestPlugin1(), _TestPlugin2(), _ChickenPlugin()
+        pm = PluginManagerImpl([plugin1, plugin2, plugin3])
+        create_plan = pm.get_operation_sequence('create')
+
+        pm.remove_plugins([plugin1])
+
+        self.assertEqual(pm.plugins, (plugin2, plugin3))
+        self.assertEqual([step.name for step in pm.get_operation_sequence('init')], ['_TestPlugin2.init'])
+        # План операции, не затронутой удалённым плагином, переиспользуется
+        self.assertIs(pm.get_operation_sequence('create'), create_plan)
+
+    def test_add_plugins_splices_plan(self):
+        pm = PluginManagerImpl([_TestPlugin1(), _TestPlugin2()])
+        pm.get_operation_sequence('init')
+
+        pm.add_plugins([_TestPlugin3()])
+
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin3.init', '_TestPlugin1.init', '_TestPlugin2.init'],
+        )
+
+    def test_add_plugins_with_cycle(self):
+        pm = PluginManagerImpl([_ChickenPlugin()])
+        pm.get_operation_sequence('create')
+
+        pm.add_plugins([_EggPlugin()])
+
+        with self.assertRaises(DependencyCycleException):
+            pm.get_operation_sequence('create')
+
+    def test_add_unlistable_plugin(self):
+        pm = PluginManagerImpl([_TestPlugin1()])
+        pm.get_operation_sequence('init')
+
+        pm.add_plugins([_DynamicPlugin()])
+
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin1.init', 'dynamic.init'],
+        )
+
+    def test_add_unlistable_plugin_keeps_unrelated_cache(self):
+        pm = PluginManagerImpl([_TestPlugin1(), _ChickenPlugin()])
+        create_plan = pm.get_operation_sequence('create')
+        init_value = pm.operation_cache('init', 'key', object)
+        create_value = pm.operation_cache('create', 'key', object)
+
+        pm.add_plugins([_DynamicPlugin()])
+
+        self.assertIs(pm.get_operation_sequence('create'), create_plan)
+        self.assertIs(pm.operation_cache('create', 'key', object), create_value)
+        self.assertIsNot(pm.operation_cache('init', 'key', object), init_value)
+
+    def test_drop_unlistable_nested_plugin(self):
+        container = _ContainerPlugin()
+        container.nested.append(_TestPlugin1())
+        pm = PluginManagerImpl([container, _ChickenPlugin()])
+        init_plan = pm.get_operation_sequence('init')
+        create_plan = pm.get_operation_sequence('create')
+        init_value = pm.operation_cache('init', 'key', object)
+        create_value = pm.operation_cache('create', 'key', object)
+
+        dynamic = _DynamicPlugin()
+        container.nested.append(dynamic)
+        pm.drop_operation_cache(plugin=dynamic)
+
+        # Операции, в которых плагин не участвует, не затронуты
+        self.assertIs(pm.get_operation_sequence('create'), create_plan)
+        self.assertIs(pm.operation_cache('create', 'key', object), create_value)
+
+        self.assertIsNot(pm.get_operation_sequence('init'), init_plan)
+        self.assertEqual(
+            [step.name for step in pm.get_operation_sequence('init')],
+            ['_TestPlugin1.init', 'dynamic.init'],
+        )
+        self.assertIsNot(pm.operation_cache('init', 'key', object), init_value)
+
+        # Контейнер стал неперечислимым, так что опрашивается для новых операций
+        self.assertEqual(list(pm.get_operation_sequence('terminate')), [])
+        self.assertIn('terminate', dynamic.probed)
+
+        container.nested.remove(dynamic)
+        pm.drop_operation_cache(plugin=dynamic)
+
+        self.assertIs(pm.get_operation_sequence('create'), create_plan)
+        self.assertEqual([step.name for step in pm.get_operation_sequence('init')], ['_TestPlugin1.init'])
+
+    def test_stats(self):
+        plugin1, plugin2 = _TestPlugin1(), _TestPlugin2()
+        pm = PluginManagerImpl([plugin1], collect_stats=True)
+
+        pm.get_operation_sequence('init')
+        pm.get_operation_sequence('init')
+        pm.operation_cache('init', 'key', object)
+        pm.operation_cache('init', 'key', object)
+        pm.add_plugins([plugin2])
+        pm.drop_operation_cache(operations=['init'])
+        pm.get_operation_sequences(['init', 'create'])
+
+        stats = pm.get_stats()
+
+        self.assertEqual(stats['init'].plan_builds, 2)
+        self.assertGreater(stats['init'].plan_build_time, 0)
+        self.assertEqual(stats['init'].cache_hits, 1)
+        self.assertEqual(stats['init'].cache_misses, 1)
+        self.assertEqual(stats['init'].cache_hit_ratio, 0.5)
+        self.assertEqual(stats['init'].invalidations, {'plugins_added': 1, 'operation_dropped': 1})
+        self.assertEqual(stats['create'].plan_builds, 1)
+
+        pm.drop_operation_cache()
+
+        self.assertEqual(pm.get_stats()['init'].invalidations['full_drop'], 1)
+        # Возвращается копия статистики
+        self.assertEqual(stats['init'].invalidations, {'plugins_added': 1, 'operation_dropped': 1})
+
+    def test_drop_keys(self):
+        pm = PluginManagerImpl([_TestPlugin1()], collect_stats=True)
+        plan = pm.get_operation_sequence('init')
+        value1, value2 = pm.operation_cache('init', 'key1', object), pm.operation_cache('init', 'key2', object)
+
+        pm.drop_operation_cache(keys=['key1'])
+
+        # Сбрасываются только значения с заданными ключами, план операции остаётся актуальным
+        self.assertIsNot(pm.operation_cache('init', 'key1', object), value1)
+        self.assertIs(pm.operation_cache('init', 'key2', object), value2)
+        self.assertFalse(plan.stale)
+        self.assertIs(pm.get_operation_sequence('init'), plan)
+        self.assertEqual(pm.get_stats()['init'].plan_builds, 1)
+
+    def test_stats_disabled(self):
+        pm = PluginManagerImpl([_TestPlugin1()])
+        pm.get_operation_sequence('init')
+
+        self.assertIsNone(pm.get_stats())
+
     def test_current(self):
         pm, pm2 = PluginManagerImpl([]), PluginManagerImpl([])
         self.assertIs(PluginManager.current_maybe(), None)
@@ -143,6 +465,21 @@ class PluginManagerTest(unittest.TestCase):
 
 
 class PluginManagerTestAsync(IsolatedAsyncioTestCase):
+    async def test_aoperation_cache(self):
+        pm = PluginManagerImpl([])
+
+        async def compute(foo):
+            return {foo: "bar"}
+
+        val1 = await pm.aoperation_cache("test", 1, compute, "f00")
+
+        self.assertIs(await pm.aoperation_cache("test", 1, compute, "f00"), val1)
+        self.assertIs(pm.operation_cache("test", 1, lambda: None), val1)
+
+        pm.drop_operation_cache(operations=["test"])
+
+        self.assertIsNot(await pm.aoperation_cache("test", 1, compute, "f00"), val1)
+
     async def test_current_async(self):
         b = asyncio.Barrier(2)
         pm, pm1, pm2 = PluginManagerImpl([]), PluginManagerImpl([]), PluginManagerImpl([])
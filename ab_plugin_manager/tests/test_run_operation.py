@@ -0,0 +1,773 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from functools import partial
+from typing import Annotated, Callable
+from unittest.mock import Mock, patch
+
+from ab_plugin_manager.abc import OperationStep
+from ab_plugin_manager.magic_operation import CallAllAsyncConcurrentOperation, CallAllOperation, FirstResultOperation, \
+    PipelineOperation
+from ab_plugin_manager.magic_plugin import MagicPlugin, priority, StepPriority, cpu_bound, after
+from ab_plugin_manager.plugin_manager import PluginManagerImpl
+from ab_plugin_manager.process_executor import use_process_executor, LazyProcessPoolExecutor
+from ab_plugin_manager.run_operation import call_all_scheduled_async, SchedulerPolicy, call_all_parallel_async, \
+    gather_steps, call_until_first_result_async, call_until_fastest_result_async, call_all_as_pipeline_async, \
+    call_all_as_concurrent_pipeline_async
+
+
+class ParallelRunTest(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def _step(name: str, *dependencies: str, fn=None) -> OperationStep:
+        async def default_fn():
+            await asyncio.sleep(0)
+
+        return OperationStep(fn or default_fn, name, Mock(), dependencies)
+
+    async def test_tasks_created_when_ready(self):
+        tasks_before = len(asyncio.all_tasks())
+        running: list[int] = []
+
+        async def count_tasks():
+            running.append(len(asyncio.all_tasks()) - tasks_before)
+            await asyncio.sleep(0)
+
+        futures = await call_all_parallel_async([
+            self._step('a', fn=count_tasks),
+            self._step('b', 'a', fn=count_tasks),
+            self._step('c', 'b', fn=count_tasks),
+        ])
+
+        self.assertEqual([future.get_name() for future in futures], ['a', 'b', 'c'])
+        await asyncio.gather(*futures)
+        self.assertEqual(running, [1, 1, 1])
+
+    async def test_error_propagation(self):
+        async def fail():
+            raise ValueError('fail')
+
+        futures = await call_all_parallel_async([
+            self._step('a', fn=fail),
+            self._step('b', 'a'),
+            self._step('c'),
+        ])
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        self.assertIsInstance(results[0], ValueError)
+        self.assertIs(results[1], results[0])
+        self.assertIsNone(results[2])
+
+    async def test_cancel(self):
+        started = asyncio.Event()
+        finished: list[str] = []
+
+        async def slow():
+            started.set()
+
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # Шаг подавляет отмену, но его Future всё равно завершается отменённым
+                return 'suppressed'
+            finally:
+                finished.append('slow')
+
+        futures = await call_all_parallel_async([self._step('a', fn=slow), self._step('b', 'a'), self._step('c', 'b')])
+        await started.wait()
+
+        futures[2].cancel()
+        self.assertTrue(futures[2].cancelled())
+
+        self.assertTrue(futures[0].cancel())
+        self.assertFalse(futures[0].done())
+
+        await asyncio.gather(*futures, return_exceptions=True)
+
+        self.assertEqual(finished, ['slow'])
+        self.assertEqual([future.cancelled() for future in futures], [True, True, True])
+
+    async def test_duplicate_names(self):
+        calls: list[str] = []
+
+        def fn():
+            calls.append('called')
+
+        steps = [self._step('a', fn=fn), self._step('b', fn=fn), self._step('a', fn=fn)]
+
+        with self.assertRaisesRegex(ValueError, 'Повторяющиеся имена шагов: a'):
+            await call_all_parallel_async(steps)
+
+        with self.assertRaises(ValueError):
+            await call_all_scheduled_async(steps, SchedulerPolicy(max_concurrency=1))
+
+        self.assertEqual(calls, [])
+
+    async def test_sync_chain(self):
+        calls: list[str] = []
+
+        def sync_step(name: str):
+            def fn():
+                calls.append(name)
+
+            return fn
+
+        with patch('asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            futures = await call_all_parallel_async([
+                self._step('a', fn=sync_step('a')),
+                self._step('b', 'a', fn=sync_step('b')),
+                self._step('c', 'b', fn=sync_step('c')),
+                self._step('d', 'c'),
+                self._step('e', 'a', fn=sync_step('e')),
+            ])
+            await asyncio.gather(*futures)
+
+        # 'a' не входит в цепочку, т.к. от него зависят два шага
+        self.assertEqual(to_thread.call_count, 3)
+        self.assertEqual(calls[0], 'a')
+        self.assertLess(calls.index('b'), calls.index('c'))
+        self.assertTrue(all(future.done() for future in futures))
+
+    async def test_sync_chain_error(self):
+        calls: list[str] = []
+
+        def ok():
+            calls.append('ok')
+
+        def fail():
+            raise ValueError('fail')
+
+        futures = await call_all_parallel_async([
+            self._step('a', fn=ok),
+            self._step('b', 'a', fn=fail),
+            self._step('c', 'b', fn=ok),
+            self._step('d', 'c'),
+        ])
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        self.assertEqual(calls, ['ok'])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2:], [results[1], results[1]])
+
+    async def test_sync_chain_cancel(self):
+        calls: list[str] = []
+        started, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+
+        def first():
+            started.set()
+            release.wait()
+            calls.append('a')
+            return 'a'
+
+        def sync_step(name: str):
+            def fn():
+                calls.append(name)
+
+            return fn
+
+        futures = await call_all_parallel_async([
+            self._step('a', fn=first),
+            self._step('b', 'a', fn=sync_step('b')),
+            self._step('c', 'b', fn=sync_step('c')),
+        ])
+        await asyncio.to_thread(started.wait)
+
+        # Отменяется только шаг 'b' и следующий за ним шаг цепочки, выполняющийся шаг 'a' продолжает выполняться
+        self.assertTrue(futures[1].cancel())
+        self.assertEqual([future.cancelled() for future in futures], [False, True, True])
+
+        release.set()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(futures[0].result(), 'a')
+
+    async def test_sync_chain_context(self):
+        var: contextvars.ContextVar[str] = contextvars.ContextVar('var', default='initial')
+        seen: list[str] = []
+
+        def set_var():
+            seen.append(var.get())
+            var.set('changed')
+
+        futures = await call_all_parallel_async([
+            self._step('a', fn=set_var),
+            self._step('b', 'a', fn=set_var),
+            self._step('c', 'b', fn=set_var),
+        ])
+        await asyncio.gather(*futures)
+
+        # Как и отдельно выполняемые шаги, шаги цепочки не видят изменений контекста, сделанных предыдущими шагами
+        self.assertEqual(seen, ['initial', 'initial', 'initial'])
+        self.assertEqual(var.get(), 'initial')
+
+    async def test_long_chain(self):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+        self.addCleanup(asyncio.get_running_loop().set_task_factory, None)
+
+        calls: list[int] = []
+
+        async def step():
+            calls.append(len(calls))
+
+        steps = [self._step('s0', fn=step)]
+        steps.extend(self._step(f's{i}', f's{i - 1}', fn=step) for i in range(1, 500))
+
+        await asyncio.gather(*await call_all_parallel_async(steps))
+
+        self.assertEqual(calls, list(range(500)))
+
+
+class FirstResultTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cancelled: list[str] = []
+
+    def _step(self, name: str, delay: float, result):
+        async def fn():
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.cancelled.append(name)
+                raise
+
+            if isinstance(result, Exception):
+                raise result
+
+            return result
+
+        return OperationStep(fn, name, Mock())
+
+    async def test_first_result(self):
+        steps = [self._step('none', 0, None), self._step('slow', 0.05, 'slow'), self._step('fast', 0, 'fast')]
+
+        self.assertEqual(await call_until_first_result_async(steps), 'slow')
+        self.assertEqual(self.cancelled, [])
+
+        self.assertEqual(await call_until_fastest_result_async(steps), 'fast')
+        self.assertEqual(self.cancelled, ['slow'])
+
+    async def test_error(self):
+        steps = [self._step('fail', 0.01, ValueError('fail')), self._step('fast', 0, 'fast')]
+
+        with self.assertRaises(ValueError):
+            await call_until_first_result_async(steps)
+
+        self.assertEqual(await call_until_fastest_result_async(steps), 'fast')
+        self.assertEqual(self.cancelled, ['fail'])
+
+    async def test_racing_error(self):
+        # Ошибка более быстрого шага не мешает получить результат более медленного
+        steps = [self._step('fail', 0, LookupError('fail')), self._step('slow', 0.01, 'slow')]
+
+        self.assertEqual(await call_until_fastest_result_async(steps), 'slow')
+        self.assertEqual(self.cancelled, [])
+
+        steps = [
+            self._step('none', 0.01, None),
+            self._step('fail', 0, LookupError('first')),
+            self._step('late', 0.02, ValueError('late')),
+        ]
+
+        with self.assertRaisesRegex(LookupError, 'first'):
+            await call_until_fastest_result_async(steps)
+
+    async def test_no_result(self):
+        self.assertIsNone(await call_until_first_result_async([self._step('none', 0, None)]))
+        self.assertIsNone(await call_until_fastest_result_async([]))
+
+    async def test_dependencies(self):
+        events: list[str] = []
+
+        async def dependency():
+            events.append('dependency started')
+            await asyncio.sleep(0.01)
+            events.append('dependency finished')
+
+        async def dependent():
+            events.append('dependent started')
+            return 'dependent'
+
+        steps = [
+            OperationStep(dependency, 'dependency', Mock()),
+            OperationStep(dependent, 'dependent', Mock(), ('dependency',)),
+        ]
+
+        self.assertEqual(await call_until_fastest_result_async(steps), 'dependent')
+        self.assertEqual(events, ['dependency started', 'dependency finished', 'dependent started'])
+
+        events.clear()
+        self.assertEqual(await call_until_first_result_async(steps), 'dependent')
+        self.assertEqual(events, ['dependency started', 'dependency finished', 'dependent started'])
+
+    async def test_operation(self):
+        op = FirstResultOperation[str]("op")
+        racing_op = FirstResultOperation[str]("op", racing=True)
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def slow(self):
+                await asyncio.sleep(0.05)
+                return 'slow'
+
+        class Plugin2(MagicPlugin):
+            @op.implementation
+            def fast(self):
+                return 'fast'
+
+        with PluginManagerImpl([Plugin1(), Plugin2()]).as_current():
+            self.assertEqual(await op.ainvoke(), 'slow')
+            self.assertEqual(await racing_op.ainvoke(), 'fast')
+
+
+class PipelineTest(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def _stage(name: str, fn) -> OperationStep:
+        async def stage(items, factor):
+            async for item in items:
+                yield fn(item, factor)
+
+        return OperationStep(stage, name, Mock())
+
+    async def test_pipeline(self):
+        steps = [self._stage('add', lambda x, f: x + f), self._stage('mul', lambda x, f: x * f)]
+
+        self.assertEqual([item async for item in call_all_as_pipeline_async(steps, [1, 2, 3], 10)], [110, 120, 130])
+        self.assertEqual(
+            [item async for item in call_all_as_concurrent_pipeline_async(steps, [1, 2, 3], 1, 10)],
+            [110, 120, 130],
+        )
+
+    async def test_backpressure(self):
+        produced: list[int] = []
+        release = asyncio.Event()
+
+        async def source():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        async def slow(items, _factor):
+            async for item in items:
+                await release.wait()
+                yield item
+
+        steps = [self._stage('copy', lambda x, f: x), OperationStep(slow, 'slow', Mock())]
+
+        async with aclosing(call_all_as_concurrent_pipeline_async(steps, source(), 2, 0)) as items:
+            task = asyncio.create_task(anext(items))
+            await asyncio.sleep(0.01)
+
+            # Элемент, обрабатываемый каждым шагом, и элементы в очереди между шагами
+            self.assertLessEqual(len(produced), 6)
+
+            release.set()
+            self.assertEqual(await task, 0)
+
+    async def test_concurrent_pipeline_error(self):
+        closed = asyncio.Event()
+
+        def fail(x, _factor):
+            if x == 2:
+                raise ValueError()
+
+            return x
+
+        async def endless(items, _factor):
+            try:
+                async for item in items:
+                    yield item
+            finally:
+                closed.set()
+
+        steps = [self._stage('fail', fail), OperationStep(endless, 'endless', Mock())]
+        results = []
+
+        with self.assertRaises(ValueError):
+            async for item in call_all_as_concurrent_pipeline_async(steps, range(10), 1, 0):
+                results.append(item)
+
+        self.assertEqual(results, [0, 1])
+        self.assertTrue(closed.is_set())
+
+    async def test_not_a_generator(self):
+        steps = [OperationStep(lambda items: None, 'bad', Mock())]
+
+        with self.assertRaises(TypeError):
+            await anext(call_all_as_pipeline_async(steps, []))
+
+    async def test_operation(self):
+        op = PipelineOperation[int, int]("op", queue_size=4)
+        collected: list[int] = []
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def double(self, items):
+                async for item in items:
+                    yield item * 2
+
+            @after('Plugin1.double')
+            @op.implementation
+            async def collect(self, items):
+                async for item in items:
+                    collected.append(item)
+                    yield item
+
+        with PluginManagerImpl([Plugin1()]).as_current():
+            await op.arun(range(3))
+
+        self.assertEqual(collected, [0, 2, 4])
+
+
+class ScheduledRunTest(unittest.IsolatedAsyncioTestCase):
+    async def test_priority_order(self):
+        started: list[str] = []
+
+        def step(name: str, step_priority: int, *dependencies: str) -> OperationStep:
+            async def fn():
+                started.append(name)
+                await asyncio.sleep(0)
+
+            return OperationStep(fn, name, Mock(), dependencies, annotation=StepPriority(step_priority))
+
+        tasks = await call_all_scheduled_async(
+            [step('low', 0), step('high', 10), step('after_low', 20, 'low'), step('mid', 5)],
+            SchedulerPolicy(max_concurrency=1),
+        )
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(started, ['high', 'mid', 'low', 'after_low'])
+        self.assertEqual([task.get_name() for task in tasks], ['low', 'high', 'after_low', 'mid'])
+
+    async def test_limits(self):
+        running = {'sync': 0, 'async': 0}
+        peak = {'sync': 0, 'async': 0}
+        lock = asyncio.Lock()
+
+        async def enter(kind: str):
+            async with lock:
+                running[kind] += 1
+                peak[kind] = max(peak[kind], running[kind])
+
+        async def leave(kind: str):
+            async with lock:
+                running[kind] -= 1
+
+        async def async_step():
+            await enter('async')
+            await asyncio.sleep(0.01)
+            await leave('async')
+
+        loop = asyncio.get_running_loop()
+
+        def sync_step():
+            asyncio.run_coroutine_threadsafe(enter('sync'), loop).result()
+            asyncio.run_coroutine_threadsafe(leave('sync'), loop).result()
+
+        steps = [
+            *(OperationStep(async_step, f'async{i}', Mock()) for i in range(6)),
+            *(OperationStep(sync_step, f'sync{i}', Mock()) for i in range(6)),
+        ]
+
+        await asyncio.gather(*await call_all_scheduled_async(steps, SchedulerPolicy(max_threads=1, max_async=2)))
+
+        self.assertEqual(peak, {'sync': 1, 'async': 2})
+
+    async def test_operation_with_policy(self):
+        started: list[str] = []
+        op = CallAllAsyncConcurrentOperation("op", policy=SchedulerPolicy(max_concurrency=1))
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def first(self):
+                started.append('first')
+
+            @priority(1)
+            @op.implementation
+            async def second(self):
+                started.append('second')
+
+            third: Annotated[Callable, StepPriority(2)]
+
+            @op.implementation
+            async def third(self):
+                started.append('third')
+
+        with PluginManagerImpl([Plugin1()]).as_current():
+            await asyncio.gather(*await op())
+
+        self.assertEqual(started, ['third', 'second', 'first'])
+
+    async def test_fail_fast_sync_chain(self):
+        calls: list[str] = []
+        started, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+
+        def step(name: str, fn, *dependencies: str) -> OperationStep:
+            return OperationStep(fn, name, Mock(), dependencies)
+
+        def record(name: str):
+            def fn():
+                calls.append(name)
+
+            return fn
+
+        def fail_sync():
+            raise ValueError('fail')
+
+        def slow():
+            started.set()
+            release.wait()
+            calls.append('slow')
+
+        async def fail_async():
+            await asyncio.to_thread(started.wait)
+            raise ValueError('fail')
+
+        # Шаг, зависящий от шага с ошибкой, в той же цепочке синхронных шагов
+        futures = await call_all_scheduled_async(
+            [step('fail', fail_sync), step('dependent', record('dependent'), 'fail')],
+            SchedulerPolicy(fail_fast=SchedulerPolicy.FAIL_FAST_DEPENDENTS),
+        )
+
+        with self.assertRaises(ExceptionGroup):
+            await gather_steps(futures)
+
+        self.assertTrue(futures[1].cancelled())
+        self.assertEqual(calls, [])
+
+        # Шаги выполняющейся цепочки, которые ещё не вызваны, не выполняются при ошибке в другом шаге
+        futures = await call_all_scheduled_async(
+            [step('slow', slow), step('after_slow', record('after_slow'), 'slow'), step('fail', fail_async)],
+            SchedulerPolicy(fail_fast=SchedulerPolicy.FAIL_FAST_ALL),
+        )
+        await asyncio.wait([futures[2]])
+        self.assertTrue(futures[1].cancelled())
+
+        release.set()
+
+        with self.assertRaises(ExceptionGroup):
+            await gather_steps(futures)
+
+        # Ждём завершения задания цепочки, что бы убедиться, что следующий шаг не был вызван
+        await futures[0]._task
+        self.assertEqual(calls, ['slow'])
+
+    async def test_fail_fast(self):
+        started = asyncio.Event()
+        finished: list[str] = []
+
+        async def fail():
+            await started.wait()
+            raise ValueError('fail')
+
+        async def slow():
+            started.set()
+
+            try:
+                await asyncio.sleep(10)
+            finally:
+                finished.append('slow')
+
+        def step(name: str, fn, *dependencies: str) -> OperationStep:
+            return OperationStep(fn, name, Mock(), dependencies)
+
+        async def noop():
+            finished.append('noop')
+
+        steps = [
+            step('fail', fail), step('dependent', noop, 'fail'), step('slow', slow), step('after_slow', noop, 'slow'),
+        ]
+
+        futures = await call_all_scheduled_async(steps, SchedulerPolicy(fail_fast=SchedulerPolicy.FAIL_FAST_DEPENDENTS))
+        await started.wait()
+        futures[2].cancel()
+
+        with self.assertRaises(ExceptionGroup) as ctx:
+            await gather_steps(futures)
+
+        self.assertEqual([type(e) for e in ctx.exception.exceptions], [ValueError])
+        self.assertTrue(futures[1].cancelled())
+        # Отмена выполняющегося шага отменяет и зависимые шаги
+        self.assertEqual([future.cancelled() for future in futures[2:]], [True, True])
+        self.assertEqual(finished, ['slow'])
+
+        finished.clear()
+        started.clear()
+        futures = await call_all_scheduled_async(steps, SchedulerPolicy(fail_fast=SchedulerPolicy.FAIL_FAST_ALL))
+
+        with self.assertRaises(ExceptionGroup) as ctx:
+            await gather_steps(futures)
+
+        self.assertEqual([type(e) for e in ctx.exception.exceptions], [ValueError])
+        self.assertEqual([future.cancelled() for future in futures], [False, True, True, True])
+        self.assertEqual(finished, ['slow'])
+
+    async def test_critical_path_order(self):
+        started: list[str] = []
+
+        def step(name: str, *dependencies: str) -> OperationStep:
+            async def fn():
+                started.append(name)
+                await asyncio.sleep(0)
+
+            return OperationStep(fn, name, Mock(), dependencies)
+
+        steps = [step('short'), step('head'), step('tail1', 'head'), step('tail2', 'tail1')]
+        policy = SchedulerPolicy(max_concurrency=1, step_durations={'short': 3.0, 'head': 1.0, 'tail1': 1.0})
+
+        await asyncio.gather(*await call_all_scheduled_async(steps, SchedulerPolicy(max_concurrency=1)))
+        self.assertEqual(started, ['short', 'head', 'tail1', 'tail2'])
+
+        started.clear()
+        # Для 'tail2' используется среднее время известных шагов, так что путь 'head' длиннее
+        await asyncio.gather(*await call_all_scheduled_async(steps, policy))
+        self.assertEqual(started, ['head', 'short', 'tail1', 'tail2'])
+
+    async def test_critical_path_unordered_steps(self):
+        started: list[str] = []
+
+        def step(name: str, *dependencies: str) -> OperationStep:
+            async def fn():
+                started.append(name)
+                await asyncio.sleep(0)
+
+            return OperationStep(fn, name, Mock(), dependencies)
+
+        steps = [step('tail2', 'tail1'), step('tail1', 'head'), step('short'), step('head')]
+        policy = SchedulerPolicy(max_concurrency=1, step_durations={'short': 3.0, 'head': 1.0, 'tail1': 1.0})
+
+        await asyncio.gather(*await call_all_scheduled_async(steps, policy))
+        self.assertEqual(started, ['head', 'short', 'tail1', 'tail2'])
+
+    async def test_recorded_durations(self):
+        op = CallAllAsyncConcurrentOperation("op", policy=SchedulerPolicy())
+
+        class Plugin1(MagicPlugin):
+            @op.implementation
+            async def slow(self):
+                await asyncio.sleep(0.02)
+
+        pm = PluginManagerImpl([Plugin1()])
+
+        with pm.as_current():
+            await asyncio.gather(*await op())
+
+        durations = pm.get_step_durations('op')
+        self.assertEqual(list(durations), ['Plugin1.slow'])
+        self.assertGreaterEqual(durations['Plugin1.slow'], 0.02)
+
+
+_cpu_op = CallAllOperation("cpu_op")
+
+
+class _CpuBoundPlugin(MagicPlugin):
+    """
+    Плагин, объявленный на уровне модуля, что бы его шаги могли быть переданы в пул процессов.
+    """
+
+    @cpu_bound
+    @_cpu_op.implementation
+    def heavy(self):
+        return os.getpid()
+
+    @_cpu_op.implementation
+    def light(self):
+        return os.getpid()
+
+
+class _RecordingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submitted = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.submitted.append(fn.func if isinstance(fn, partial) else fn)
+        return super().submit(fn, *args, **kwargs)
+
+
+class ProcessExecutorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cpu_bound_steps(self):
+        executor = _RecordingExecutor()
+        self.addCleanup(executor.shutdown)
+
+        plugin = _CpuBoundPlugin()
+
+        with PluginManagerImpl([plugin]).as_current():
+            steps = _cpu_op.get_steps()
+            self.assertEqual(
+                {call.step.name: call.cpu_bound for call in _cpu_op.get_compiled_steps().calls},
+                {'_CpuBoundPlugin.heavy': True, '_CpuBoundPlugin.light': False},
+            )
+
+            # Без пула процессов все шаги выполняются в потоках
+            await asyncio.gather(*await call_all_parallel_async(steps))
+            await _cpu_op.ainvoke()
+            self.assertEqual(executor.submitted, [])
+
+            with use_process_executor(executor):
+                await asyncio.gather(*await call_all_parallel_async(steps))
+                await _cpu_op.ainvoke()
+
+        self.assertEqual(executor.submitted, [plugin.heavy, plugin.heavy])
+
+    async def test_process_pool(self):
+        executor = LazyProcessPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        with use_process_executor(executor):
+            futures = await call_all_parallel_async(
+                PluginManagerImpl([_CpuBoundPlugin()]).get_operation_sequence('cpu_op'),
+            )
+            pids = {future.get_name(): await future for future in futures}
+
+        self.assertNotEqual(pids['_CpuBoundPlugin.heavy'], os.getpid())
+        self.assertEqual(pids['_CpuBoundPlugin.light'], os.getpid())
+
+    async def test_unpicklable_step(self):
+        class LocalPlugin(MagicPlugin):
+            @cpu_bound
+            def heavy(self):
+                return os.getpid()
+
+        executor = LazyProcessPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        steps = PluginManagerImpl([LocalPlugin()]).get_operation_sequence('heavy')
+
+        with use_process_executor(executor), self.assertLogs('run_operation', 'WARNING') as logs:
+            (future,) = await call_all_parallel_async(steps)
+
+            # Шаг, который не удаётся передать в пул процессов, выполняется в пуле потоков
+            self.assertEqual(await future, os.getpid())
+
+        self.assertFalse(executor.started)
+        self.assertIn('LocalPlugin.heavy', logs.output[0])
+
+    def test_lazy_process_pool(self):
+        executor = LazyProcessPoolExecutor(max_workers=1)
+        self.assertFalse(executor.started)
+
+        try:
+            self.assertNotEqual(executor.submit(os.getpid).result(), os.getpid())
+            self.assertTrue(executor.started)
+        finally:
+            executor.shutdown()
+
+        with self.assertRaises(RuntimeError):
+            executor.submit(os.getpid)
+
+    def test_process_pool_start_method(self):
+        # Процессы не должны порождаться через fork, т.к. в процессе приложения уже работают потоки
+        self.assertNotEqual(LazyProcessPoolExecutor()._mp_context.get_start_method(), 'fork')
+
+        spawn = multiprocessing.get_context('spawn')
+        self.assertIs(LazyProcessPoolExecutor(mp_context=spawn)._mp_context, spawn)
+
+
+if __name__ == '__main__':
+    unittest.main()